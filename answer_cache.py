@@ -0,0 +1,152 @@
+import json
+import threading
+import time
+
+import numpy as np
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from config import (
+    ANSWER_CACHE_PATH,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_MAX_ENTRIES,
+)
+from sqlite_store import connect
+
+
+# Persistent answer cache keyed on question embedding similarity. Entries are scoped to
+# the LLMs that may have produced them and the index version they were retrieved from,
+# expire after a TTL and are evicted least-recently-used beyond a size limit. The SQLite
+# file is shared by every session and process; each process keeps the embeddings of the
+# scopes it has looked up in memory and reloads them when the table changes. Each answer
+# is stored with the text, metadata and score of the source nodes it was based on.
+class AnswerCache:
+    def __init__(self, path=ANSWER_CACHE_PATH, threshold=ANSWER_CACHE_THRESHOLD,
+                 ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._matrices = {}
+        self._expired_at = 0.0
+        self._conn = connect(path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, llm TEXT NOT NULL, index_version TEXT NOT NULL, "
+                "question TEXT NOT NULL, embedding BLOB NOT NULL, answer TEXT NOT NULL, "
+                "created_at REAL NOT NULL, last_used REAL NOT NULL, sources TEXT NOT NULL DEFAULT '[]')"
+            )
+            # Caches written before sources were kept
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(answers)")}
+            if "sources" not in columns:
+                self._conn.execute("ALTER TABLE answers ADD COLUMN sources TEXT NOT NULL DEFAULT '[]'")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS answers_scope ON answers (llm, index_version)")
+
+    # Unit-normalized float32 vector so similarity is a dot product
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype="float32")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _scope_matrix(self, llm, index_version):
+        # Cheap change check so inserts from other processes are picked up
+        marker = self._conn.execute(
+            "SELECT MAX(id), COUNT(*) FROM answers WHERE llm = ? AND index_version = ?",
+            (llm, index_version),
+        ).fetchone()
+        cached = self._matrices.get((llm, index_version))
+        if cached and cached[0] == marker:
+            return cached[1], cached[2]
+
+        rows = self._conn.execute(
+            "SELECT id, embedding FROM answers WHERE llm = ? AND index_version = ?",
+            (llm, index_version),
+        ).fetchall()
+        ids = [row[0] for row in rows]
+        matrix = np.stack([np.frombuffer(row[1], dtype="float32") for row in rows]) if rows else None
+        self._matrices[(llm, index_version)] = (marker, ids, matrix)
+        return ids, matrix
+
+    @staticmethod
+    def _dump_sources(nodes):
+        return json.dumps(
+            [{"text": n.node.get_content(), "metadata": n.node.metadata, "score": n.score} for n in nodes],
+            default=str,
+        )
+
+    @staticmethod
+    def _load_sources(text):
+        return [
+            NodeWithScore(node=TextNode(text=source["text"], metadata=source["metadata"]), score=source["score"])
+            for source in json.loads(text)
+        ]
+
+    # Return (answer, source nodes) for the most similar question, or None on a miss
+    def lookup(self, embedding, llm, index_version):
+        now = time.time()
+        with self._lock:
+            # Drop expired entries, at most once a minute
+            if now - self._expired_at > 60:
+                with self._conn:
+                    self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,))
+                self._expired_at = now
+            ids, matrix = self._scope_matrix(llm, index_version)
+            if matrix is not None:
+                similarities = matrix @ self._normalize(embedding)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    row = self._conn.execute(
+                        "SELECT answer, sources FROM answers WHERE id = ?", (ids[best],)
+                    ).fetchone()
+                    if row:
+                        with self._conn:
+                            self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, ids[best]))
+                        self.hits += 1
+                        return row[0], self._load_sources(row[1])
+            self.misses += 1
+            return None
+
+    def store(self, question, embedding, answer, llm, index_version, sources=()):
+        now = time.time()
+        blob = self._normalize(embedding).tobytes()
+        sources = self._dump_sources(sources)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO answers (llm, index_version, question, embedding, answer, created_at, last_used, sources) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (llm, index_version, question, blob, answer, now, now, sources),
+            )
+            # Least-recently-used eviction beyond the size limit
+            self._conn.execute(
+                "DELETE FROM answers WHERE id IN ("
+                "SELECT id FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+            }
+
+
+_lock = threading.Lock()
+_cache = None
+
+
+# Process-wide cache shared by all sessions
+def get_answer_cache():
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = AnswerCache()
+        return _cache
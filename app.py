@@ -1,42 +1,24 @@
-import os
-import pickle
+import time
 import streamlit as st
-from dotenv import load_dotenv
-from PIL import Image
-import base64
-from io import BytesIO
-from functools import lru_cache
 
-from llama_index.core import Settings
-from llama_index.llms.groq import Groq
-from llama_index.llms.gemini import Gemini
-from llama_index.embeddings.gemini import GeminiEmbedding
-
-from config import SYSTEM_PROMPT, README_CONTENT
-
-# Load environment variables
-load_dotenv()
-
-# Get API keys from environment variables
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-
-# Set constants
-GROQ_MODEL = "llama-3.3-70b-versatile"
-GEMINI_MODEL = "models/gemini-2.0-flash"
-EMBEDDING_MODEL = "models/embedding-001"
+from config import (
+    README_CONTENT,
+    STREAM_RENDER_INTERVAL,
+    ANSWER_CACHE_ENABLED,
+    QUERY_MODE,
+    DEBUG_PANEL,
+    STARTUP_MODE,
+    CHAT_PAGE_SIZE,
+    CHAT_PERSIST,
+    RAG_SERVICE_URL,
+)
 
-# Helper function to convert image to base64 (cached to avoid repeated conversions)
-@lru_cache(maxsize=10)
-def image_to_base64(image_path):
-    try:
-        with Image.open(image_path) as img:
-            buffered = BytesIO()
-            img.save(buffered, format="JPEG")
-            return base64.b64encode(buffered.getvalue()).decode()
-    except Exception as e:
-        st.error(f"Error loading image: {str(e)}")
-        return None
+# Only lightweight modules are imported here; llama-index, FAISS and the provider SDKs
+# are imported by the warm-up thread or on first use
+import warmup
+from chat_store import ChatHistory, get_chat_store
+from query_service import get_query_service, friendly_error
+from static_assets import logo_img_attrs, page_style
 
 # Set page config
 st.set_page_config(
@@ -47,157 +29,90 @@ st.set_page_config(
 
 # Initialize session state variables
 if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
+    # A persisted session is resumed from its id in the URL after a restart or reload
+    if CHAT_PERSIST:
+        st.session_state.chat_history = ChatHistory(st.query_params.get("session"), store=get_chat_store())
+        st.query_params["session"] = st.session_state.chat_history.session_id
+    else:
+        st.session_state.chat_history = ChatHistory()
+if "history_shown" not in st.session_state:
+    st.session_state.history_shown = CHAT_PAGE_SIZE
+if "memory" not in st.session_state:
+    st.session_state.memory = None
 if "query_engine" not in st.session_state:
     st.session_state.query_engine = None
 if "primary_llm" not in st.session_state:
     st.session_state.primary_llm = None
 if "show_readme" not in st.session_state:
     st.session_state.show_readme = True
+if "last_trace" not in st.session_state:
+    st.session_state.last_trace = None
 
 readme_content = README_CONTENT
 
-# Custom CSS to improve UI with dark mode support
-st.markdown("""
-<style>
-    /* Dark mode aware styling */
-    .logo-container {
-        display: flex;
-        justify-content: center;
-        margin-bottom: 20px;
-    }
-    
-    .logo-image {
-        border-radius: 10px;
-        box-shadow: 0 4px 8px rgba(0, 0, 0, 0.2);
-    }
-    
-    .title-container {
-        display: flex;
-        align-items: center;
-        gap: 20px;
-        margin-bottom: 30px;
-        background-color: transparent;
-        padding: 15px 20px;
-        border-radius: 12px;
-        border: 1px solid rgba(128, 128, 128, 0.2);
-    }
-    
-    .title-text {
-        margin: 0;
-        color: inherit;
-        font-weight: 600;
-        font-size: 2.2em;
-    }
-    
-    .divider {
-        height: 1px; 
-        background: rgba(128, 128, 128, 0.3);
-        margin: 20px 0;
-    }
-    
-    .footer-container {
-        position: fixed;
-        bottom: 0;
-        left: 0;
-        width: 100%;
-        padding: 10px;
-        text-align: center;
-        font-size: 0.8em;
-        border-top: 1px solid rgba(128, 128, 128, 0.2);
-        background-color: transparent;
-        backdrop-filter: blur(10px);
-    }
-    
-    .footer-highlight {
-        font-weight: bold;
-    }
-    
-    /* Improved buttons */
-    .stButton button {
-        transition: all 0.3s ease;
-        border-radius: 8px;
-    }
-    
-    .stButton button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
-    }
-    
-    /* Quick action buttons container */
-    .quick-actions {
-        margin-bottom: 20px;
-    }
-    
-    /* Hide status indicators from main UI */
-    .status-indicator {
-        display: none;
-    }
-    
-    /* Enhance sidebar header */
-    .sidebar-header {
-        font-size: 1.5em;
-        font-weight: 600;
-        margin-bottom: 15px;
-        padding-bottom: 10px;
-        border-bottom: 1px solid rgba(128, 128, 128, 0.3);
-    }
-</style>
-""", unsafe_allow_html=True)
+# Custom CSS to improve UI with dark mode support (assets/style.css, minified once per process)
+st.markdown(page_style(), unsafe_allow_html=True)
 
-# Initialize the system automatically
-if st.session_state.query_engine is None:
-    with st.spinner("Loading vector database..."):
-        try:
-            # Load the vector database
-            with open("vector_db/full_index.pkl", "rb") as f:
-                index = pickle.load(f)
-            
-            # Initialize embedding model
-            embed_model = GeminiEmbedding(model_name=EMBEDDING_MODEL, api_key=GOOGLE_API_KEY)
-            Settings.embed_model = embed_model
-            
-            # Try to initialize Groq as primary LLM
-            try:
-                llm = Groq(api_key=GROQ_API_KEY, model=GROQ_MODEL, temperature=0.5)
-                Settings.llm = llm
-                st.session_state.primary_llm = "Groq"
-            except Exception as e:
-                st.warning(f"Groq initialization failed: {str(e)}. Falling back to Gemini.")
-                try:
-                    llm = Gemini(model=GEMINI_MODEL, api_key=GOOGLE_API_KEY, temperature=0.5)
-                    Settings.llm = llm
-                    st.session_state.primary_llm = "Gemini"
-                except Exception as e:
-                    st.error(f"Gemini initialization also failed: {str(e)}")
-                    st.session_state.primary_llm = None
-            
-            # Set up query engine if LLM is initialized
-            if st.session_state.primary_llm:
-                st.session_state.query_engine = index.as_query_engine(similarity_top_k=3)
-            else:
-                st.error("No LLM available. Please check your API keys and try again.")
-            
-        except Exception as e:
-            st.error(f"Error initializing application: {str(e)}")
+# The index and query engine are loaded once per process, on the warm-up thread while
+# the README renders (CONNECTSENSE_STARTUP=background), and shared read-only. The chat
+# view attaches this session to them; they are swapped transparently when the index
+# file changes on disk. With CONNECTSENSE_RAG_SERVICE set they live in the RAG service
+# (rag_server.py) instead and this process only holds a client.
+if STARTUP_MODE != "lazy" and not RAG_SERVICE_URL:
+    warmup.start()
+resources = None
+service_status = None
+if RAG_SERVICE_URL:
+    from rag_client import get_rag_client
+
+    first_load = st.session_state.query_engine is None
+    try:
+        service_status = get_rag_client().status()
+        if first_load:
+            for warning in service_status.get("warnings", []):
+                st.warning(warning)
+        st.session_state.primary_llm = service_status.get("primary_llm")
+        # The service client stands in for the local query engine
+        st.session_state.query_engine = get_rag_client()
+        if first_load and not st.session_state.primary_llm:
+            st.error(f"No LLM available in the RAG service: {service_status.get('error') or 'check its API keys'}.")
+    except Exception as e:
+        st.error(f"Error connecting to the RAG service: {str(e)}")
+elif STARTUP_MODE == "eager" or not st.session_state.show_readme or warmup.ready():
+    first_load = st.session_state.query_engine is None
+    try:
+        if not warmup.ready():
+            with st.spinner("Loading vector database..."):
+                resources = warmup.wait()
+        else:
+            resources = warmup.wait()
+
+        if first_load:
+            for warning in resources.warnings:
+                st.warning(warning)
+
+        st.session_state.primary_llm = resources.primary_llm
+        st.session_state.query_engine = resources.query_engine
+        if first_load and not resources.primary_llm:
+            st.error("No LLM available. Please check your API keys and try again.")
+    except Exception as e:
+        st.error(f"Error initializing application: {str(e)}")
 
 # Sidebar
 with st.sidebar:
     st.markdown('<div class="sidebar-header">ConnectSense Controls</div>', unsafe_allow_html=True)
     
     # Display logo in sidebar
-    logo_path = "assets/ConnectSense.jpg"
-    if os.path.exists(logo_path):
-        base64_image = image_to_base64(logo_path)
-        if base64_image:
-            st.markdown(
-                f"""
-                <div class="logo-container">
-                    <img src="data:image/jpeg;base64,{base64_image}" alt="ConnectSense Logo" width="180" class="logo-image">
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
+    logo = logo_img_attrs(180)
+    if logo:
+        st.markdown(
+            f"""
+            <div class="logo-container">
+                <img {logo} alt="ConnectSense Logo" class="logo-image">
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
     
     # README toggle button
     if st.button(f"{'📚 Switch to Chatbot' if st.session_state.show_readme else '📖 View README'}", use_container_width=True):
@@ -206,24 +121,109 @@ with st.sidebar:
     
     # Clear chat button in sidebar
     if st.button("🧹 Clear Conversation", use_container_width=True):
-        st.session_state.chat_history = []
+        st.session_state.chat_history.clear()
+        st.session_state.history_shown = CHAT_PAGE_SIZE
+        if st.session_state.memory is not None:
+            st.session_state.memory.reset()
         st.rerun()
 
+    # Monitoring counters shared by all sessions of this process
+    # (in service mode, those of the service worker that answered the status request)
+    with st.expander("⚙️ System Status"):
+        provider_stats_all, cache_stats, service_stats = {}, None, None
+        if RAG_SERVICE_URL:
+            worker = f"worker {service_status['pid']}" if service_status else "unreachable"
+            st.caption(f"RAG service: {RAG_SERVICE_URL} ({worker})")
+            if service_status and service_status.get("ready"):
+                provider_stats_all = service_status["providers"]
+                cache_stats = service_status["answer_cache"]
+                service_stats = service_status["query_service"]
+        else:
+            startup = warmup.status()
+            if not startup["ready"]:
+                st.caption("Loading models in the background...")
+            elif startup["load_seconds"] is not None:
+                st.caption(
+                    f"Startup: imports {startup['import_seconds']:.1f}s, "
+                    f"index and clients {startup['load_seconds']:.1f}s"
+                )
+            if resources is not None and resources.router:
+                provider_stats_all = resources.router.stats()
+            if ANSWER_CACHE_ENABLED and resources is not None:
+                from answer_cache import get_answer_cache
+
+                cache_stats = get_answer_cache().stats()
+            service_stats = get_query_service().stats()
+        st.caption(f"Preferred LLM: {st.session_state.primary_llm or 'unavailable'}")
+        for provider, provider_stats in provider_stats_all.items():
+            latency = (
+                f"p50 {provider_stats['p50']:.1f}s / p95 {provider_stats['p95']:.1f}s"
+                if provider_stats["p50"] is not None else "no samples yet"
+            )
+            st.caption(f"{provider}: {latency}, {provider_stats['failures']}/{provider_stats['requests']} failed")
+        if cache_stats is not None:
+            st.caption(
+                f"Answer cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                f"({cache_stats['hit_rate']:.0%}), {cache_stats['entries']} entries"
+            )
+        if service_stats is not None:
+            st.caption(
+                f"Query queue: {service_stats['queued']} waiting, {service_stats['in_flight']} running, "
+                f"avg wait {service_stats['avg_wait']:.1f}s"
+            )
+        if st.session_state.memory is not None:
+            memory_stats = st.session_state.memory.stats()
+            st.caption(
+                f"Conversation memory: {memory_stats['tokens']} tokens, {memory_stats['verbatim_turns']} recent turns "
+                f"+ {memory_stats['summarized_turns']} summarized"
+            )
+        history_stats = st.session_state.chat_history
+        st.caption(
+            f"Chat history: {history_stats.total} messages, {len(history_stats)} in memory"
+            f"{', saved to disk' if history_stats.persistent else ''}"
+        )
+
+    # Stage-by-stage breakdown of this session's last answered question
+    if DEBUG_PANEL:
+        with st.expander("🔍 Debug: Last Turn"):
+            last_trace = st.session_state.last_trace
+            if last_trace:
+                st.caption(
+                    f"{last_trace['provider'] or ('cache' if last_trace['cached'] else 'n/a')} · "
+                    f"{last_trace['status'] or 'running'} · {last_trace['total_ms'] or 0:.0f} ms total"
+                )
+                for stage, ms in last_trace["stages_ms"].items():
+                    st.caption(f"{stage}: {ms:.0f} ms")
+                st.caption(
+                    f"Tokens: {last_trace['prompt_tokens']} prompt / {last_trace['completion_tokens']} completion"
+                )
+                if last_trace["context_tokens"] or last_trace["context_tokens_removed"]:
+                    st.caption(
+                        f"Context: {last_trace['context_tokens']} tokens sent, "
+                        f"{last_trace['context_tokens_removed']} removed by compression"
+                    )
+                if last_trace["prompt_variant"]:
+                    st.caption(
+                        f"System prompt: {last_trace['prompt_variant']} v{last_trace['prompt_version']} · "
+                        f"{last_trace['prefix_tokens']} cacheable prefix tokens · "
+                        f"{last_trace['prompt_tokens_saved']} saved"
+                    )
+            else:
+                st.caption("No questions answered yet in this session.")
+
 # Main content area
 if st.session_state.show_readme:
     # Show logo at the top of README
-    logo_path = "assets/ConnectSense.jpg"
-    if os.path.exists(logo_path):
-        base64_image = image_to_base64(logo_path)
-        if base64_image:
-            st.markdown(
-                f"""
-                <div class="logo-container">
-                    <img src="data:image/jpeg;base64,{base64_image}" alt="ConnectSense Logo" width="300" class="logo-image">
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
+    logo = logo_img_attrs(300)
+    if logo:
+        st.markdown(
+            f"""
+            <div class="logo-container">
+                <img {logo} alt="ConnectSense Logo" class="logo-image">
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
     
     # Show README content with a continue button
     st.markdown(readme_content)
@@ -236,19 +236,17 @@ if st.session_state.show_readme:
             st.rerun()
 else:
     # Display the title and logo when not showing README
-    logo_path = "assets/ConnectSense.jpg"
-    if os.path.exists(logo_path):
-        base64_image = image_to_base64(logo_path)
-        if base64_image:
-            st.markdown(
-                f"""
-                <div class="title-container">
-                    <img src="data:image/jpeg;base64,{base64_image}" alt="ConnectSense Logo" width="100" style="border-radius: 10px;">
-                    <h1 class="title-text">ConnectSense 🔗</h1>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
+    logo = logo_img_attrs(100)
+    if logo:
+        st.markdown(
+            f"""
+            <div class="title-container">
+                <img {logo} alt="ConnectSense Logo" style="border-radius: 10px;">
+                <h1 class="title-text">ConnectSense 🔗</h1>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
     else:
         st.title("ConnectSense 🔗")
     
@@ -269,10 +267,18 @@ else:
     # Create a clear separation between buttons and chat
     st.markdown('<div class="divider"></div>', unsafe_allow_html=True)
 
-    # Display chat messages in a container
+    # Display the newest chat messages in a container; older ones a page at a time
+    chat_history = st.session_state.chat_history
     chat_container = st.container()
     with chat_container:
-        for message in st.session_state.chat_history:
+        earlier = chat_history.available_before(st.session_state.history_shown)
+        if earlier:
+            if st.button(f"⬆️ Show earlier messages ({earlier} more)", key="show_earlier"):
+                st.session_state.history_shown += CHAT_PAGE_SIZE
+                st.rerun()
+        elif not chat_history.persistent and chat_history.total > len(chat_history):
+            st.caption(f"{chat_history.total - len(chat_history)} earlier messages are no longer kept.")
+        for message in chat_history.latest(st.session_state.history_shown):
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
 
@@ -281,46 +287,107 @@ else:
 
     # Process user input
     if user_input and st.session_state.query_engine is not None:
+        # Already imported by the warm-up in local mode; light in service mode
+        from conversation_memory import ConversationMemory
+
+        if st.session_state.memory is None:
+            st.session_state.memory = ConversationMemory()
+
         # Add user message to chat history
-        st.session_state.chat_history.append({"role": "user", "content": user_input})
+        st.session_state.chat_history.append("user", user_input)
         
         # Display user message
         with chat_container:
             with st.chat_message("user"):
                 st.markdown(user_input)
         
-        # Generate and display assistant response
+        # Generate and stream the assistant response
         with chat_container:
             with st.chat_message("assistant"):
-                with st.spinner("Thinking..."):
-                    try:
-                        # Build context from recent messages (last 5 interactions / 10 messages)
-                        context_str = ""
-                        if st.session_state.chat_history:
-                            recent = st.session_state.chat_history[-10:]
-                            for i in range(0, len(recent), 2):
-                                if i+1 < len(recent):
-                                    context_str += f"### Previous Interaction:\n**User**: {recent[i]['content']}\n**Assistant**: {recent[i+1]['content']}\n\n"
-                        
-                        # Combine system prompt, context, and current question
-                        full_query = f"{SYSTEM_PROMPT}\n\n{context_str}\n### New Question:\n{user_input}"
-                        
-                        # Execute query with the full query as input
-                        response = st.session_state.query_engine.query(full_query)
-                        response_text = str(response)
-                        
-                        st.markdown(response_text)
-                        
-                        # Add assistant message to chat history
-                        st.session_state.chat_history.append({"role": "assistant", "content": response_text})
-                        
-                    except Exception as e:
-                        error_msg = f"Error: {str(e)}"
-                        st.markdown(error_msg)
-                        st.session_state.chat_history.append({"role": "assistant", "content": error_msg})
+                placeholder = st.empty()
+                response_text = ""
+                completed = False
+                failed = False
+                trace = None
+                service_result = {}
+                try:
+                    # Run the query on the shared service; keep the spinner only until
+                    # the first token arrives and show the queue ahead of this request
+                    if RAG_SERVICE_URL:
+                        queued = (service_status or {}).get("query_service", {}).get("queued", 0)
+                    else:
+                        queued = get_query_service().stats()["queued"]
+                    spinner_text = f"Thinking... ({queued} requests ahead of you)" if queued else "Thinking..."
+                    with st.spinner(spinner_text):
+                        # Session state is only readable from the script thread, so
+                        # capture what the worker needs before handing it over
+                        history = st.session_state.chat_history[:-1]
+                        memory = st.session_state.memory
+                        if RAG_SERVICE_URL:
+                            # The service gets this session's memory window: the running
+                            # summary and the recent turns that fit the token budget
+                            summary, turns = memory.sync(history).window()
+                            window = []
+                            for question, answer in turns:
+                                window.append({"role": "user", "content": question})
+                                if answer is not None:
+                                    window.append({"role": "assistant", "content": answer})
+                            tokens = st.session_state.query_engine.stream_answer(
+                                user_input, window, summary, QUERY_MODE, result=service_result
+                            )
+                        else:
+                            from rag import stream_answer
+                            from metrics import Trace
+
+                            trace = Trace(QUERY_MODE)
+                            # The LLM router applies the per-provider limits itself
+                            tokens = get_query_service().stream(
+                                None,
+                                lambda: stream_answer(resources, user_input, history, memory=memory, trace=trace),
+                                trace=trace,
+                            )
+                        response_text = next(tokens, "")
+                    placeholder.markdown(response_text + "▌")
+
+                    # Re-render at most every STREAM_RENDER_INTERVAL seconds to limit UI updates
+                    last_render = time.monotonic()
+                    for token in tokens:
+                        response_text += token
+                        if time.monotonic() - last_render >= STREAM_RENDER_INTERVAL:
+                            placeholder.markdown(response_text + "▌")
+                            last_render = time.monotonic()
+                    placeholder.markdown(response_text)
+                    completed = True
+                    
+                except Exception as e:
+                    # Keep whatever was streamed before the error
+                    error_msg = friendly_error(e)
+                    failed = not response_text
+                    response_text = f"{response_text}\n\n{error_msg}" if response_text else error_msg
+                    placeholder.markdown(response_text)
+                    completed = True
+                finally:
+                    # Also runs when the script run is stopped mid-stream, so partial
+                    # output is not lost from the chat history
+                    if response_text and not completed:
+                        response_text += "\n\n*(response interrupted)*"
+                    if response_text:
+                        # Error-only replies are shown but kept out of the conversation memory
+                        st.session_state.chat_history.append("assistant", response_text, error=failed)
+                        # Fold turns that left the memory window into its summary in the
+                        # background (with the service's LLM in service mode)
+                        if RAG_SERVICE_URL:
+                            llm = st.session_state.query_engine
+                        else:
+                            llm = resources.router if resources is not None else None
+                        st.session_state.memory.sync(st.session_state.chat_history, llm=llm)
+                    if trace is not None:
+                        st.session_state.last_trace = trace.to_dict()
+                    elif "trace" in service_result:
+                        st.session_state.last_trace = service_result["trace"]
     elif user_input and st.session_state.query_engine is None:
         # Add user message to chat history
-        st.session_state.chat_history.append({"role": "user", "content": user_input})
+        st.session_state.chat_history.append("user", user_input)
         
         # Display user message
         with chat_container:
@@ -332,7 +399,7 @@ else:
             with st.chat_message("assistant"):
                 error_msg = "System initialization failed. Please check the application logs for more information."
                 st.markdown(error_msg)
-                st.session_state.chat_history.append({"role": "assistant", "content": error_msg})
+                st.session_state.chat_history.append("assistant", error_msg, error=True)
 
 # Footer with version and copyright
 st.markdown(
@@ -0,0 +1,213 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import numpy as np
+
+from config import QUERY_MODE, BATCH_CONCURRENCY, BATCH_SOURCE_EXCERPT_CHARS
+from metrics import Trace
+from query_service import QueueFullError, get_query_service
+from rag import answer_with_sources
+from resources import get_resources
+
+# Headless batch question answering for bulk planning requests, e.g. one question per
+# school or clinic in a district. Questions are read from a CSV or JSONL file (a
+# "question" column/field, optionally an "id"), deduplicated after normalizing case,
+# whitespace and trailing punctuation, and answered through the same index, system
+# prompt, retriever and LLM router as the app. Queries go through the query service, so
+# the per-provider limits and 429 retries apply, with at most --concurrency in flight
+# (capped at what the service runs and queues at once; a question it turns away is
+# submitted again once another one finishes).
+# Each answer is appended to a JSONL file with its source nodes as soon as it is done;
+# re-running with the same output skips the questions already answered and retries
+# the failed ones.
+# Usage: python batch_qa.py questions.csv --out answers.jsonl --concurrency 6
+
+
+def normalize(question):
+    return " ".join(question.casefold().split()).rstrip(" ?.!")
+
+
+def question_key(question):
+    return hashlib.sha1(normalize(question).encode()).hexdigest()[:16]
+
+
+def read_questions(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    questions = []
+    for number, row in enumerate(rows, 1):
+        question = (row.get("question") or "").strip()
+        if question:
+            questions.append({"id": str(row.get("id") or number), "question": question})
+    return questions
+
+
+# One item per distinct question, with the ids of every input row that asked it
+def deduplicate(questions):
+    unique = {}
+    for item in questions:
+        key = question_key(item["question"])
+        if key in unique:
+            unique[key]["ids"].append(item["id"])
+        else:
+            unique[key] = {"key": key, "ids": [item["id"]], "question": item["question"]}
+    return list(unique.values())
+
+
+# Answered records of a previous run. The file is rewritten without the failed ones,
+# which are asked again.
+def load_answered(out_path):
+    if not os.path.exists(out_path):
+        return {}
+    with open(out_path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    answered = {record["key"]: record for record in records if record.get("status") == "ok"}
+    tmp = f"{out_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for record in answered.values():
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp, out_path)
+    return answered
+
+
+def _source(node):
+    return {
+        "source": node.metadata.get("source_path") or node.metadata.get("file_name"),
+        "score": node.score,
+        "excerpt": node.get_content()[:BATCH_SOURCE_EXCERPT_CHARS],
+    }
+
+
+def _record(item, trace, answer=None, sources=(), error=None):
+    return {
+        **item,
+        "answer": answer,
+        "sources": [_source(node) for node in sources],
+        "provider": trace.provider,
+        "cached": trace.cached,
+        "seconds": trace.total,
+        "status": "error" if error else "ok",
+        "error": error,
+    }
+
+
+def run_batch(resources, items, out_path, concurrency=BATCH_CONCURRENCY, mode=QUERY_MODE, progress=True):
+    service = get_query_service()
+    concurrency = max(1, min(concurrency, service.max_concurrency + service.max_queue))
+    pending = {}
+    queue = iter(items)
+    retry = None
+    latencies = []
+    providers = Counter()
+    failed = 0
+    interrupted = False
+    start = time.perf_counter()
+
+    with open(out_path, "a", encoding="utf-8") as out:
+        try:
+            while True:
+                while len(pending) < concurrency:
+                    item, retry = retry or next(queue, None), None
+                    if item is None:
+                        break
+                    # The LLM router applies the per-provider limits itself
+                    trace = Trace(mode)
+                    try:
+                        future = service.submit(
+                            None,
+                            lambda item=item, trace=trace: answer_with_sources(resources, item["question"], mode, trace),
+                            trace=trace,
+                        )
+                    except QueueFullError:
+                        # Queries from elsewhere in the process fill the queue
+                        retry = item
+                        break
+                    pending[future] = (item, trace)
+                if not pending:
+                    if retry is None:
+                        break
+                    time.sleep(0.5)
+                    continue
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item, trace = pending.pop(future)
+                    try:
+                        answer, sources = future.result()
+                        record = _record(item, trace, answer, sources)
+                        latencies.append(trace.total)
+                        providers["cache" if trace.cached else trace.provider] += 1
+                    except Exception as e:
+                        record = _record(item, trace, error=str(e))
+                        failed += 1
+                    # One line per finished question, so an interrupted run loses nothing
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                    if progress:
+                        print(f"[{len(latencies) + failed}/{len(items)}] {record['status']}: {item['question'][:70]}")
+        except KeyboardInterrupt:
+            interrupted = True
+            for future in pending:
+                future.cancel()
+
+    seconds = time.perf_counter() - start
+    return {
+        "answered": len(latencies),
+        "failed": failed,
+        "interrupted": interrupted,
+        "seconds": seconds,
+        "questions_per_minute": len(latencies) / seconds * 60 if seconds else 0.0,
+        "latency_p50": float(np.percentile(latencies, 50)) if latencies else None,
+        "latency_p90": float(np.percentile(latencies, 90)) if latencies else None,
+        "providers": dict(providers),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a CSV or JSONL file of questions without the UI")
+    parser.add_argument("questions", help="CSV with a 'question' column or JSONL with a 'question' field")
+    parser.add_argument("--out", default="batch_answers.jsonl", help="JSONL file of answers; re-runs resume it")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Questions answered at once")
+    parser.add_argument("--mode", choices=("chat", "legacy"), default=QUERY_MODE)
+    parser.add_argument("--quiet", action="store_true", help="Only print the summary")
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions)
+    items = deduplicate(questions)
+    answered = load_answered(args.out)
+    todo = [item for item in items if item["key"] not in answered]
+    print(f"Questions: {len(questions)} ({len(items)} distinct, {len(items) - len(todo)} already answered)")
+    if not todo:
+        print(f"Nothing to do, all answers are in {args.out}")
+        return
+
+    resources = get_resources()
+    if resources.router is None:
+        raise SystemExit("No LLM available. Please check your API keys and try again.")
+    service = get_query_service()
+    if args.concurrency > service.max_concurrency + service.max_queue:
+        print(f"Concurrency capped at {service.max_concurrency + service.max_queue}: the query service runs "
+              f"{service.max_concurrency} queries at once and queues {service.max_queue}")
+    report = run_batch(resources, todo, args.out, args.concurrency, args.mode, progress=not args.quiet)
+
+    print(f"Answered {report['answered']} questions in {report['seconds']:.1f}s "
+          f"({report['questions_per_minute']:.1f}/min), {report['failed']} failed")
+    if report["latency_p50"] is not None:
+        print(f"Latency: p50 {report['latency_p50']:.1f}s, p90 {report['latency_p90']:.1f}s; "
+              f"by provider: {', '.join(f'{p}: {n}' for p, n in report['providers'].items())}")
+    if report["interrupted"] or report["failed"]:
+        print(f"Run the same command again to {'finish' if report['interrupted'] else 'retry the failed questions'}")
+    print(f"Answers written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
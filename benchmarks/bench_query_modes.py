@@ -0,0 +1,93 @@
+import argparse
+import json
+import statistics
+import time
+
+from llama_index.core import Settings
+from llama_index.core.utils import get_tokenizer
+
+from config import SIMILARITY_TOP_K
+from rag import build_legacy_query, condense_question
+
+# Compares what each query mode sends to the embedding model and retriever:
+#   legacy - SYSTEM_PROMPT + recent interactions + question, embedded as one string
+#   chat   - a condensed standalone question only
+# Usage: python -m benchmarks.bench_query_modes --questions benchmarks/data/questions.jsonl
+
+
+def load_questions(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# A retrieval is a hit when any expected term appears in a retrieved chunk
+def is_hit(nodes, expected):
+    texts = [node.get_content(metadata_mode="all").lower() for node in nodes]
+    return any(term.lower() in text for term in expected for text in texts)
+
+
+def run_mode(mode, questions, retriever, tokenizer):
+    rows = []
+    for item in questions:
+        history = item.get("history", [])
+        start = time.perf_counter()
+        if mode == "legacy":
+            query_str = build_legacy_query(item["question"], history)
+        else:
+            query_str = condense_question(Settings.llm, history, item["question"])
+        condensed_at = time.perf_counter()
+        nodes = retriever.retrieve(query_str)
+        end = time.perf_counter()
+        rows.append({
+            "question": item["question"],
+            "embedding_tokens": len(tokenizer(query_str)),
+            "embedding_chars": len(query_str),
+            "condense_ms": (condensed_at - start) * 1000,
+            "retrieval_ms": (end - condensed_at) * 1000,
+            "total_ms": (end - start) * 1000,
+            "hit": is_hit(nodes, item.get("expected", [])),
+        })
+    return rows
+
+
+def summarize(rows):
+    return {
+        "queries": len(rows),
+        "mean_embedding_tokens": statistics.mean(r["embedding_tokens"] for r in rows),
+        "mean_condense_ms": statistics.mean(r["condense_ms"] for r in rows),
+        "mean_retrieval_ms": statistics.mean(r["retrieval_ms"] for r in rows),
+        "p50_total_ms": statistics.median(r["total_ms"] for r in rows),
+        "hit_rate": sum(r["hit"] for r in rows) / len(rows),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark legacy vs condensed-question retrieval")
+    parser.add_argument("--questions", default="benchmarks/data/questions.jsonl")
+    parser.add_argument("--out", default="bench_output.json")
+    args = parser.parse_args()
+
+    from resources import get_resources
+
+    resources = get_resources()
+    retriever = resources.index.as_retriever(similarity_top_k=SIMILARITY_TOP_K)
+    tokenizer = get_tokenizer()
+    questions = load_questions(args.questions)
+
+    results = {}
+    for mode in ("legacy", "chat"):
+        rows = run_mode(mode, questions, retriever, tokenizer)
+        results[mode] = {"summary": summarize(rows), "queries": rows}
+
+    print(f"{'mode':<8}{'emb tokens':>12}{'condense ms':>13}{'retrieve ms':>13}{'p50 ms':>10}{'hit rate':>10}")
+    for mode, result in results.items():
+        s = result["summary"]
+        print(f"{mode:<8}{s['mean_embedding_tokens']:>12.0f}{s['mean_condense_ms']:>13.0f}"
+              f"{s['mean_retrieval_ms']:>13.0f}{s['p50_total_ms']:>10.0f}{s['hit_rate']:>10.0%}")
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Reproducible benchmark of the app's query path (index load, retrieval, prompt assembly,
+# chat engine, LLM router and query service) with the deterministic stub providers from
+# stub_providers.py in place of GeminiEmbedding, Groq and Gemini. Reports cold start,
+# sequential per-query latency, memory footprint and concurrent-session throughput, and
+# writes everything, with the parameters used, to a JSON file for comparison across
+# index sizes and changes.
+# Usage: python -m benchmarks.bench_query_path --index-size 5000 --sessions 8 --out bench_output.json
+
+VOCABULARY = (
+    "fiber tower microwave satellite vsat leo mesh wifi lte 5g gpon backhaul spectrum license "
+    "trcsl pta trai btrc nta village school clinic district province monsoon flood mountain "
+    "desert delta river terrain solar battery generator cost budget subsidy rural urban "
+    "latency bandwidth coverage antenna mast relay router enclosure ip67 grounding lightning "
+    "pakistan india bangladesh nepal sri lanka bhutan sindh punjab assam himalaya terai"
+).split()
+
+
+# Deterministic synthetic corpus of `count` chunks of 120-200 words each
+def synthetic_nodes(count, seed=0):
+    from llama_index.core.schema import TextNode
+
+    rng = np.random.default_rng(seed)
+    nodes = []
+    for i in range(count):
+        words = rng.choice(VOCABULARY, size=int(rng.integers(120, 200)))
+        nodes.append(TextNode(
+            id_=f"synthetic-{i}",
+            text=" ".join(words),
+            metadata={"source_path": f"synthetic/doc-{i // 20}.txt"},
+        ))
+    return nodes
+
+
+def build_synthetic_store(count, persist_dir, seed=0):
+    from index_store import write_store
+    from stub_providers import StubEmbedding
+
+    nodes = synthetic_nodes(count, seed)
+    embed_model = StubEmbedding(latency=0.0)
+    embeddings = embed_model.get_text_embedding_batch([node.get_content(metadata_mode="embed") for node in nodes])
+    for node, embedding in zip(nodes, embeddings):
+        node.embedding = embedding
+    write_store(nodes, persist_dir)
+
+
+def store_dim(persist_dir):
+    import faiss
+    from index_store import vectors_path
+
+    return faiss.read_index(vectors_path(persist_dir), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY).d
+
+
+# Resident and peak memory of this process in MB
+def memory_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        rss = None
+    return {"rss_mb": rss, "peak_rss_mb": peak}
+
+
+def percentiles(seconds):
+    if not seconds:
+        return None
+    ms = np.array(seconds) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+    }
+
+
+# Run in a fresh interpreter: time the imports and the first get_resources() call
+def cold_start_child():
+    start = time.perf_counter()
+    import rag  # noqa: F401
+    from resources import get_resources
+    imported = time.perf_counter()
+    get_resources()
+    loaded = time.perf_counter()
+    print(json.dumps({
+        "import_seconds": imported - start,
+        "load_seconds": loaded - imported,
+        "total_seconds": loaded - start,
+        **memory_mb(),
+    }))
+
+
+def cold_start(env):
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_query_path", "--cold-start-child"],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+# One question through the same path as the app: query service -> stream_answer.
+# Returns (time to first token, total time), in seconds.
+def run_query(resources, item, mode):
+    from query_service import get_query_service
+    from rag import stream_answer
+
+    start = time.perf_counter()
+    tokens = get_query_service().stream(
+        None, lambda: stream_answer(resources, item["question"], item.get("history", []), mode=mode)
+    )
+    first = None
+    for _ in tokens:
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+def sequential(resources, questions, repeats, mode):
+    ttft, totals = [], []
+    for _ in range(repeats):
+        for item in questions:
+            first, total = run_query(resources, item, mode)
+            ttft.append(first)
+            totals.append(total)
+    return {"queries": len(totals), "ttft": percentiles(ttft), "total": percentiles(totals)}
+
+
+# `sessions` simulated users, each asking `per_session` questions back to back
+def concurrent(resources, questions, sessions, per_session, mode):
+    from query_service import QueueFullError
+
+    lock = threading.Lock()
+    ttft, totals = [], []
+    rejected = 0
+
+    def session(index):
+        nonlocal rejected
+        for i in range(per_session):
+            item = questions[(index + i) % len(questions)]
+            try:
+                first, total = run_query(resources, item, mode)
+            except QueueFullError:
+                with lock:
+                    rejected += 1
+                continue
+            with lock:
+                ttft.append(first)
+                totals.append(total)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(session, range(sessions)))
+    wall = time.perf_counter() - start
+    return {
+        "sessions": sessions,
+        "queries": len(totals),
+        "rejected": rejected,
+        "wall_seconds": wall,
+        "queries_per_second": len(totals) / wall if wall else 0.0,
+        "ttft": percentiles(ttft),
+        "total": percentiles(totals),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def run_benchmarks(args):
+    cold = cold_start(dict(os.environ))
+
+    from resources import get_resources
+
+    resources = get_resources()
+    with open(args.questions) as f:
+        questions = [json.loads(line) for line in f if line.strip()]
+    # Warm-up: builds the BM25 index and touches the vector pages once
+    run_query(resources, questions[0], args.mode)
+
+    return {
+        "config": {
+            "index_size": args.index_size or resources.index.vector_store.client.ntotal,
+            "synthetic": bool(args.index_size),
+            "mode": args.mode,
+            "questions": len(questions),
+            "embed_latency": args.embed_latency,
+            "llm_latency": args.llm_latency,
+            "token_latency": args.token_latency,
+            "answer_tokens": args.answer_tokens,
+            "caches": args.caches,
+            "seed": args.seed,
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "cold_start": cold,
+        "sequential": sequential(resources, questions, args.repeats, args.mode),
+        "memory_after_sequential": memory_mb(),
+        "concurrent": concurrent(resources, questions, args.sessions, args.per_session, args.mode),
+        "memory_after_concurrent": memory_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the query path with stub providers")
+    parser.add_argument("--index-size", type=int, default=2000,
+                        help="Chunks in a synthetic index; 0 benchmarks the existing store instead")
+    parser.add_argument("--store", default=None, help="Existing store to benchmark when --index-size is 0")
+    parser.add_argument("--questions", default="benchmarks/data/questions.jsonl")
+    parser.add_argument("--mode", choices=("chat", "legacy"), default="chat")
+    parser.add_argument("--repeats", type=int, default=3, help="Passes over the questions in the sequential run")
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent sessions in the throughput run")
+    parser.add_argument("--per-session", type=int, default=5, help="Questions per concurrent session")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Stub embedding latency (s)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Stub LLM time to first token (s)")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Stub LLM delay per further token (s)")
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--caches", action="store_true", help="Keep the answer and embedding caches enabled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_output.json")
+    parser.add_argument("--cold-start-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_start_child:
+        cold_start_child()
+        return
+
+    tmp_dir = tempfile.mkdtemp(prefix="connectsense-bench-")
+    store_dir = args.store or os.getenv("CONNECTSENSE_STORE_DIR", "vector_db/faiss_store")
+    if args.index_size:
+        store_dir = os.path.join(tmp_dir, "faiss_store")
+
+    # Configuration is read from the environment at import time, so set it before any
+    # project module is imported; the cold start child inherits the same environment
+    os.environ.update({
+        "CONNECTSENSE_PROVIDERS": "stub",
+        "CONNECTSENSE_STORE_DIR": store_dir,
+        "CONNECTSENSE_STUB_EMBED_LATENCY": str(args.embed_latency),
+        "CONNECTSENSE_STUB_LLM_LATENCY": str(args.llm_latency),
+        "CONNECTSENSE_STUB_TOKEN_LATENCY": str(args.token_latency),
+        "CONNECTSENSE_STUB_ANSWER_TOKENS": str(args.answer_tokens),
+        "CONNECTSENSE_EMBEDDING_CACHE_PATH": os.path.join(tmp_dir, "embeddings.sqlite"),
+        "CONNECTSENSE_ANSWER_CACHE_PATH": os.path.join(tmp_dir, "answers.sqlite"),
+    })
+    if not args.caches:
+        os.environ["CONNECTSENSE_ANSWER_CACHE"] = "0"
+        os.environ["CONNECTSENSE_EMBEDDING_CACHE"] = "0"
+
+    if args.index_size:
+        start = time.perf_counter()
+        build_synthetic_store(args.index_size, store_dir, args.seed)
+        print(f"Built synthetic index of {args.index_size} chunks in {time.perf_counter() - start:.1f}s")
+    # Stub query vectors must match the dimension of the stored ones
+    os.environ["CONNECTSENSE_STUB_EMBED_DIM"] = str(store_dim(store_dir))
+
+    try:
+        results = run_benchmarks(args)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    seq, conc, cold = results["sequential"], results["concurrent"], results["cold_start"]
+    print(f"Cold start: {cold['total_seconds']:.2f}s (imports {cold['import_seconds']:.2f}s, "
+          f"load {cold['load_seconds']:.2f}s), {cold['peak_rss_mb']:.0f} MB peak RSS")
+    print(f"Sequential ({seq['queries']} queries): p50 {seq['total']['p50_ms']:.0f} ms, "
+          f"p99 {seq['total']['p99_ms']:.0f} ms, TTFT p50 {seq['ttft']['p50_ms']:.0f} ms")
+    if conc["total"]:
+        print(f"Concurrent ({conc['sessions']} sessions): {conc['queries_per_second']:.2f} queries/s, "
+              f"p50 {conc['total']['p50_ms']:.0f} ms, p99 {conc['total']['p99_ms']:.0f} ms, "
+              f"{conc['rejected']} rejected")
+    print(f"Memory: {results['memory_after_concurrent']['peak_rss_mb']:.0f} MB peak RSS")
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from index_store import build_vector_index, index_description, load_exact_vectors, search_rescored, vectors_path
+
+# Recall / latency / memory comparison of the quantized vector index types against the
+# exact flat index, over the vectors of an existing store or a synthetic clustered
+# corpus. Each index type is built from the same normalized vectors; IVF types are
+# measured at every --nprobe and all quantized types with and without exact re-scoring
+# (--rescore factors). recall@k is the overlap of the top k with the flat index's top k.
+# Size is the on-disk (memory-mapped) size of the index; re-scoring additionally reads
+# factor * k rows of the exact vectors per query.
+# Usage: python -m benchmarks.bench_vector_index --count 100000 --dim 768 --out bench_output.json
+
+
+# Gaussian clusters in `dim` dimensions, normalized like the store's vectors; queries
+# are drawn from the same clusters but are not in the corpus
+def synthetic_vectors(count, dim, queries, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(count // 100, 1), dim)).astype("float32")
+
+    def sample(n):
+        points = centers[rng.integers(0, len(centers), n)] + rng.normal(scale=0.6, size=(n, dim)).astype("float32")
+        faiss.normalize_L2(points)
+        return points
+
+    return sample(count), sample(queries)
+
+
+# Exact vectors of an existing store, and queries perturbed from a sample of them
+def store_vectors(persist_dir, queries, seed=0):
+    index = faiss.read_index(vectors_path(persist_dir), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    exact = load_exact_vectors(persist_dir, index.d)
+    vectors = np.array(exact) if exact is not None else index.reconstruct_n(0, index.ntotal)
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.integers(0, len(vectors), queries)]
+    query_vectors = (sample + rng.normal(scale=0.05, size=sample.shape)).astype("float32")
+    faiss.normalize_L2(query_vectors)
+    return vectors, query_vectors
+
+
+def index_size_mb(index):
+    with tempfile.NamedTemporaryFile(suffix=".faiss") as f:
+        faiss.write_index(index, f.name)
+        return os.path.getsize(f.name) / 2 ** 20
+
+
+# One query at a time, as the app searches
+def measure(index, exact, queries, truth, k, factor):
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        _, rows = search_rescored(index, exact, query[np.newaxis, :], k, factor)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len(set(rows[0].tolist()) & set(expected.tolist())) / k)
+    ms = np.array(latencies) * 1000
+    return {
+        "recall": float(np.mean(recalls)),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+    }
+
+
+def run(vectors, queries, index_types, nprobes, factors, k):
+    flat = build_vector_index(vectors, "flat")
+    _, truth = flat.search(queries, k)
+    exact_mb = vectors.nbytes / 2 ** 20
+
+    results = []
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = build_vector_index(vectors, index_type)
+        build_seconds = time.perf_counter() - start
+        ivf = faiss.try_extract_index_ivf(index)
+        quantized = index_type != "flat"
+        for nprobe in (nprobes if ivf is not None else [None]):
+            if ivf is not None:
+                ivf.nprobe = nprobe
+            for factor in (factors if quantized else [1]):
+                result = measure(index, vectors if factor > 1 else None, queries, truth, k, factor)
+                results.append({
+                    "index": index_description(index_type, *vectors.shape),
+                    "nprobe": nprobe,
+                    "rescore_factor": factor,
+                    "index_mb": index_size_mb(index),
+                    "exact_vectors_mb": exact_mb if quantized else 0.0,
+                    "build_seconds": build_seconds,
+                    **result,
+                })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare quantized vector indexes with the flat index")
+    parser.add_argument("--store", default=None, help="Use the vectors of this store instead of synthetic ones")
+    parser.add_argument("--count", type=int, default=50000, help="Synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=768, help="Synthetic vector dimension")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", default="flat,sq8,ivf-sq8,ivfpq")
+    parser.add_argument("--nprobe", default="1,4,16,64", help="nprobe values for IVF indexes")
+    parser.add_argument("--rescore", default="1,4", help="Re-scoring factors (1 = no re-scoring)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_output.json")
+    args = parser.parse_args()
+
+    if args.store:
+        vectors, queries = store_vectors(args.store, args.queries, args.seed)
+    else:
+        vectors, queries = synthetic_vectors(args.count, args.dim, args.queries, args.seed)
+    results = run(
+        vectors, queries, args.types.split(","),
+        [int(n) for n in args.nprobe.split(",")], [int(f) for f in args.rescore.split(",")], args.k,
+    )
+
+    print(f"{len(vectors)} vectors of {vectors.shape[1]} dimensions, {len(queries)} queries, recall@{args.k}")
+    print(f"{'index':<22}{'nprobe':>7}{'rescore':>8}{'recall':>8}{'p50 ms':>8}{'p95 ms':>8}{'size MB':>9}")
+    for r in results:
+        print(f"{r['index']:<22}{r['nprobe'] or '-':>7}{r['rescore_factor']:>8}{r['recall']:>8.3f}"
+              f"{r['p50_ms']:>8.2f}{r['p95_ms']:>8.2f}{r['index_mb']:>9.1f}")
+
+    with open(args.out, "w") as f:
+        json.dump({
+            "config": {**vars(args), "vectors": len(vectors), "dim": int(vectors.shape[1])},
+            "results": results,
+        }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import argparse
+import json
+import random
+import re
+import statistics
+import time
+
+import numpy as np
+
+# Evaluation of context compression (context_compressor.py) on the questions file used
+# by eval_retrieval. For each question the retrieved chunks are compressed and compared
+# with the full chunks on context tokens, compression time and coverage of the expected
+# terms/sources. With --answers each question is also answered from both contexts,
+# comparing prompt tokens, time to first token, generation time, expected-term coverage
+# of the answers and their agreement (token F1); --judge adds a blind pairwise judgement
+# by the LLM (order randomized per question).
+# Usage: python -m benchmarks.eval_context_compression --questions benchmarks/data/questions.jsonl --answers
+
+JUDGE_PROMPT = """You are grading two answers to a question about public sector connectivity planning in South Asia.
+
+Question: {question}
+
+Answer 1:
+{first}
+
+Answer 2:
+{second}
+
+Which answer is more accurate, specific and useful? Reply with exactly one of: 1, 2, TIE."""
+
+
+def coverage(text, item):
+    text = text.lower()
+    terms = item.get("expected", [])
+    return sum(term.lower() in text for term in terms) / len(terms) if terms else None
+
+
+def source_coverage(nodes, item):
+    expected = item.get("expected_sources")
+    if not expected:
+        return None
+    sources = {node.metadata.get("source_path") or node.metadata.get("file_name") for node in nodes}
+    return sum(source in sources for source in expected) / len(expected)
+
+
+def token_f1(a, b):
+    a, b = re.findall(r"\w+", a.lower()), re.findall(r"\w+", b.lower())
+    common = sum(min(a.count(word), b.count(word)) for word in set(a) & set(b))
+    if not common:
+        return 0.0
+    precision, recall = common / len(a), common / len(b)
+    return 2 * precision * recall / (precision + recall)
+
+
+def _mean(values):
+    values = [value for value in values if value is not None]
+    return statistics.mean(values) if values else None
+
+
+def compare_contexts(retriever, compressor, questions):
+    from llama_index.core.schema import QueryBundle
+
+    from metrics import count_tokens
+
+    rows = []
+    for item in questions:
+        results = retriever.retrieve(item["question"])
+        start = time.perf_counter()
+        compressed = compressor.postprocess_nodes(results, query_bundle=QueryBundle(item["question"]))
+        seconds = time.perf_counter() - start
+        full_text = "\n".join(result.node.get_content() for result in results)
+        compressed_text = "\n".join(result.node.get_content() for result in compressed)
+        rows.append({
+            "question": item["question"],
+            "chunks": [len(results), len(compressed)],
+            "tokens": [count_tokens(full_text), count_tokens(compressed_text)],
+            "compress_ms": seconds * 1000,
+            "term_coverage": [coverage(full_text, item), coverage(compressed_text, item)],
+            "source_coverage": [
+                source_coverage([r.node for r in results], item), source_coverage([r.node for r in compressed], item)
+            ],
+        })
+    return rows
+
+
+def _answer(index, item, compress):
+    from metrics import Trace, activate
+    from context_compressor import ContextCompressor
+    from rag import build_chat_engine
+
+    trace = Trace("eval")
+    with activate(trace):
+        compressor = ContextCompressor() if compress else None
+        response = build_chat_engine(index, compressor=compressor).stream_chat(item["question"])
+        start = time.perf_counter()
+        text = "".join(response.response_gen)
+        trace.add_stage("generation", time.perf_counter() - start)
+    return text, trace
+
+
+def compare_answers(index, llm, questions, judge, seed):
+    rng = random.Random(seed)
+    rows = []
+    for item in questions:
+        full, full_trace = _answer(index, item, compress=False)
+        compressed, compressed_trace = _answer(index, item, compress=True)
+        row = {
+            "question": item["question"],
+            "prompt_tokens": [full_trace.prompt_tokens, compressed_trace.prompt_tokens],
+            "ttft_ms": [full_trace.stages.get("ttft", 0) * 1000, compressed_trace.stages.get("ttft", 0) * 1000],
+            "generation_ms": [full_trace.stages["generation"] * 1000, compressed_trace.stages["generation"] * 1000],
+            "answer_coverage": [coverage(full, item), coverage(compressed, item)],
+            "agreement_f1": token_f1(full, compressed),
+        }
+        if judge:
+            swap = rng.random() < 0.5
+            first, second = (compressed, full) if swap else (full, compressed)
+            verdict = str(llm.complete(JUDGE_PROMPT.format(question=item["question"], first=first, second=second)))
+            verdict = verdict.strip().upper()
+            winner = "tie" if "TIE" in verdict else {"1": "first", "2": "second"}.get(verdict[:1])
+            if winner in ("first", "second"):
+                winner = "compressed" if (winner == "first") == swap else "full"
+            row["judge"] = winner or "invalid"
+        rows.append(row)
+    return rows
+
+
+def _pair(rows, key):
+    return [_mean([row[key][i] for row in rows]) for i in (0, 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate retrieved-context deduplication and compression")
+    parser.add_argument("--questions", default="benchmarks/data/questions.jsonl")
+    parser.add_argument("--budget", type=int, default=None, help="Context token budget (default: config)")
+    parser.add_argument("--answers", action="store_true", help="Also answer from both contexts (calls the LLM)")
+    parser.add_argument("--judge", action="store_true", help="Ask the LLM which answer is better (with --answers)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_output.json")
+    args = parser.parse_args()
+
+    from context_compressor import ContextCompressor
+    from hybrid_retriever import build_retriever
+    from resources import get_resources
+
+    resources = get_resources()
+    with open(args.questions) as f:
+        questions = [json.loads(line) for line in f if line.strip()]
+    compressor = ContextCompressor() if args.budget is None else ContextCompressor(token_budget=args.budget)
+
+    contexts = compare_contexts(build_retriever(resources.index), compressor, questions)
+    tokens = _pair(contexts, "tokens")
+    terms = _pair(contexts, "term_coverage")
+    sources = _pair(contexts, "source_coverage")
+    print(f"Context over {len(contexts)} questions (full -> compressed, budget {compressor.token_budget} tokens)")
+    print(f"  chunks          {_pair(contexts, 'chunks')[0]:.2f} -> {_pair(contexts, 'chunks')[1]:.2f}")
+    print(f"  tokens          {tokens[0]:.0f} -> {tokens[1]:.0f} ({1 - tokens[1] / max(tokens[0], 1):.0%} fewer)")
+    if terms[0] is not None:
+        print(f"  term coverage   {terms[0]:.2f} -> {terms[1]:.2f}")
+    if sources[0] is not None:
+        print(f"  source coverage {sources[0]:.2f} -> {sources[1]:.2f}")
+    compress_ms = [row["compress_ms"] for row in contexts]
+    print(f"  compression     {statistics.mean(compress_ms):.1f} ms mean, {np.percentile(compress_ms, 95):.1f} ms p95")
+    report = {"config": vars(args) | {"budget": compressor.token_budget}, "contexts": contexts}
+
+    if args.answers:
+        if resources.router is None:
+            raise SystemExit("No LLM available. Please check your API keys and try again.")
+        answers = compare_answers(resources.index, resources.router, questions, args.judge, args.seed)
+        print(f"Answers over {len(answers)} questions (full -> compressed)")
+        for key, unit in (("prompt_tokens", ""), ("ttft_ms", " ms"), ("generation_ms", " ms")):
+            full, compressed = _pair(answers, key)
+            print(f"  {key:<15} {full:.0f}{unit} -> {compressed:.0f}{unit}")
+        coverage_pair = _pair(answers, "answer_coverage")
+        if coverage_pair[0] is not None:
+            print(f"  term coverage   {coverage_pair[0]:.2f} -> {coverage_pair[1]:.2f}")
+        print(f"  agreement F1    {statistics.mean(row['agreement_f1'] for row in answers):.2f}")
+        if args.judge:
+            verdicts = [row["judge"] for row in answers]
+            print("  judge           " + ", ".join(f"{v}: {verdicts.count(v)}" for v in ("full", "tie", "compressed", "invalid")))
+        report["answers"] = answers
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import json
+import statistics
+
+import numpy as np
+
+from hybrid_retriever import HybridRetriever, get_reranker
+from index_store import get_partitions
+
+# Retrieval evaluation: recall@k and per-stage latency for dense, BM25, hybrid and
+# hybrid + reranker retrieval over the same index. When the store has region partitions,
+# hybrid retrieval over the whole index ("hybrid-all") is evaluated for comparison.
+# Each line of the questions file has a "question" and either "expected_sources" (values
+# of the source_path/file_name metadata of relevant chunks) or "expected" (terms that a
+# relevant chunk contains). recall@k is the fraction of expected items covered by the
+# top k chunks, averaged over questions.
+# Usage: python -m benchmarks.eval_retrieval --questions benchmarks/data/questions.jsonl
+
+K_VALUES = (1, 3, 5, 10)
+
+
+def covered(nodes, item):
+    if item.get("expected_sources"):
+        sources = {node.metadata.get("source_path") or node.metadata.get("file_name") for node in nodes}
+        return [source in sources for source in item["expected_sources"]]
+    texts = [node.get_content().lower() for node in nodes]
+    return [any(term.lower() in text for text in texts) for term in item.get("expected", [])]
+
+
+def evaluate(retriever, questions):
+    recalls = {k: [] for k in K_VALUES}
+    stage_times = {}
+    for item in questions:
+        results = retriever.retrieve(item["question"])
+        for stage, seconds in retriever.last_timings().items():
+            stage_times.setdefault(stage, []).append(seconds * 1000)
+        nodes = [result.node for result in results]
+        for k in K_VALUES:
+            hits = covered(nodes[:k], item)
+            if hits:
+                recalls[k].append(sum(hits) / len(hits))
+    return {
+        "recall": {f"@{k}": statistics.mean(values) if values else None for k, values in recalls.items()},
+        "latency_ms": {
+            stage: {"mean": statistics.mean(times), "p95": float(np.percentile(times, 95))}
+            for stage, times in stage_times.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate dense, BM25 and hybrid retrieval")
+    parser.add_argument("--questions", default="benchmarks/data/questions.jsonl")
+    parser.add_argument("--candidates", type=int, default=10, help="Candidates per retriever before fusion")
+    parser.add_argument("--out", default="bench_output.json")
+    args = parser.parse_args()
+
+    from resources import get_resources
+
+    index = get_resources().index
+    with open(args.questions) as f:
+        questions = [json.loads(line) for line in f if line.strip()]
+
+    top_k = max(K_VALUES)
+    configs = {
+        "vector": HybridRetriever(index, top_k=top_k, candidate_k=top_k, use_bm25=False),
+        "bm25": HybridRetriever(index, top_k=top_k, candidate_k=top_k, use_vector=False),
+        "hybrid": HybridRetriever(index, top_k=top_k, candidate_k=max(args.candidates, top_k)),
+    }
+    if get_partitions(index) is not None:
+        configs["hybrid-all"] = HybridRetriever(
+            index, top_k=top_k, candidate_k=max(args.candidates, top_k), partitioned=False
+        )
+    reranker = get_reranker()
+    if reranker is not None:
+        reranker.top_n = top_k
+        configs["hybrid+rerank"] = HybridRetriever(
+            index, top_k=top_k, candidate_k=max(args.candidates, top_k),
+            reranker=reranker, rerank_candidates=max(args.candidates, top_k) * 2,
+        )
+
+    results = {name: evaluate(retriever, questions) for name, retriever in configs.items()}
+
+    header = "".join(f"{'R' + key:>8}" for key in results["vector"]["recall"])
+    print(f"{'retriever':<15}{header}   stage latency (mean / p95 ms)")
+    for name, result in results.items():
+        recall = "".join(f"{value:>8.2f}" if value is not None else f"{'-':>8}" for value in result["recall"].values())
+        stages = ", ".join(f"{stage} {t['mean']:.1f}/{t['p95']:.1f}" for stage, t in result["latency_ms"].items())
+        print(f"{name:<15}{recall}   {stages}")
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
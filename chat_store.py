@@ -0,0 +1,157 @@
+import threading
+import time
+import uuid
+import zlib
+
+from config import CHAT_HISTORY_MAX_MESSAGES, CHAT_HISTORY_PATH, CHAT_HISTORY_TTL
+
+# Messages longer than this are stored zlib-compressed
+_COMPRESS_MIN_BYTES = 512
+
+
+# One chat message. Slots keep it far smaller than a dict; item access and get() are
+# kept so code written for {"role": ..., "content": ...} dicts reads it unchanged.
+class Message:
+    __slots__ = ("seq", "role", "content", "error")
+
+    def __init__(self, seq, role, content, error=False):
+        self.seq = seq
+        self.role = role
+        self.content = content
+        self.error = error
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+
+def _encode(content):
+    data = content.encode()
+    return zlib.compress(data) if len(data) >= _COMPRESS_MIN_BYTES else content
+
+
+def _decode(value):
+    return zlib.decompress(value).decode() if isinstance(value, bytes) else value
+
+
+# SQLite file holding the messages of every persisted session, shared by all sessions
+# and processes. Sessions not written to for `ttl` seconds are deleted when it is opened.
+class ChatStore:
+    def __init__(self, path=CHAT_HISTORY_PATH, ttl=CHAT_HISTORY_TTL):
+        # sqlite_store pulls in llama-index; the app imports this module before the warm-up
+        from sqlite_store import connect
+
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "session TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content NOT NULL, "
+                "error INTEGER NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (session, seq))"
+            )
+            self._conn.execute(
+                "DELETE FROM messages WHERE session IN "
+                "(SELECT session FROM messages GROUP BY session HAVING MAX(created_at) < ?)",
+                (time.time() - ttl,),
+            )
+
+    def append(self, session, message):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO messages (session, seq, role, content, error, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session, message.seq, message.role, _encode(message.content), int(message.error), time.time()),
+            )
+
+    # Up to `limit` messages of a session before `seq` (all of them when seq is None),
+    # oldest first
+    def before(self, session, seq, limit):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, role, content, error FROM messages WHERE session = ? AND seq < ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (session, float("inf") if seq is None else seq, limit),
+            ).fetchall()
+        return [Message(seq, role, _decode(content), bool(error)) for seq, role, content, error in reversed(rows)]
+
+    def delete(self, session):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE session = ?", (session,))
+
+
+_lock = threading.Lock()
+_store = None
+
+
+# Process-wide store shared by all sessions
+def get_chat_store():
+    global _store
+    with _lock:
+        if _store is None:
+            _store = ChatStore()
+        return _store
+
+
+# The messages of one chat session. Only the newest `max_messages` are held in memory;
+# with a store every message is also written to it, so older ones can be paged in for
+# display and a session resumes from its id after a restart. Without a store, messages
+# beyond the cap are gone. Indexing, slicing and len() cover the in-memory messages.
+class ChatHistory:
+    def __init__(self, session_id=None, store=None, max_messages=CHAT_HISTORY_MAX_MESSAGES):
+        self.session_id = session_id or uuid.uuid4().hex
+        self._store = store
+        self._max_messages = max_messages
+        self._messages = store.before(self.session_id, None, max_messages) if store else []
+        # Messages are numbered from 0 per session, so this is also the total count
+        self._next_seq = self._messages[-1].seq + 1 if self._messages else 0
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __iter__(self):
+        return iter(self._messages)
+
+    def __getitem__(self, index):
+        return self._messages[index]
+
+    @property
+    def total(self):
+        return self._next_seq
+
+    @property
+    def persistent(self):
+        return self._store is not None
+
+    def append(self, role, content, error=False):
+        message = Message(self._next_seq, role, content, error)
+        self._next_seq += 1
+        self._messages.append(message)
+        if len(self._messages) > self._max_messages:
+            del self._messages[:len(self._messages) - self._max_messages]
+        if self._store is not None:
+            self._store.append(self.session_id, message)
+        return message
+
+    # The newest `count` messages, reading those beyond the in-memory ones from the
+    # store. Paged-in messages are not kept.
+    def latest(self, count):
+        if count <= len(self._messages) or self._store is None or not self._messages:
+            return self._messages[-count:] if count else []
+        older = self._store.before(self.session_id, self._messages[0].seq, count - len(self._messages))
+        return older + self._messages
+
+    # How many messages older than the newest `count` can still be shown
+    def available_before(self, count):
+        available = self.total if self._store is not None else len(self._messages)
+        return max(available - count, 0)
+
+    def clear(self):
+        self._messages = []
+        self._next_seq = 0
+        if self._store is not None:
+            self._store.delete(self.session_id)
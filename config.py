@@ -1,3 +1,169 @@
+import os
+
+from dotenv import load_dotenv
+
+# Settings below may come from .env as well as from the environment, so it is loaded
+# before any of them is read (variables already set in the environment take precedence)
+load_dotenv()
+
+# Model settings
+GROQ_MODEL = "llama-3.3-70b-versatile"
+GEMINI_MODEL = "models/gemini-2.0-flash"
+EMBEDDING_MODEL = "models/embedding-001"
+LLM_TEMPERATURE = 0.5
+SIMILARITY_TOP_K = 3
+
+# Provider backend: "live" calls Groq/Gemini, "stub" uses the deterministic local
+# stand-ins in stub_providers.py (benchmarks, offline runs) with artificial latencies
+PROVIDER_BACKEND = os.getenv("CONNECTSENSE_PROVIDERS", "live")
+STUB_EMBED_DIM = int(os.getenv("CONNECTSENSE_STUB_EMBED_DIM", "768"))
+STUB_EMBED_LATENCY = float(os.getenv("CONNECTSENSE_STUB_EMBED_LATENCY", "0.05"))
+STUB_LLM_LATENCY = float(os.getenv("CONNECTSENSE_STUB_LLM_LATENCY", "0.5"))
+STUB_TOKEN_LATENCY = float(os.getenv("CONNECTSENSE_STUB_TOKEN_LATENCY", "0.01"))
+STUB_ANSWER_TOKENS = int(os.getenv("CONNECTSENSE_STUB_ANSWER_TOKENS", "64"))
+
+# Retrieval: "hybrid" fuses dense and BM25 results (reciprocal rank fusion over
+# RETRIEVAL_CANDIDATE_K candidates each), "vector" is dense retrieval only. The optional
+# cross-encoder reranker runs on CPU and needs the sentence-transformers package.
+RETRIEVAL_MODE = os.getenv("CONNECTSENSE_RETRIEVAL", "hybrid")
+RETRIEVAL_CANDIDATE_K = int(os.getenv("CONNECTSENSE_RETRIEVAL_CANDIDATES", "10"))
+RRF_K = 60
+RERANKER_ENABLED = os.getenv("CONNECTSENSE_RERANKER", "0") == "1"
+RERANKER_MODEL = os.getenv("CONNECTSENSE_RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = 10
+# Region partitions: questions naming a country (or else a terrain) are only matched
+# against the chunks tagged with it plus the untagged ones (see regions.py), unless
+# those are fewer than RETRIEVAL_CANDIDATE_K. CONNECTSENSE_PARTITIONS=0 always searches everything.
+PARTITIONED_RETRIEVAL = os.getenv("CONNECTSENSE_PARTITIONS", "1") == "1"
+# Context compression before synthesis (context_compressor.py): retrieved chunks that
+# mostly repeat a higher-ranked one are dropped, sentences repeated across chunks are
+# kept once, and the chunks are trimmed to the sentences sharing terms with the question
+# (and their neighbours) within CONTEXT_TOKEN_BUDGET tokens in total.
+# CONNECTSENSE_CONTEXT_COMPRESSION=0 passes the retrieved chunks through unchanged.
+CONTEXT_COMPRESSION = os.getenv("CONNECTSENSE_CONTEXT_COMPRESSION", "1") == "1"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONNECTSENSE_CONTEXT_TOKENS", "1500"))
+CONTEXT_DUPLICATE_THRESHOLD = 0.8
+
+# Query settings: "chat" embeds only a condensed standalone question and sends
+# SYSTEM_PROMPT as a system message; "legacy" embeds the full prompt + history string
+QUERY_MODE = os.getenv("CONNECTSENSE_QUERY_MODE", "chat")
+HISTORY_MESSAGES = 10
+# Prompt variants (prompts.py): greetings and other small talk are answered with
+# COMPACT_SYSTEM_PROMPT and no retrieval, everything else with SYSTEM_PROMPT and the
+# retrieved context. CONNECTSENSE_COMPACT_PROMPT=0 always uses the full prompt.
+COMPACT_PROMPT_ENABLED = os.getenv("CONNECTSENSE_COMPACT_PROMPT", "1") == "1"
+# Conversation memory: at most HISTORY_MESSAGES recent messages are sent verbatim, and
+# only as many as fit in MEMORY_TOKEN_BUDGET together with the running summary of older
+# turns. Assistant answers are capped at MEMORY_ANSWER_MAX_TOKENS each in the memory.
+MEMORY_TOKEN_BUDGET = int(os.getenv("CONNECTSENSE_MEMORY_TOKENS", "1500"))
+MEMORY_ANSWER_MAX_TOKENS = 300
+MEMORY_SUMMARY_MAX_WORDS = 150
+MEMORY_SUMMARIZE = os.getenv("CONNECTSENSE_MEMORY_SUMMARIZE", "1") == "1"
+# Chat history: a session keeps at most CHAT_HISTORY_MAX_MESSAGES messages in memory and
+# renders the newest CHAT_PAGE_SIZE of them, older ones a page at a time on request.
+# With CHAT_PERSIST every message is also written to CHAT_HISTORY_PATH, so pages beyond
+# the cap can still be shown and a session resumes after a restart from its URL
+# (?session=<id>). Persisted sessions untouched for CHAT_HISTORY_TTL seconds are deleted.
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv("CONNECTSENSE_CHAT_MAX_MESSAGES", "40"))
+CHAT_PAGE_SIZE = int(os.getenv("CONNECTSENSE_CHAT_PAGE_SIZE", "20"))
+CHAT_PERSIST = os.getenv("CONNECTSENSE_CHAT_PERSIST", "0") == "1"
+CHAT_HISTORY_PATH = os.getenv("CONNECTSENSE_CHAT_HISTORY_PATH", "cache/chat_history.sqlite")
+CHAT_HISTORY_TTL = float(os.getenv("CONNECTSENSE_CHAT_HISTORY_TTL", str(30 * 24 * 3600)))
+# Semantic answer cache for standalone questions. A cached answer is reused when a new
+# question's embedding has at least ANSWER_CACHE_THRESHOLD cosine similarity with it.
+ANSWER_CACHE_ENABLED = os.getenv("CONNECTSENSE_ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_PATH = os.getenv("CONNECTSENSE_ANSWER_CACHE_PATH", "cache/answers.sqlite")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("CONNECTSENSE_ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("CONNECTSENSE_ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("CONNECTSENSE_ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+# On-disk query/document embedding cache shared across sessions and processes
+EMBEDDING_CACHE_ENABLED = os.getenv("CONNECTSENSE_EMBEDDING_CACHE", "1") == "1"
+EMBEDDING_CACHE_PATH = os.getenv("CONNECTSENSE_EMBEDDING_CACHE_PATH", "cache/embeddings.sqlite")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("CONNECTSENSE_EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+EMBEDDING_CACHE_MEMORY_ENTRIES = 256
+
+# Query service: worker pool size, how many queries may wait before new ones are
+# rejected, per-provider concurrency and retries of rate-limited (HTTP 429) calls
+QUERY_MAX_CONCURRENCY = int(os.getenv("CONNECTSENSE_QUERY_CONCURRENCY", "8"))
+QUERY_MAX_QUEUE = int(os.getenv("CONNECTSENSE_QUERY_QUEUE", "32"))
+PROVIDER_CONCURRENCY = {
+    "Groq": int(os.getenv("CONNECTSENSE_GROQ_CONCURRENCY", "4")),
+    "Gemini": int(os.getenv("CONNECTSENSE_GEMINI_CONCURRENCY", "4")),
+}
+RATE_LIMIT_RETRIES = 3
+RATE_LIMIT_BACKOFF = 1.0
+# Batch question answering (batch_qa.py): questions answered at once (further limited by
+# the query service and per-provider limits) and characters kept per source excerpt
+BATCH_CONCURRENCY = int(os.getenv("CONNECTSENSE_BATCH_CONCURRENCY", "6"))
+BATCH_SOURCE_EXCERPT_CHARS = 300
+# RAG service (rag_server.py): retrieval and generation served over HTTP on localhost by
+# RAG_SERVER_WORKERS pre-forked processes that share the memory-mapped store. With
+# CONNECTSENSE_RAG_SERVICE set (e.g. http://127.0.0.1:8765) the app sends questions there
+# instead of loading the index and LLM clients itself.
+RAG_SERVICE_URL = os.getenv("CONNECTSENSE_RAG_SERVICE", "")
+RAG_SERVICE_TIMEOUT = float(os.getenv("CONNECTSENSE_RAG_SERVICE_TIMEOUT", "120"))
+RAG_SERVER_PORT = int(os.getenv("CONNECTSENSE_RAG_PORT", "8765"))
+RAG_SERVER_WORKERS = int(os.getenv("CONNECTSENSE_RAG_WORKERS", "4"))
+
+# LLM routing: a provider call that takes longer than LLM_TIMEOUT seconds (to the first
+# token when streaming) fails over; after LLM_HEDGE_AFTER seconds the next provider is
+# started in parallel (0 disables hedging). Failed providers are demoted for a cooldown.
+LLM_TIMEOUT = float(os.getenv("CONNECTSENSE_LLM_TIMEOUT", "30"))
+LLM_HEDGE_AFTER = float(os.getenv("CONNECTSENSE_LLM_HEDGE_AFTER", "8"))
+LLM_FAILURE_COOLDOWN = 60.0
+LLM_LATENCY_WINDOW = 100
+
+# Startup: "background" imports llama-index and loads the index and provider clients on
+# a background thread while the README renders, "lazy" waits for the first question,
+# "eager" loads everything before the first page is shown
+STARTUP_MODE = os.getenv("CONNECTSENSE_STARTUP", "background")
+
+# Static assets: the logo is pre-resized to the widths it is displayed at and served
+# from STATIC_DIR (needs enableStaticServing, set in .streamlit/config.toml); with
+# CONNECTSENSE_STATIC_SERVING=0 it is inlined as a data URI encoded once per process
+LOGO_PATH = "assets/ConnectSense.jpg"
+LOGO_WIDTHS = (100, 180, 300)
+CSS_PATH = "assets/style.css"
+STATIC_DIR = "static"
+STATIC_SERVING = os.getenv("CONNECTSENSE_STATIC_SERVING", "1") == "1"
+
+# Minimum seconds between re-renders of a streaming answer
+STREAM_RENDER_INTERVAL = 0.05
+
+# Instrumentation: per-stage timings and token counts of every answered question are
+# served in Prometheus format on localhost:CONNECTSENSE_METRICS_PORT/metrics (0 = off)
+# and/or appended to a JSONL log; CONNECTSENSE_DEBUG_PANEL=1 shows the last turn's
+# breakdown in the sidebar
+METRICS_PORT = int(os.getenv("CONNECTSENSE_METRICS_PORT", "0"))
+METRICS_LOG_PATH = os.getenv("CONNECTSENSE_METRICS_LOG", "")
+DEBUG_PANEL = os.getenv("CONNECTSENSE_DEBUG_PANEL", "0") == "1"
+
+# Vector database settings
+INDEX_PATH = os.getenv("CONNECTSENSE_INDEX_PATH", "vector_db/full_index.pkl")
+# Memory-mapped FAISS store written by index_store.py; preferred over the pickle when present
+STORE_DIR = os.getenv("CONNECTSENSE_STORE_DIR", "vector_db/faiss_store")
+# Vector index type of the store: "flat" (exact), "sq8" (int8 scalar quantization, 4x
+# smaller), "ivf-sq8" / "ivfpq" (inverted lists, VECTOR_NPROBE of them searched per query;
+# PQ codes take about dim/8 bytes per vector) or any faiss.index_factory string. Quantized
+# stores keep the exact vectors in a memory-mapped file and re-score
+# VECTOR_RESCORE_FACTOR x top k candidates with them (1 disables re-scoring).
+VECTOR_INDEX_TYPE = os.getenv("CONNECTSENSE_VECTOR_INDEX", "flat")
+VECTOR_NPROBE = int(os.getenv("CONNECTSENSE_VECTOR_NPROBE", "16"))
+VECTOR_RESCORE_FACTOR = int(os.getenv("CONNECTSENSE_VECTOR_RESCORE", "4"))
+# Offline ingestion (ingest.py): source documents, chunking and embedding batches.
+# The manifest records per-document content hashes so re-runs only embed changes.
+SOURCE_DIR = os.getenv("CONNECTSENSE_SOURCE_DIR", "documents")
+INGEST_MANIFEST_PATH = os.getenv("CONNECTSENSE_INGEST_MANIFEST", "vector_db/ingest_manifest.sqlite")
+CHUNK_SIZE = 1024
+CHUNK_OVERLAP = 128
+EMBED_BATCH_SIZE = 64
+INGEST_WORKERS = 4
+# Seconds between on-disk change checks of the index; set CONNECTSENSE_INDEX_HASH=1
+# to confirm changes by content hash instead of trusting mtime/size alone
+INDEX_CHECK_INTERVAL = float(os.getenv("CONNECTSENSE_INDEX_CHECK_INTERVAL", "5"))
+INDEX_SIGNATURE_HASH = os.getenv("CONNECTSENSE_INDEX_HASH", "0") == "1"
+
 SYSTEM_PROMPT = """
 # ConnectSense: South Asian Connectivity Planning Assistant
 
@@ -141,6 +307,18 @@ When relevant, refer to these case studies to provide real-world context for you
 
 Remember: You are a specialized assistant focused exclusively on South Asian public sector connectivity planning. Keep all responses within this domain and politely redirect unrelated queries back to your area of expertise."""
 
+# Short prompt for greetings and small talk: identity, introduction, languages and scope
+COMPACT_SYSTEM_PROMPT = """
+# ConnectSense: South Asian Connectivity Planning Assistant
+
+You are ConnectSense, an AI assistant specialized in public sector network planning for South Asia (Pakistan, India, Bangladesh, Nepal, Sri Lanka, Bhutan, Maldives, and Afghanistan). You help government officials, educators, healthcare administrators, and community leaders connect schools, healthcare facilities, and government services in underserved areas.
+
+When users greet you, reply warmly and briefly with this self-introduction:
+
+"Hi! I am ConnectSense, your AI assistant for public network planning in South Asia. I can help you design resilient, cost-effective connectivity solutions for schools, healthcare facilities, and government services in your region. How may I assist with your connectivity project today?"
+
+Invite them to describe their context (location, community type, environmental factors), goals (services needed) and constraints (budget, timeline, available skills). Reply in the language the user writes in; you support Hindi, Urdu, Bengali, Nepali, Sinhala, Tamil, Punjabi, and Pashto. Keep replies short and within South Asian public sector connectivity planning, politely redirecting unrelated requests."""
+
 README_CONTENT = """
 # ConnectSense: Bridging South Asia's Digital Divide
 
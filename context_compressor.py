@@ -0,0 +1,188 @@
+import math
+import re
+import time
+from collections import Counter
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore
+
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_DUPLICATE_THRESHOLD
+from hybrid_retriever import tokenize
+from metrics import count_tokens, current_trace, record_stage
+
+# Sentence boundaries: after ., ! or ? followed by whitespace, and at line breaks, so
+# headings and list items are units of their own
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\s*\n+\s*")
+
+# Terms that say nothing about which sentences answer a question
+STOPWORDS = frozenset((
+    "a an and are as at be but by can could do does for from how i if in into is it its me my of on or "
+    "our should so than that the their them then there these this those to us was we what when where "
+    "which who why will with would you your about any best need want"
+).split())
+
+# Words per shingle when comparing chunks for near-duplicates
+_SHINGLE = 5
+
+
+# (sentence, starts_line) pairs; starts_line tells whether it followed a line break
+def split_sentences(text):
+    sentences = []
+    start = 0
+    starts_line = True
+    for boundary in _SENTENCE_RE.finditer(text):
+        if text[start:boundary.start()].strip():
+            sentences.append((text[start:boundary.start()], starts_line))
+        starts_line = "\n" in boundary.group()
+        start = boundary.end()
+    if text[start:].strip():
+        sentences.append((text[start:], starts_line))
+    return sentences
+
+
+# Terms with a plural "s" dropped, so "enclosure" matches "enclosures"
+def _terms(text, stopwords=frozenset()):
+    return {term[:-1] if len(term) > 3 and term.endswith("s") and not term.endswith("ss") else term
+            for term in tokenize(text) if term not in stopwords}
+
+
+def _shingles(terms):
+    return {tuple(terms[i:i + _SHINGLE]) for i in range(max(len(terms) - _SHINGLE + 1, 1))}
+
+
+# Share of a's shingles that also occur in b
+def _containment(a, b):
+    return len(a & b) / len(a) if a else 1.0
+
+
+# Kept sentences in their original order; a line break where the text had one or where
+# sentences were left out between them
+def _join(sentences):
+    parts = [sentences[0].text]
+    for previous, sentence in zip(sentences, sentences[1:]):
+        adjacent = sentence.position == previous.position + 1
+        parts.append(("\n" if sentence.starts_line or not adjacent else " ") + sentence.text)
+    return "".join(parts)
+
+
+class _Sentence:
+    __slots__ = ("node", "position", "text", "starts_line", "terms", "tokens", "score")
+
+    def __init__(self, node, position, text, starts_line):
+        self.node = node
+        self.position = position
+        self.text = text
+        self.starts_line = starts_line
+        self.terms = _terms(text)
+        self.tokens = count_tokens(text)
+        self.score = 0.0
+
+
+# Node postprocessor that shrinks the retrieved context before synthesis:
+#   - a chunk whose word shingles are mostly (CONTEXT_DUPLICATE_THRESHOLD) contained in a
+#     higher-ranked chunk is dropped, and sentences repeated across chunks (e.g. the
+#     overlap between neighbouring chunks of one document) are kept once
+#   - sentences are scored by the question terms they contain, weighted by how rare
+#     each term is among the retrieved sentences
+#   - sentences are kept in order of relevance, then their neighbours, then the opening
+#     sentences of chunks with no match at all, until the token budget is spent; each
+#     chunk keeps its kept sentences in their original order
+# Nodes are copied, never modified, since retrieved nodes may be shared; originals()
+# maps the copies back to the retrieved nodes, for citations.
+class ContextCompressor(BaseNodePostprocessor):
+    token_budget: int = Field(default=CONTEXT_TOKEN_BUDGET)
+    duplicate_threshold: float = Field(default=CONTEXT_DUPLICATE_THRESHOLD)
+    # Sentences kept on each side of a relevant one, for context
+    neighbors: int = Field(default=1)
+    # Opening sentences kept from chunks without any question term
+    fallback_sentences: int = Field(default=2)
+    # Retrieved node by node id, for the copies returned by the last call
+    _originals: dict = PrivateAttr(default_factory=dict)
+
+    @classmethod
+    def class_name(cls):
+        return "ContextCompressor"
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        start = time.perf_counter()
+        tokens_in = 0
+        kept_nodes = []
+        kept_shingles = []
+        sentences_by_node = []
+        seen = set()
+        for node in nodes:
+            text = node.node.get_content()
+            tokens_in += count_tokens(text)
+            shingles = _shingles(tokenize(text))
+            if any(_containment(shingles, other) >= self.duplicate_threshold for other in kept_shingles):
+                continue
+            kept_shingles.append(shingles)
+            sentences = []
+            for sentence_text, starts_line in split_sentences(text):
+                # Separators such as "---" carry nothing once the text around them is trimmed
+                key = " ".join(tokenize(sentence_text))
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                sentences.append(_Sentence(len(kept_nodes), len(sentences), sentence_text.strip(), starts_line))
+            kept_nodes.append(node)
+            sentences_by_node.append(sentences)
+
+        query_terms = _terms(query_bundle.query_str, STOPWORDS) if query_bundle else set()
+        selected = self._select(sentences_by_node, query_terms)
+
+        results = []
+        tokens_out = 0
+        self._originals = {}
+        for number, node in enumerate(kept_nodes):
+            chosen = [sentence for sentence in sentences_by_node[number] if id(sentence) in selected]
+            if not chosen:
+                continue
+            text = _join(chosen)
+            tokens_out += sum(sentence.tokens for sentence in chosen)
+            copy = node.node.model_copy()
+            copy.set_content(text)
+            results.append(NodeWithScore(node=copy, score=node.score))
+            self._originals[copy.node_id] = node
+
+        record_stage("compress", time.perf_counter() - start)
+        trace = current_trace()
+        if trace is not None:
+            trace.add_context_tokens(tokens_out, tokens_in - tokens_out)
+        return results
+
+    # The retrieved, uncompressed nodes the given copies were made from
+    def originals(self, nodes):
+        return [self._originals.get(node.node.node_id, node) for node in nodes]
+
+    # ids of the sentences that fit in the token budget, by priority tier
+    def _select(self, sentences_by_node, query_terms):
+        all_sentences = [sentence for sentences in sentences_by_node for sentence in sentences]
+        document_frequency = Counter(term for sentence in all_sentences for term in sentence.terms & query_terms)
+        for sentence in all_sentences:
+            sentence.score = sum(
+                math.log(1 + len(all_sentences) / document_frequency[term]) for term in sentence.terms & query_terms
+            )
+
+        relevant = sorted((s for s in all_sentences if s.score > 0), key=lambda s: (-s.score, s.node, s.position))
+        neighbors = []
+        fallback = []
+        for sentences in sentences_by_node:
+            matched = [s.position for s in sentences if s.score > 0]
+            if not matched:
+                fallback.extend(sentences[:self.fallback_sentences])
+                continue
+            for position in matched:
+                for offset in range(1, self.neighbors + 1):
+                    for near in (position - offset, position + offset):
+                        if 0 <= near < len(sentences) and sentences[near].score == 0:
+                            neighbors.append(sentences[near])
+
+        selected = set()
+        budget = self.token_budget
+        for sentence in relevant + neighbors + fallback:
+            if id(sentence) not in selected and sentence.tokens <= budget:
+                selected.add(id(sentence))
+                budget -= sentence.tokens
+        return selected
@@ -0,0 +1,198 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    HISTORY_MESSAGES,
+    MEMORY_TOKEN_BUDGET,
+    MEMORY_ANSWER_MAX_TOKENS,
+    MEMORY_SUMMARY_MAX_WORDS,
+    MEMORY_SUMMARIZE,
+)
+from metrics import count_tokens
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and ConnectSense, a connectivity planning assistant.
+Keep the facts that later questions may depend on: the user's country, region and terrain, budget, chosen technologies, numbers and open questions.
+Reply with the updated summary only, in at most {max_words} words.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}
+"""
+
+# Summaries are written off the request path; one small pool serves all sessions
+_summary_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+
+
+# Cap a message at max_tokens, cutting at the same character proportion so the
+# truncated text doesn't have to be re-tokenized
+def _truncate(text, tokens, max_tokens):
+    if tokens <= max_tokens:
+        return text, tokens
+    return text[:len(text) * max_tokens // tokens].rstrip() + " …", max_tokens
+
+
+class Turn:
+    __slots__ = ("question", "answer", "tokens")
+
+    def __init__(self, question, question_tokens):
+        self.question = question
+        self.answer = None
+        self.tokens = question_tokens
+
+
+# Token-budgeted memory of one conversation. Messages are tokenized once, when they
+# are first synced; turns are built from the message roles, so an unanswered question or
+# an error reply doesn't shift the pairing of later turns. The newest turns that fit in
+# the token budget are sent verbatim, long answers capped at MEMORY_ANSWER_MAX_TOKENS.
+# Turns that fall out of the window are folded into a running summary by a background
+# thread, a few turns at a time, using the previous summary rather than the full history,
+# and are then dropped, so a long conversation doesn't grow the memory.
+class ConversationMemory:
+    def __init__(self, token_budget=MEMORY_TOKEN_BUDGET, max_turns=HISTORY_MESSAGES // 2,
+                 answer_max_tokens=MEMORY_ANSWER_MAX_TOKENS, summarize=MEMORY_SUMMARIZE):
+        self._token_budget = token_budget
+        self._max_turns = max_turns
+        self._answer_max_tokens = answer_max_tokens
+        self._summarize = summarize
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._turns = []
+            self._last_message = None
+            self._summary = ""
+            self._summary_tokens = 0
+            # Turns folded into the summary; they are dropped from _turns once it lands
+            self._summarized = 0
+            self._summarizing = False
+            # Summaries started before the reset are discarded
+            self._generation += 1
+
+    # Take in the messages added to chat_history since the last sync: those after the
+    # last message synced, found from the end, so a history capped at the front (see
+    # chat_store.ChatHistory) works as well as a plain list. A history that was cleared
+    # or replaced starts the memory over.
+    def sync(self, chat_history, llm=None):
+        new = None
+        if self._last_message is None:
+            new = chat_history[:]
+        else:
+            for i in range(len(chat_history) - 1, -1, -1):
+                if chat_history[i] is self._last_message:
+                    new = chat_history[i + 1:]
+                    break
+        if new is None:
+            self.reset()
+            new = chat_history[:]
+        with self._lock:
+            for message in new:
+                self._add(message)
+            if new:
+                self._last_message = new[-1]
+        if llm is not None and self._summarize:
+            self._schedule_summary(llm)
+        return self
+
+    # Start from a summary written elsewhere, e.g. by the app process of a session that
+    # the RAG service answers (see rag_server.py)
+    def set_summary(self, summary):
+        with self._lock:
+            self._summary = summary or ""
+            self._summary_tokens = count_tokens(summary) if summary else 0
+        return self
+
+    def _add(self, message):
+        content = message.get("content") or ""
+        if message.get("role") == "user":
+            self._turns.append(Turn(content, count_tokens(content)))
+        elif message.get("role") == "assistant" and not message.get("error"):
+            # Only the first reply to a question is kept; error replies are skipped
+            if self._turns and self._turns[-1].answer is None:
+                turn = self._turns[-1]
+                turn.answer, tokens = _truncate(content, count_tokens(content), self._answer_max_tokens)
+                turn.tokens += tokens
+
+    # Index of the oldest turn kept verbatim: the newest turns that fit in the budget
+    # left over by the summary, at most max_turns of them
+    def _window_start(self):
+        budget = self._token_budget - self._summary_tokens
+        start = len(self._turns)
+        while start > 0 and len(self._turns) - start < self._max_turns:
+            if self._turns[start - 1].tokens > budget:
+                break
+            budget -= self._turns[start - 1].tokens
+            start -= 1
+        return start
+
+    # Running summary and the verbatim (question, answer) turns after it. Turns that left
+    # the window but are still being summarized are left out until the summary lands.
+    def window(self):
+        with self._lock:
+            start = self._window_start()
+            return self._summary, [(turn.question, turn.answer) for turn in self._turns[start:]]
+
+    # Chat messages for the engines; only the in-process answer path needs them, so the
+    # app imports this module in service mode without llama-index
+    def messages(self):
+        from llama_index.core.llms import ChatMessage, MessageRole
+
+        summary, turns = self.window()
+        messages = []
+        if summary:
+            messages.append(ChatMessage(role=MessageRole.SYSTEM, content=f"Summary of the earlier conversation: {summary}"))
+        for question, answer in turns:
+            messages.append(ChatMessage(role=MessageRole.USER, content=question))
+            if answer is not None:
+                messages.append(ChatMessage(role=MessageRole.ASSISTANT, content=answer))
+        return messages
+
+    def stats(self):
+        with self._lock:
+            start = self._window_start()
+            return {
+                "turns": self._summarized + len(self._turns),
+                "verbatim_turns": len(self._turns) - start,
+                "summarized_turns": self._summarized,
+                "tokens": self._summary_tokens + sum(turn.tokens for turn in self._turns[start:]),
+                "summarizing": self._summarizing,
+            }
+
+    def _schedule_summary(self, llm):
+        with self._lock:
+            end = self._window_start()
+            if self._summarizing or end == 0:
+                return
+            self._summarizing = True
+            generation = self._generation
+            summary = self._summary
+            turns = self._turns[:end]
+        _summary_pool.submit(self._update_summary, llm, generation, summary, turns, end)
+
+    def _update_summary(self, llm, generation, summary, turns, end):
+        text = "\n".join(
+            f"User: {turn.question}\nAssistant: {turn.answer if turn.answer is not None else '(no answer)'}"
+            for turn in turns
+        )
+        prompt = SUMMARY_PROMPT.format(max_words=MEMORY_SUMMARY_MAX_WORDS, summary=summary or "(empty)", turns=text)
+        try:
+            new_summary = str(llm.complete(prompt)).strip()
+        except Exception:
+            # Keep the previous summary; the turns are retried on the next sync
+            new_summary = None
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._summarizing = False
+            if new_summary:
+                self._summary = new_summary
+                self._summary_tokens = count_tokens(new_summary)
+                # Summarized turns are not needed verbatim any more
+                del self._turns[:end]
+                self._summarized += end
+        # Summarizing may have shrunk the window further
+        if new_summary:
+            self._schedule_summary(llm)
@@ -0,0 +1,129 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_MEMORY_ENTRIES
+from sqlite_store import connect
+
+
+# Size-bounded on-disk embedding store shared by every session and process. Vectors are
+# stored as raw float32 blobs keyed by a hash of (model, kind, text); the least recently
+# used rows are evicted once the table grows past max_entries.
+class EmbeddingStore:
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+        self._conn = connect(path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)")
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", keys
+            ).fetchall()
+            if rows:
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(time.time(), key) for key, _ in rows],
+                    )
+        return {key: np.frombuffer(vector, dtype="float32").tolist() for key, vector in rows}
+
+    def put_many(self, items):
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype="float32").tobytes(), now) for key, vector in items]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            # Counting rows is a table scan, so only enforce the bound every few hundred puts
+            self._puts_since_evict += len(rows)
+            if self._puts_since_evict >= 256:
+                self._puts_since_evict = 0
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    "SELECT key FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+
+# Embedding model wrapper that serves repeated texts from a small in-process LRU and the
+# shared on-disk store, and only calls the wrapped model for texts it has never seen.
+# Query and document embeddings are cached separately since providers such as Gemini
+# embed them with different task types.
+class CachedEmbedding(BaseEmbedding):
+    _embed_model = PrivateAttr()
+    _store = PrivateAttr()
+    _memory = PrivateAttr()
+    _memory_lock = PrivateAttr()
+
+    def __init__(self, embed_model, store=None, **kwargs):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._store = store or EmbeddingStore()
+        self._memory = OrderedDict()
+        self._memory_lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls):
+        return "CachedEmbedding"
+
+    def _key(self, kind, text):
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode()).hexdigest()
+
+    def _remember(self, key, embedding):
+        with self._memory_lock:
+            self._memory[key] = embedding
+            self._memory.move_to_end(key)
+            while len(self._memory) > EMBEDDING_CACHE_MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+
+    # Look texts up in memory, then on disk; embed the misses in one batch
+    def _cached(self, kind, texts, embed_fn):
+        keys = [self._key(kind, text) for text in texts]
+        found = {}
+        with self._memory_lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+        found.update(self._store.get_many([key for key in keys if key not in found]))
+
+        missing = list({key: text for key, text in zip(keys, texts) if key not in found}.items())
+        if missing:
+            embeddings = embed_fn([text for _, text in missing])
+            new_items = [(key, embedding) for (key, _), embedding in zip(missing, embeddings)]
+            self._store.put_many(new_items)
+            found.update(new_items)
+
+        for key in keys:
+            self._remember(key, found[key])
+        return [found[key] for key in keys]
+
+    def _get_query_embedding(self, query):
+        return self._cached("query", [query], lambda texts: [self._embed_model.get_query_embedding(texts[0])])[0]
+
+    async def _aget_query_embedding(self, query):
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts):
+        return self._cached("text", texts, self._embed_model.get_text_embedding_batch)
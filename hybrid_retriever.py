@@ -0,0 +1,290 @@
+import math
+import os
+import re
+import threading
+import time
+import weakref
+from collections import Counter, defaultdict
+
+import numpy as np
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore
+
+from config import (
+    SIMILARITY_TOP_K,
+    RETRIEVAL_CANDIDATE_K,
+    RRF_K,
+    RERANKER_ENABLED,
+    RERANKER_MODEL,
+    RERANK_CANDIDATES,
+    RETRIEVAL_MODE,
+    PARTITIONED_RETRIEVAL,
+)
+from index_store import BM25_DIR, get_partitions, get_store_dir
+from metrics import record_stage
+from regions import query_partitions
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+# Lowercased alphanumeric terms, so acronyms and codes like "TRCSL", "GPON" or "IP67"
+# stay whole tokens
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+# Okapi BM25 inverted index over the index's nodes, held in flat arrays: the sorted
+# vocabulary (UTF-8 bytes and offsets), each term's postings (document numbers and term
+# frequencies) and the document lengths. Documents are numbered by vector store row.
+# The arrays are written with each store version (see index_store.write_store) and
+# memory-mapped on load, so worker processes share them through the page cache and
+# nothing is read from the docstore; for the legacy pickle they are built in memory
+# from the node texts.
+class BM25Index:
+    ARRAYS = ("terms", "term_offsets", "postings_offsets", "docs", "tfs", "lengths")
+
+    def __init__(self, arrays, node_ids, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        for name in self.ARRAYS:
+            setattr(self, f"_{name}", arrays[name])
+        # Sequence mapping document numbers to node ids
+        self._node_ids = node_ids
+        self.avg_length = float(self._lengths.mean()) if len(self._lengths) else 0.0
+
+    # Arrays of an index over the given texts, in document order
+    @staticmethod
+    def build_arrays(texts):
+        postings = defaultdict(list)
+        lengths = []
+        for doc, text in enumerate(texts):
+            terms = Counter(tokenize(text))
+            lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                postings[term].append((doc, tf))
+        vocabulary = sorted(postings)
+        encoded = [term.encode() for term in vocabulary]
+        counts = [len(postings[term]) for term in vocabulary]
+        return {
+            "terms": np.frombuffer(b"".join(encoded), dtype="uint8"),
+            "term_offsets": np.concatenate(([0], np.cumsum([len(term) for term in encoded]))).astype("int64"),
+            "postings_offsets": np.concatenate(([0], np.cumsum(counts))).astype("int64"),
+            "docs": np.array([doc for term in vocabulary for doc, _ in postings[term]], dtype="int32"),
+            "tfs": np.array([tf for term in vocabulary for _, tf in postings[term]], dtype="int32"),
+            "lengths": np.array(lengths, dtype="int32"),
+        }
+
+    @staticmethod
+    def save_arrays(arrays, path):
+        os.makedirs(path)
+        for name in BM25Index.ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), arrays[name])
+
+    # Memory-map an index saved with save_arrays; node_ids maps document numbers to node ids
+    @classmethod
+    def load(cls, path, node_ids):
+        return cls({name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in cls.ARRAYS}, node_ids)
+
+    # Build an in-memory index from the nodes of a loaded index (legacy pickle, or a store
+    # written before BM25 was persisted with it)
+    @classmethod
+    def from_index(cls, index):
+        node_ids = list(index.index_struct.nodes_dict.values())
+        nodes = index.docstore.get_nodes(node_ids)
+        return cls(cls.build_arrays(node.get_content() for node in nodes), node_ids)
+
+    def __len__(self):
+        return len(self._lengths)
+
+    # Number of a term in the sorted vocabulary, or None
+    def _term_id(self, term):
+        key = term.encode()
+        lo, hi = 0, len(self._term_offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self._term_offsets) - 1 and self._term(lo) == key else None
+
+    def _term(self, number):
+        return self._terms[self._term_offsets[number]:self._term_offsets[number + 1]].tobytes()
+
+    # Top k (node_id, score) pairs for the query, only among `allowed` node ids if given
+    def search(self, query, k, allowed=None):
+        count = len(self)
+        scores = np.zeros(count)
+        for term in set(tokenize(query)):
+            number = self._term_id(term)
+            if number is None:
+                continue
+            start, end = self._postings_offsets[number], self._postings_offsets[number + 1]
+            docs = self._docs[start:end]
+            tfs = self._tfs[start:end].astype("float64")
+            idf = math.log(1 + (count - (end - start) + 0.5) / (end - start + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[docs] / self.avg_length)
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+        matched = np.flatnonzero(scores)
+        results = []
+        for doc in matched[np.argsort(-scores[matched], kind="stable")].tolist():
+            node_id = self._node_ids[doc]
+            if allowed is not None and node_id not in allowed:
+                continue
+            results.append((node_id, float(scores[doc])))
+            if len(results) == k:
+                break
+        return results
+
+
+# Node ids of a store's documents: BM25 document numbers are vector store rows
+class _RowNodeIds:
+    def __init__(self, nodes_dict):
+        self._nodes_dict = nodes_dict
+
+    def __getitem__(self, row):
+        return self._nodes_dict[str(row)]
+
+
+_bm25_lock = threading.Lock()
+_bm25_indexes = weakref.WeakKeyDictionary()
+
+
+# BM25 index for a loaded vector index, shared by all sessions: memory-mapped from the
+# store version it was loaded from, or built from the nodes when the store has none.
+# resources.py loads it together with the index, so queries never wait for a build.
+def get_bm25_index(index):
+    with _bm25_lock:
+        if index not in _bm25_indexes:
+            store_dir = get_store_dir(index)
+            path = os.path.join(store_dir, BM25_DIR) if store_dir else None
+            if path and os.path.exists(path):
+                _bm25_indexes[index] = BM25Index.load(path, _RowNodeIds(index.index_struct.nodes_dict))
+            else:
+                _bm25_indexes[index] = BM25Index.from_index(index)
+        return _bm25_indexes[index]
+
+
+_reranker_lock = threading.Lock()
+_reranker = None
+
+
+# Optional CPU-only cross-encoder reranker, loaded once per process. Needs the
+# sentence-transformers package, which is not a default requirement.
+def get_reranker():
+    global _reranker
+    if not RERANKER_ENABLED:
+        return None
+    with _reranker_lock:
+        if _reranker is None:
+            from llama_index.core.postprocessor import SentenceTransformerRerank
+
+            _reranker = SentenceTransformerRerank(model=RERANKER_MODEL, top_n=SIMILARITY_TOP_K, device="cpu")
+        return _reranker
+
+
+# Reciprocal rank fusion of several ranked lists of node ids
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, node_id in enumerate(ranking):
+            scores[node_id] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+# Dense + BM25 retriever. Both retrievers return candidate_k candidates which are fused
+# with reciprocal rank fusion; the fused list is optionally reranked by a local
+# cross-encoder before keeping top_k. When the question names a country or terrain and
+# the store has region partitions, both only consider the chunks in those partitions.
+# Per-stage timings of the last retrieval in the calling thread are available from
+# last_timings().
+class HybridRetriever(BaseRetriever):
+    def __init__(self, index, top_k=SIMILARITY_TOP_K, candidate_k=RETRIEVAL_CANDIDATE_K,
+                 reranker=None, rerank_candidates=RERANK_CANDIDATES, use_vector=True, use_bm25=True,
+                 partitioned=PARTITIONED_RETRIEVAL):
+        super().__init__()
+        self._index = index
+        self._vector_retriever = index.as_retriever(similarity_top_k=candidate_k)
+        self._bm25 = get_bm25_index(index) if use_bm25 else None
+        self._partitions = get_partitions(index) if partitioned else None
+        self._use_vector = use_vector
+        self._top_k = top_k
+        self._candidate_k = candidate_k
+        self._reranker = reranker
+        self._rerank_candidates = rerank_candidates
+        self._local = threading.local()
+
+    def last_timings(self):
+        return dict(getattr(self._local, "timings", {}))
+
+    # Partitions to search for the question, or None to search the whole index
+    def _select_partitions(self, question):
+        if self._partitions is None:
+            return None
+        names = query_partitions(question)
+        if not names:
+            return None
+        names, size = self._partitions.select(names)
+        return names if size >= self._candidate_k else None
+
+    def _retrieve(self, query_bundle):
+        timings = {}
+        rankings = []
+        nodes_by_id = {}
+        partitions = self._select_partitions(query_bundle.query_str)
+
+        if self._use_vector:
+            # Embed explicitly so the embedding call and the vector search are timed apart
+            if query_bundle.embedding is None and query_bundle.embedding_strs:
+                start = time.perf_counter()
+                query_bundle.embedding = self._index._embed_model.get_agg_embedding_from_queries(
+                    query_bundle.embedding_strs
+                )
+                timings["embed"] = time.perf_counter() - start
+            start = time.perf_counter()
+            if partitions:
+                # Rows of the partition indexes are rows of the main index
+                rows = self._partitions.search(partitions, query_bundle.embedding, self._candidate_k)
+                rankings.append([self._index.index_struct.nodes_dict[str(row)] for row, _ in rows])
+            else:
+                vector_results = self._vector_retriever.retrieve(query_bundle)
+                nodes_by_id.update({result.node.node_id: result.node for result in vector_results})
+                rankings.append([result.node.node_id for result in vector_results])
+            timings["vector"] = time.perf_counter() - start
+
+        if self._bm25 is not None:
+            start = time.perf_counter()
+            allowed = None
+            if partitions:
+                allowed = self._partitions.node_ids(partitions, self._index.index_struct.nodes_dict)
+            ranking = self._bm25.search(query_bundle.query_str, self._candidate_k, allowed=allowed)
+            rankings.append([node_id for node_id, _ in ranking])
+            timings["bm25"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        fused = reciprocal_rank_fusion(rankings)
+        keep = self._rerank_candidates if self._reranker else self._top_k
+        fused = fused[:keep]
+        missing = [node_id for node_id, _ in fused if node_id not in nodes_by_id]
+        if missing:
+            nodes_by_id.update({node.node_id: node for node in self._index.docstore.get_nodes(missing)})
+        results = [NodeWithScore(node=nodes_by_id[node_id], score=score) for node_id, score in fused]
+        timings["fuse"] = time.perf_counter() - start
+
+        if self._reranker and results:
+            start = time.perf_counter()
+            results = self._reranker.postprocess_nodes(results, query_bundle=query_bundle)[:self._top_k]
+            timings["rerank"] = time.perf_counter() - start
+
+        self._local.timings = timings
+        for stage, seconds in timings.items():
+            record_stage(stage, seconds)
+        return results
+
+
+# Retriever used for answering: hybrid by default, plain dense retrieval when
+# CONNECTSENSE_RETRIEVAL=vector
+def build_retriever(index, mode=RETRIEVAL_MODE):
+    if mode == "vector":
+        return index.as_retriever(similarity_top_k=SIMILARITY_TOP_K)
+    return HybridRetriever(index, reranker=get_reranker())
@@ -0,0 +1,470 @@
+import argparse
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+import weakref
+from collections import defaultdict
+
+import faiss
+import numpy as np
+from llama_index.core import StorageContext, VectorStoreIndex, load_index_from_storage
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.index_store.keyval_index_store import KVIndexStore
+from llama_index.vector_stores.faiss import FaissVectorStore
+
+from config import INDEX_PATH, STORE_DIR, VECTOR_INDEX_TYPE, VECTOR_NPROBE, VECTOR_RESCORE_FACTOR
+from regions import node_partitions, tag_node
+from sqlite_store import SQLiteKVStore
+
+# Persisted store layout: vectors live in a FAISS index that is memory-mapped on load,
+# node text/metadata and the index struct live in a SQLite file read key by key.
+# partitions/ holds one smaller FAISS index per country and terrain tag (see regions.py)
+# with the vectors of the chunks carrying that tag, ids being their rows in vectors.faiss.
+# A quantized store (VECTOR_INDEX_TYPE other than "flat") also keeps the exact vectors
+# as raw float32 rows in vectors.f32, memory-mapped and only read to re-score candidates.
+# bm25/ holds the BM25 postings of the chunk texts (see hybrid_retriever.BM25Index).
+# Each write goes to a new directory under versions/, and the CURRENT file names the
+# version in use; replacing CURRENT is the atomic switch to a new version. Stores
+# written before versioning keep their files directly in the store directory.
+# readers/ holds one empty file, named after the process id, per store loaded from the
+# directory and still in use, so writers don't delete files a running process may open.
+VECTORS_FILE = "vectors.faiss"
+EXACT_VECTORS_FILE = "vectors.f32"
+DOCSTORE_FILE = "docstore.sqlite"
+PARTITIONS_DIR = "partitions"
+PARTITIONS_MANIFEST = "partitions.json"
+BM25_DIR = "bm25"
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+READERS_DIR = "readers"
+
+# Named vector index types; any other value is passed to faiss.index_factory as is
+INDEX_TYPES = {
+    "flat": "Flat",
+    "sq8": "SQ8",
+    "ivf-sq8": "IVF{nlist},SQ8",
+    "ivfpq": "IVF{nlist},PQ{m}x{nbits}",
+}
+
+
+# Directory of the current version of a store: the one CURRENT names, or the store
+# directory itself for an unversioned store. Files of one version must all be read
+# from the directory returned by a single call.
+def current_dir(persist_dir=STORE_DIR):
+    try:
+        with open(os.path.join(persist_dir, CURRENT_FILE)) as f:
+            return os.path.join(persist_dir, VERSIONS_DIR, f.read().strip())
+    except FileNotFoundError:
+        return persist_dir
+
+
+# Name of the current version of a store; None for an unversioned store
+def store_version(persist_dir=STORE_DIR):
+    version_dir = current_dir(persist_dir)
+    return os.path.basename(version_dir) if version_dir != persist_dir else None
+
+
+def vectors_path(persist_dir=STORE_DIR):
+    return os.path.join(current_dir(persist_dir), VECTORS_FILE)
+
+
+# faiss.index_factory description of an index type for `count` vectors of `dim`
+# dimensions: about 4 * sqrt(count) inverted lists, and PQ codes of roughly dim / 8
+# bytes (fewer bits per code for corpora too small to train 256 centroids)
+def index_description(index_type, count, dim):
+    nlist = max(1, min(int(4 * np.sqrt(count)), count // 39))
+    m = next(m for m in range(max(1, dim // 8), 0, -1) if dim % m == 0)
+    nbits = 8 if count >= 256 else max(1, int(np.log2(count)))
+    return INDEX_TYPES.get(index_type, index_type).format(nlist=nlist, m=m, nbits=nbits)
+
+
+# Train and fill an inner-product index of the given type with (normalized) vectors
+def build_vector_index(vectors, index_type=VECTOR_INDEX_TYPE):
+    index = faiss.index_factory(vectors.shape[1], index_description(index_type, *vectors.shape),
+                                faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+# Search `index`, re-scoring factor * k candidates against the exact vectors when given.
+# Returns FAISS-style (scores, rows) arrays of shape (1, k), padded with row -1.
+def search_rescored(index, exact, query, k, factor=VECTOR_RESCORE_FACTOR):
+    if exact is None or factor <= 1:
+        return index.search(query, k)
+    _, candidates = index.search(query, k * factor)
+    # Sorted rows read the memory-mapped file in order
+    rows = np.sort(candidates[0][candidates[0] >= 0])
+    scores = exact[rows] @ query[0]
+    order = np.argsort(-scores)[:k]
+    out_scores = np.full((1, k), -np.inf, dtype="float32")
+    out_rows = np.full((1, k), -1, dtype="int64")
+    out_scores[0, :len(order)] = scores[order]
+    out_rows[0, :len(order)] = rows[order]
+    return out_scores, out_rows
+
+
+# Quantized FAISS index as seen by FaissVectorStore: searches nprobe inverted lists
+# and re-scores the candidates with the exact vectors
+class QuantizedIndex:
+    def __init__(self, index, exact=None, nprobe=VECTOR_NPROBE, rescore_factor=VECTOR_RESCORE_FACTOR):
+        self.index = index
+        self.exact = exact
+        self.rescore_factor = rescore_factor
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = min(nprobe, ivf.nlist)
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    @property
+    def d(self):
+        return self.index.d
+
+    def search(self, query, k):
+        return search_rescored(self.index, self.exact, query, k, self.rescore_factor)
+
+    def reconstruct(self, row):
+        return np.array(self.exact[row]) if self.exact is not None else self.index.reconstruct(row)
+
+
+# Exact vectors of a quantized store, or None for a flat one
+def load_exact_vectors(persist_dir, dim):
+    path = os.path.join(current_dir(persist_dir), EXACT_VECTORS_FILE)
+    if not os.path.exists(path):
+        return None
+    return np.memmap(path, dtype="float32", mode="r").reshape(-1, dim)
+
+
+# IO_FLAG_MMAP only maps the inverted lists of IVF indexes; flat and scalar-quantized
+# codes (and IndexIDMap partitions over them) would still be read onto the heap of every
+# process. IO_FLAG_MMAP_IFC maps the codes of all index types; older faiss builds
+# without it fall back to IO_FLAG_MMAP.
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def _read_index(path):
+    return faiss.read_index(path, _MMAP_FLAGS)
+
+
+# The main vector index of a store, wrapped for nprobe and re-scoring when quantized
+def load_vector_index(persist_dir=STORE_DIR):
+    index = _read_index(vectors_path(persist_dir))
+    exact = load_exact_vectors(persist_dir, index.d)
+    if exact is None and faiss.try_extract_index_ivf(index) is None:
+        return index
+    return QuantizedIndex(index, exact)
+
+
+def store_exists(persist_dir=STORE_DIR):
+    version_dir = current_dir(persist_dir)
+    return os.path.exists(vectors_path(version_dir)) and os.path.exists(os.path.join(version_dir, DOCSTORE_FILE))
+
+
+# Vector partitions of a store, memory-mapped like the main index. In a quantized
+# store they are int8-quantized and re-scored with the exact vectors.
+class Partitions:
+    def __init__(self, persist_dir, manifest, exact=None):
+        self._dir = os.path.join(persist_dir, PARTITIONS_DIR)
+        self.sizes = manifest
+        self._exact = exact
+        self._indexes = {}
+        self._node_ids = {}
+        self._lock = threading.Lock()
+
+    def _index(self, name):
+        with self._lock:
+            if name not in self._indexes:
+                self._indexes[name] = _read_index(os.path.join(self._dir, f"{name}.faiss"))
+            return self._indexes[name]
+
+    # The given partitions that exist, and the number of chunks they hold together
+    # (a chunk may be in several)
+    def select(self, names):
+        names = [name for name in names if name in self.sizes]
+        return names, sum(self.sizes[name] for name in names)
+
+    # Ids of the chunks in the given partitions; nodes_dict maps main index rows to node ids
+    def node_ids(self, names, nodes_dict):
+        node_ids = set()
+        for name in names:
+            if name not in self._node_ids:
+                rows = faiss.vector_to_array(self._index(name).id_map)
+                self._node_ids[name] = frozenset(nodes_dict[str(row)] for row in rows.tolist())
+            node_ids.update(self._node_ids[name])
+        return node_ids
+
+    # Top k (row, score) pairs over the given partitions
+    def search(self, names, query_embedding, k):
+        query = np.asarray([query_embedding], dtype="float32")
+        best = {}
+        for name in names:
+            scores, rows = search_rescored(self._index(name), self._exact, query, k)
+            for score, row in zip(scores[0].tolist(), rows[0].tolist()):
+                if row >= 0 and score > best.get(row, -np.inf):
+                    best[row] = score
+        return sorted(best.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def load_partitions(persist_dir=STORE_DIR, exact=None):
+    persist_dir = current_dir(persist_dir)
+    path = os.path.join(persist_dir, PARTITIONS_DIR, PARTITIONS_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return Partitions(persist_dir, json.load(f), exact)
+
+
+_partitions = weakref.WeakKeyDictionary()
+_store_dirs = weakref.WeakKeyDictionary()
+
+
+# Partitions of a loaded store; None for stores written before partitioning and for
+# the legacy pickle
+def get_partitions(index):
+    return _partitions.get(index)
+
+
+# Version directory a loaded store was read from; None for the legacy pickle
+def get_store_dir(index):
+    return _store_dirs.get(index)
+
+
+def _remove_reader(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# Mark a directory as read by this process until `owner` is garbage collected
+def _add_reader(directory, owner):
+    readers_dir = os.path.join(directory, READERS_DIR)
+    path = os.path.join(readers_dir, f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+    try:
+        os.makedirs(readers_dir, exist_ok=True)
+        open(path, "w").close()
+    except OSError:
+        # A read-only store is not written to, so nothing prunes it either
+        return
+    weakref.finalize(owner, _remove_reader, path)
+
+
+def _process_alive(pid):
+    if os.name == "nt":
+        # os.kill would terminate the process; markers of crashed processes then stay
+        # until the directory is deleted by hand
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Whether a running process still reads from a directory
+def _in_use(directory):
+    try:
+        names = os.listdir(os.path.join(directory, READERS_DIR))
+    except FileNotFoundError:
+        return False
+    return any(_process_alive(int(name.split("-")[0])) for name in names)
+
+
+# Open the persisted store. Only the FAISS header is read eagerly; vector pages and
+# docstore rows are paged in as queries touch them. The version directory is marked as
+# in use for as long as the returned index is.
+def load_store(persist_dir=STORE_DIR, embed_model=None):
+    persist_dir = current_dir(persist_dir)
+    faiss_index = load_vector_index(persist_dir)
+    kvstore = SQLiteKVStore(os.path.join(persist_dir, DOCSTORE_FILE), read_only=True)
+    storage_context = StorageContext.from_defaults(
+        vector_store=FaissVectorStore(faiss_index=faiss_index),
+        docstore=KVDocumentStore(kvstore),
+        index_store=KVIndexStore(kvstore),
+    )
+    index = load_index_from_storage(storage_context, embed_model=embed_model)
+    _partitions[index] = load_partitions(persist_dir, getattr(faiss_index, "exact", None))
+    _store_dirs[index] = persist_dir
+    _add_reader(persist_dir, index)
+    return index
+
+
+# One FAISS index per partition, holding the rows of the chunks tagged with it
+def _write_partitions(nodes, vectors, persist_dir, quantized=False):
+    members = defaultdict(list)
+    for row, node in enumerate(nodes):
+        for name in node_partitions(node.metadata):
+            members[name].append(row)
+    partitions_dir = os.path.join(persist_dir, PARTITIONS_DIR)
+    os.makedirs(partitions_dir)
+    for name, rows in members.items():
+        if quantized:
+            inner = faiss.IndexScalarQuantizer(vectors.shape[1], faiss.ScalarQuantizer.QT_8bit,
+                                               faiss.METRIC_INNER_PRODUCT)
+            inner.train(vectors[rows])
+        else:
+            inner = faiss.IndexFlatIP(vectors.shape[1])
+        partition = faiss.IndexIDMap(inner)
+        partition.add_with_ids(vectors[rows], np.array(rows, dtype="int64"))
+        faiss.write_index(partition, os.path.join(partitions_dir, f"{name}.faiss"))
+    with open(os.path.join(partitions_dir, PARTITIONS_MANIFEST), "w") as f:
+        json.dump({name: len(rows) for name, rows in sorted(members.items())}, f, indent=2)
+
+
+# Point CURRENT at a version with a single os.replace, so readers always see either the
+# old or the new version
+def _set_current(persist_dir, version):
+    path = os.path.join(persist_dir, CURRENT_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{path}.tmp", path)
+
+
+# Delete the versions other than `keep` (directories) that no running process reads
+# from. Processes only switch to a new version at their next index check, and may go on
+# reading an older one for a while after that, e.g. the partitions of a store are opened
+# on first use. The previous version is always kept, since a process may have read
+# CURRENT just before it was replaced and not have marked the version yet. The files of
+# an unversioned store go once it is neither kept nor in use.
+def _prune_versions(persist_dir, keep):
+    versions_dir = os.path.join(persist_dir, VERSIONS_DIR)
+    for name in os.listdir(versions_dir):
+        version_dir = os.path.join(versions_dir, name)
+        if version_dir not in keep and not _in_use(version_dir):
+            shutil.rmtree(version_dir, ignore_errors=True)
+    if persist_dir not in keep and not _in_use(persist_dir):
+        for name in os.listdir(persist_dir):
+            path = os.path.join(persist_dir, name)
+            if name in (VECTORS_FILE, EXACT_VECTORS_FILE, PARTITIONS_DIR, BM25_DIR) or name.startswith(DOCSTORE_FILE):
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+
+
+# Write nodes (with their embeddings already set) as a new version of a store with a
+# vector index of the given type. The version is built in its own directory and only
+# made current once complete, so a running app keeps serving the previous version.
+def write_store(nodes, persist_dir=STORE_DIR, index_type=VECTOR_INDEX_TYPE):
+    nodes = list(nodes)
+    if not nodes:
+        raise ValueError("Cannot write an empty vector store")
+    # Chunks from before region tagging (or the legacy pickle) are tagged from their own text
+    for node in nodes:
+        tag_node(node)
+
+    # Normalize so inner product search ranks by cosine similarity, as the
+    # in-memory index did
+    vectors = np.array([node.embedding for node in nodes], dtype="float32")
+    faiss.normalize_L2(vectors)
+    for node, vector in zip(nodes, vectors):
+        node.embedding = vector.tolist()
+    dim = vectors.shape[1]
+
+    version = f"v{time.time_ns()}"
+    version_dir = os.path.join(persist_dir, VERSIONS_DIR, version)
+    os.makedirs(version_dir)
+
+    faiss_index = faiss.IndexFlatIP(dim)
+    kvstore = SQLiteKVStore(os.path.join(version_dir, DOCSTORE_FILE))
+    storage_context = StorageContext.from_defaults(
+        vector_store=FaissVectorStore(faiss_index=faiss_index),
+        docstore=KVDocumentStore(kvstore),
+        index_store=KVIndexStore(kvstore),
+    )
+    # Embeddings are already on the nodes, the mock model is never called
+    VectorStoreIndex(nodes, storage_context=storage_context, embed_model=MockEmbedding(embed_dim=dim))
+    kvstore.close()
+    # Rows follow insertion order, as in the FAISS vector store, so the quantized index
+    # and the partitions can be built from the same vectors
+    quantized = index_type != "flat"
+    if quantized:
+        faiss_index = build_vector_index(vectors, index_type)
+        vectors.tofile(os.path.join(version_dir, EXACT_VECTORS_FILE))
+    faiss.write_index(faiss_index, vectors_path(version_dir))
+    _write_partitions(nodes, vectors, version_dir, quantized)
+    # BM25 postings are built here rather than on the first hybrid query of every process
+    from hybrid_retriever import BM25Index
+
+    BM25Index.save_arrays(BM25Index.build_arrays(node.get_content() for node in nodes),
+                          os.path.join(version_dir, BM25_DIR))
+
+    previous_dir = current_dir(persist_dir) if store_exists(persist_dir) else None
+    _set_current(persist_dir, version)
+    _prune_versions(persist_dir, keep={version_dir, previous_dir})
+    return len(nodes)
+
+
+# Ids of the nodes of a persisted store, read from the index struct only
+def store_node_ids(persist_dir=STORE_DIR):
+    kvstore = SQLiteKVStore(os.path.join(current_dir(persist_dir), DOCSTORE_FILE), read_only=True)
+    try:
+        return set(KVIndexStore(kvstore).index_structs()[0].nodes_dict.values())
+    finally:
+        kvstore.close()
+
+
+# Yield the nodes of a persisted store with their embeddings attached, optionally only
+# those in node_ids
+def iter_store_nodes(persist_dir=STORE_DIR, node_ids=None):
+    persist_dir = current_dir(persist_dir)
+    faiss_index = load_vector_index(persist_dir)
+    kvstore = SQLiteKVStore(os.path.join(persist_dir, DOCSTORE_FILE), read_only=True)
+    index_struct = KVIndexStore(kvstore).index_structs()[0]
+    docstore = KVDocumentStore(kvstore)
+    wanted = set(node_ids) if node_ids is not None else None
+    for row, node_id in index_struct.nodes_dict.items():
+        if wanted is not None and node_id not in wanted:
+            continue
+        node = docstore.get_node(node_id)
+        node.embedding = faiss_index.reconstruct(int(row)).tolist()
+        yield node
+    kvstore.close()
+
+
+# Yield the nodes of a pickled in-memory index with their embeddings attached
+def iter_pickle_nodes(pkl_path=INDEX_PATH):
+    with open(pkl_path, "rb") as f:
+        index = pickle.load(f)
+    vector_store = index.vector_store
+    for node_id in index.index_struct.nodes_dict.values():
+        node = index.docstore.get_node(node_id)
+        node.embedding = vector_store.get(node_id)
+        yield node
+
+
+# One-shot converter from the legacy full_index.pkl
+def convert_pickle(pkl_path=INDEX_PATH, persist_dir=STORE_DIR, index_type=VECTOR_INDEX_TYPE):
+    return write_store(iter_pickle_nodes(pkl_path), persist_dir, index_type)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the pickled vector index into a memory-mapped FAISS store")
+    parser.add_argument("--pickle", default=INDEX_PATH, help="Path of the legacy pickled index")
+    parser.add_argument("--out", default=STORE_DIR, help="Directory to write the FAISS store to")
+    parser.add_argument("--index-type", default=VECTOR_INDEX_TYPE,
+                        help="flat, sq8, ivf-sq8, ivfpq or a faiss.index_factory string")
+    parser.add_argument("--reindex", action="store_true",
+                        help="Rewrite the existing store at --out with --index-type instead of converting the pickle")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.reindex:
+        count = write_store(iter_store_nodes(args.out), args.out, args.index_type)
+    else:
+        count = convert_pickle(args.pickle, args.out, args.index_type)
+    print(f"Wrote {count} nodes to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
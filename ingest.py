@@ -0,0 +1,237 @@
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.node_parser import SentenceSplitter
+
+from config import (
+    SOURCE_DIR,
+    STORE_DIR,
+    INGEST_MANIFEST_PATH,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    EMBED_BATCH_SIZE,
+    INGEST_WORKERS,
+    VECTOR_INDEX_TYPE,
+)
+from index_store import iter_store_nodes, store_exists, store_node_ids, store_version, write_store
+from regions import document_tags, tag_node
+from sqlite_store import connect
+
+# Offline index builder. Chunks the documents under the source directory, embeds the
+# chunks in batches on a worker pool and writes the memory-mapped FAISS store. A
+# manifest of per-document content hashes makes re-runs incremental: unchanged
+# documents keep their stored chunks and vectors, changed and new ones are re-embedded,
+# and deleted ones are dropped. The manifest is checked against the store on every run,
+# as the store can be rewritten without it (index_store.py): a document whose chunks
+# are missing from the store is re-embedded, and chunks the manifest doesn't list (e.g.
+# converted from the legacy pickle) are kept unless their document is ingested now.
+# Usage: python ingest.py --source documents --workers 4
+
+
+class Manifest:
+    def __init__(self, path=INGEST_MANIFEST_PATH):
+        self._conn = connect(path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "path TEXT PRIMARY KEY, content_hash TEXT NOT NULL, node_ids TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def entries(self):
+        rows = self._conn.execute("SELECT path, content_hash, node_ids FROM documents").fetchall()
+        return {path: (content_hash, json.loads(node_ids)) for path, content_hash, node_ids in rows}
+
+    # Store version the manifest was written for
+    def store_version(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'store_version'").fetchone()
+        return row[0] if row else None
+
+    # Replace the manifest with the documents now in the store
+    def replace(self, entries, store_version):
+        now = time.time()
+        with self._conn:
+            self._conn.execute("DELETE FROM documents")
+            self._conn.executemany(
+                "INSERT INTO documents VALUES (?, ?, ?, ?)",
+                [(path, content_hash, json.dumps(node_ids), now) for path, (content_hash, node_ids) in entries.items()],
+            )
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('store_version', ?)", (store_version,))
+
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def scan_sources(source_dir):
+    hashes = {}
+    for root, _, files in os.walk(source_dir):
+        for name in sorted(files):
+            if name.startswith("."):
+                continue
+            path = os.path.join(root, name)
+            hashes[os.path.relpath(path, source_dir)] = file_hash(path)
+    return hashes
+
+
+# Chunk the given documents; returns {relative path: [nodes]}. Chunks are tagged with
+# the countries and terrains they or their document are about (regions.py).
+def chunk_documents(source_dir, rel_paths, chunk_size, chunk_overlap):
+    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    reader = SimpleDirectoryReader(input_files=[os.path.join(source_dir, p) for p in rel_paths])
+    chunks = {rel_path: [] for rel_path in rel_paths}
+    for document in reader.load_data():
+        rel_path = os.path.relpath(document.metadata["file_path"], source_dir)
+        document.metadata["source_path"] = rel_path
+        doc_tags = document_tags(document.text)
+        chunks[rel_path].extend(tag_node(node, doc_tags) for node in splitter.get_nodes_from_documents([document]))
+    return chunks
+
+
+# Embed nodes in fixed-size batches on a worker pool; returns per-batch latencies
+def embed_nodes(nodes, embed_model, batch_size, workers):
+    batches = [nodes[i:i + batch_size] for i in range(0, len(nodes), batch_size)]
+
+    def embed_batch(batch):
+        start = time.perf_counter()
+        texts = [node.get_content(metadata_mode="embed") for node in batch]
+        for node, embedding in zip(batch, embed_model.get_text_embedding_batch(texts)):
+            node.embedding = embedding
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(embed_batch, batches))
+
+
+# Source document of a stored chunk, relative to the source directory
+def _document_path(node):
+    return node.metadata.get("source_path") or node.metadata.get("file_name")
+
+
+def ingest(source_dir=SOURCE_DIR, persist_dir=STORE_DIR, manifest_path=INGEST_MANIFEST_PATH,
+           workers=INGEST_WORKERS, batch_size=EMBED_BATCH_SIZE,
+           chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, embed_model=None, index_type=VECTOR_INDEX_TYPE):
+    start = time.perf_counter()
+    manifest = Manifest(manifest_path)
+    stored_ids = store_node_ids(persist_dir) if store_exists(persist_dir) else set()
+    previous = manifest.entries() if stored_ids else {}
+    current = scan_sources(source_dir)
+    # Documents whose chunks are no longer all in the store are embedded again
+    missing = {p for p, (_, node_ids) in previous.items() if p in current and not stored_ids.issuperset(node_ids)}
+    listed_ids = {node_id for _, node_ids in previous.values() for node_id in node_ids}
+    untracked_ids = stored_ids - listed_ids
+
+    changed = sorted(p for p, h in current.items() if p not in previous or previous[p][0] != h or p in missing)
+    unchanged = sorted(p for p in current if p not in changed)
+    deleted = sorted(p for p in previous if p not in current)
+    report = {
+        "documents": len(current),
+        "new": sum(1 for p in changed if p not in previous),
+        "changed": sum(1 for p in changed if p in previous),
+        "unchanged": len(unchanged),
+        "deleted": len(deleted),
+        "missing": len(missing),
+        "store_rewritten": bool(previous) and manifest.store_version() != store_version(persist_dir),
+        "carried": 0,
+        "nodes_embedded": 0,
+        "batches": 0,
+    }
+    if not changed and not deleted:
+        if report["store_rewritten"]:
+            # Still accurate for the new version
+            manifest.replace(previous, store_version(persist_dir))
+        report["seconds"] = time.perf_counter() - start
+        return report
+
+    # Keep the stored chunks (with their vectors) of unchanged documents, and the chunks
+    # the manifest doesn't list unless their document is being embedded now
+    kept_ids = {node_id for p in unchanged for node_id in previous[p][1]}
+    nodes = []
+    if kept_ids or untracked_ids:
+        nodes = [
+            node for node in iter_store_nodes(persist_dir, kept_ids | untracked_ids)
+            if node.node_id in kept_ids or _document_path(node) not in current
+        ]
+    report["carried"] = len(nodes) - len(kept_ids)
+
+    chunks = chunk_documents(source_dir, changed, chunk_size, chunk_overlap) if changed else {}
+    new_nodes = [node for rel_path in changed for node in chunks[rel_path]]
+    if not nodes and not new_nodes:
+        # e.g. every document was deleted: an empty store can't be searched, so the
+        # app keeps serving the existing one
+        raise ValueError(f"No documents to index in {source_dir}; the vector store was left unchanged")
+
+    if embed_model is None:
+        from resources import build_embed_model
+        embed_model = build_embed_model()
+    embed_start = time.perf_counter()
+    batch_times = embed_nodes(new_nodes, embed_model, batch_size, workers)
+    embed_seconds = time.perf_counter() - embed_start
+
+    write_store(nodes + new_nodes, persist_dir, index_type)
+    entries = {p: previous[p] for p in unchanged}
+    entries.update({p: (current[p], [node.node_id for node in chunks[p]]) for p in changed})
+    manifest.replace(entries, store_version(persist_dir))
+
+    report.update({
+        "nodes_embedded": len(new_nodes),
+        "nodes_total": len(nodes) + len(new_nodes),
+        "batches": len(batch_times),
+        "batch_mean_seconds": statistics.mean(batch_times) if batch_times else 0.0,
+        "batch_max_seconds": max(batch_times) if batch_times else 0.0,
+        "embed_seconds": embed_seconds,
+        "nodes_per_second": len(new_nodes) / embed_seconds if embed_seconds else 0.0,
+        "seconds": time.perf_counter() - start,
+    })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or incrementally update the ConnectSense vector store")
+    parser.add_argument("--source", default=SOURCE_DIR, help="Directory of source documents")
+    parser.add_argument("--out", default=STORE_DIR, help="Directory of the FAISS store")
+    parser.add_argument("--manifest", default=INGEST_MANIFEST_PATH, help="Path of the ingestion manifest")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="Parallel embedding workers")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks per embedding request")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP)
+    parser.add_argument("--index-type", default=VECTOR_INDEX_TYPE,
+                        help="Vector index: flat, sq8, ivf-sq8, ivfpq or a faiss.index_factory string")
+    args = parser.parse_args()
+
+    try:
+        report = ingest(args.source, args.out, args.manifest, args.workers, args.batch_size,
+                        args.chunk_size, args.chunk_overlap, index_type=args.index_type)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    print(f"Documents: {report['documents']} ({report['new']} new, {report['changed']} changed, "
+          f"{report['unchanged']} unchanged, {report['deleted']} deleted)")
+    if report["store_rewritten"]:
+        print("The store was rewritten since the last ingestion; the manifest was checked against it")
+    if report["missing"]:
+        print(f"Re-embedding {report['missing']} documents whose chunks were missing from the store")
+    if report["nodes_embedded"] or report["deleted"]:
+        changed_docs = report["new"] + report["changed"]
+        print(f"Embedded {report['nodes_embedded']} chunks in {report['batches']} batches "
+              f"(mean {report['batch_mean_seconds']:.2f}s, max {report['batch_max_seconds']:.2f}s per batch, "
+              f"{report['nodes_per_second']:.1f} chunks/s)")
+        print(f"Store: {report['nodes_total']} chunks written to {args.out}"
+              + (f", {report['carried']} of them not from the source directory" if report["carried"] else ""))
+        print(f"Throughput: {changed_docs / report['seconds']:.2f} docs/s over {report['seconds']:.1f}s")
+    else:
+        print("Nothing to do, the store is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+import asyncio
+import contextlib
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import LLM, LLMMetadata
+
+from config import LLM_TIMEOUT, LLM_HEDGE_AFTER, LLM_FAILURE_COOLDOWN, LLM_LATENCY_WINDOW
+from metrics import count_tokens, current_trace
+
+# Providers need this many latency samples before their p50 is trusted for ordering
+_MIN_SAMPLES = 5
+
+
+class ProviderStats:
+    def __init__(self, window=LLM_LATENCY_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    def record_success(self, latency):
+        self.requests += 1
+        self.latencies.append(latency)
+        self.cooldown_until = 0.0
+
+    def record_failure(self):
+        self.requests += 1
+        self.failures += 1
+        self.cooldown_until = time.monotonic() + LLM_FAILURE_COOLDOWN
+
+    def percentile(self, q):
+        return float(np.percentile(self.latencies, q)) if self.latencies else None
+
+    @property
+    def cooling_down(self):
+        return time.monotonic() < self.cooldown_until
+
+
+def _messages_text(messages):
+    return "\n".join(message.content or "" for message in messages)
+
+
+def _start_stream(gen):
+    first = next(gen, None)
+    return first, gen
+
+
+# How often a routed call still waiting for its provider slot is checked on
+_SLOT_POLL = 0.05
+
+
+class _Abandoned(Exception):
+    pass
+
+
+# One provider call of a routed request
+class _Attempt:
+    __slots__ = ("name", "started", "latency", "timed_out", "abandoned")
+
+    def __init__(self, name):
+        self.name = name
+        # Set once the provider slot is held
+        self.started = None
+        self.latency = None
+        self.timed_out = False
+        self.abandoned = False
+
+
+# Token stream of the provider that answered, starting with its first token. release()
+# frees the provider slot once the stream is exhausted, fails or is closed (or dropped).
+class _ProviderStream:
+    def __init__(self, first, gen, release):
+        self._first = first
+        self._gen = gen
+        self._release = release
+        if first is None:
+            self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._first is not None:
+            first, self._first = self._first, None
+            return first
+        if self._gen is None:
+            raise StopIteration
+        try:
+            return next(self._gen)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        gen, self._gen = self._gen, None
+        release, self._release = self._release, None
+        try:
+            if gen is not None:
+                gen.close()
+        finally:
+            if release is not None:
+                release()
+
+    def __del__(self):
+        self.close()
+
+
+# LLM that routes every request across several providers (Groq and Gemini):
+#   - providers are tried in order of health, then rolling p50 latency, then priority
+#   - an error or a timeout fails the request over to the next provider; the timeout
+#     runs from when the call holds its provider slot
+#   - if the first provider hasn't answered after LLM_HEDGE_AFTER seconds, the next one
+#     is started as well and whichever answers first wins
+# Latency is the full call for chat/complete and time to first token for streams.
+class LLMRouter(LLM):
+    _providers = PrivateAttr()
+    _stats = PrivateAttr()
+    _stats_lock = PrivateAttr()
+    _pool = PrivateAttr()
+    _limiter = PrivateAttr()
+    _timeout = PrivateAttr()
+    _hedge_after = PrivateAttr()
+    _local = PrivateAttr()
+
+    # providers: ordered {name: llm}, highest priority first. limiter(name) returns a
+    # context manager held for each provider call, e.g. a per-provider semaphore; for
+    # streams it is held until the stream is exhausted or closed.
+    def __init__(self, providers, limiter=None, timeout=LLM_TIMEOUT, hedge_after=LLM_HEDGE_AFTER, **kwargs):
+        super().__init__(**kwargs)
+        self._providers = dict(providers)
+        self._stats = {name: ProviderStats() for name in self._providers}
+        self._stats_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-router")
+        self._limiter = limiter or (lambda name: contextlib.nullcontext())
+        self._timeout = timeout
+        self._hedge_after = hedge_after
+        self._local = threading.local()
+
+    @classmethod
+    def class_name(cls):
+        return "LLMRouter"
+
+    @property
+    def metadata(self):
+        metadatas = [llm.metadata for llm in self._providers.values()]
+        return LLMMetadata(
+            context_window=min(m.context_window for m in metadatas),
+            num_output=min(m.num_output for m in metadatas),
+            is_chat_model=True,
+            model_name="+".join(m.model_name for m in metadatas),
+        )
+
+    # Provider names, best first
+    def ranking(self):
+        priority = {name: i for i, name in enumerate(self._providers)}
+        with self._stats_lock:
+            def key(name):
+                stats = self._stats[name]
+                p50 = stats.percentile(50) if len(stats.latencies) >= _MIN_SAMPLES else None
+                return (stats.cooling_down, p50 is None, p50 or 0.0, priority[name])
+            return sorted(self._providers, key=key)
+
+    def preferred_provider(self):
+        return self.ranking()[0]
+
+    # Provider that answered the last request routed from the calling thread
+    def last_provider(self):
+        return getattr(self._local, "provider", None)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                name: {
+                    "p50": stats.percentile(50),
+                    "p95": stats.percentile(95),
+                    "requests": stats.requests,
+                    "failures": stats.failures,
+                    "cooling_down": stats.cooling_down,
+                }
+                for name, stats in self._stats.items()
+            }
+
+    # Run call(llm) on one provider once its limiter slot is held. The slot is released
+    # when the call returns, or handed to hold(result, release) to keep it longer.
+    def _timed_call(self, attempt, call, hold=None):
+        with contextlib.ExitStack() as slot:
+            slot.enter_context(self._limiter(attempt.name))
+            if attempt.abandoned:
+                # The request was answered (or failed) while this call waited for a slot
+                raise _Abandoned()
+            # Time spent waiting for the slot doesn't count against the provider
+            attempt.started = time.monotonic()
+            result = call(self._providers[attempt.name])
+            attempt.latency = time.monotonic() - attempt.started
+            if hold is not None:
+                result = hold(result, slot.pop_all().close)
+            return result
+
+    # Latency of a successful call, or a failure when latency is None
+    def _record(self, name, latency):
+        with self._stats_lock:
+            if latency is None:
+                self._stats[name].record_failure()
+            else:
+                self._stats[name].record_success(latency)
+
+    # Run call(llm) with failover and hedging, see _timed_call for hold. discard(result)
+    # releases the result of a call that lost the race or timed out. Stats are only
+    # recorded here: a call that timed out is a failure even if it answers later, and is
+    # never counted again.
+    def _route(self, call, discard=None, hold=None):
+        order = self.ranking()
+        pending = {}
+        errors = []
+        next_provider = 0
+        last_launch = 0.0
+
+        def launch():
+            nonlocal next_provider, last_launch
+            attempt = _Attempt(order[next_provider])
+            next_provider += 1
+            last_launch = time.monotonic()
+            pending[self._pool.submit(self._timed_call, attempt, call, hold)] = attempt
+
+        # A call that is no longer waited for: its result is discarded when it arrives,
+        # and it is recorded then unless it already counted as a timeout
+        def abandon(future, attempt):
+            attempt.abandoned = True
+
+            def done(f):
+                error = f.exception()
+                if isinstance(error, _Abandoned):
+                    return
+                if error is None and discard:
+                    discard(f.result())
+                if not attempt.timed_out:
+                    ok = error is None and attempt.latency <= self._timeout
+                    self._record(attempt.name, attempt.latency if ok else None)
+            future.add_done_callback(done)
+
+        launch()
+        while pending:
+            now = time.monotonic()
+            # A call only has a deadline once it holds its provider slot
+            deadlines = [a.started + self._timeout for a in pending.values() if a.started is not None]
+            if any(a.started is None for a in pending.values()):
+                deadlines.append(now + _SLOT_POLL)
+            if self._hedge_after and next_provider < len(order):
+                deadlines.append(last_launch + self._hedge_after)
+            done, _ = wait(list(pending), timeout=max(0.0, min(deadlines) - now), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                attempt = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self._record(attempt.name, None)
+                    errors.append(e)
+                    continue
+                self._record(attempt.name, attempt.latency)
+                self._local.provider = attempt.name
+                # Winner: the losers keep running in the background and are discarded
+                for loser, loser_attempt in pending.items():
+                    abandon(loser, loser_attempt)
+                return result
+
+            now = time.monotonic()
+            for future, attempt in list(pending.items()):
+                if attempt.started is not None and now >= attempt.started + self._timeout:
+                    del pending[future]
+                    attempt.timed_out = True
+                    self._record(attempt.name, None)
+                    errors.append(TimeoutError(f"{attempt.name} did not respond within {self._timeout:g}s"))
+                    abandon(future, attempt)
+
+            if next_provider < len(order):
+                hedge_due = self._hedge_after and now >= last_launch + self._hedge_after
+                if not pending or hedge_due:
+                    launch()
+
+        raise errors[-1] if errors else RuntimeError("No LLM provider available")
+
+    # Inside a trace, blocking calls are timed as the "llm" stage and streams up to the
+    # first token as "ttft"; prompt tokens are counted for both and the trace is tagged
+    # with the provider that answered the latest call
+    def _traced(self, stage, prompt_text, run, completion=True):
+        trace = current_trace()
+        if trace is None:
+            return run()
+        start = time.perf_counter()
+        result = run()
+        trace.add_stage(stage, time.perf_counter() - start)
+        trace.provider = self.last_provider()
+        trace.add_tokens(prompt=count_tokens(prompt_text), completion=count_tokens(str(result)) if completion else 0)
+        return result
+
+    # The provider slot is held until the stream is exhausted or closed, so the
+    # per-provider limit caps generations in flight, not just their first tokens
+    def _stream(self, start, prompt_text):
+        return self._traced(
+            "ttft", prompt_text,
+            lambda: self._route(
+                lambda llm: _start_stream(start(llm)),
+                discard=lambda stream: stream.close(),
+                hold=lambda result, release: _ProviderStream(*result, release),
+            ),
+            completion=False,
+        )
+
+    def chat(self, messages, **kwargs):
+        return self._traced("llm", _messages_text(messages), lambda: self._route(lambda llm: llm.chat(messages, **kwargs)))
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        return self._traced(
+            "llm", prompt, lambda: self._route(lambda llm: llm.complete(prompt, formatted=formatted, **kwargs))
+        )
+
+    def stream_chat(self, messages, **kwargs):
+        return self._stream(lambda llm: llm.stream_chat(messages, **kwargs), _messages_text(messages))
+
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        return self._stream(lambda llm: llm.stream_complete(prompt, formatted=formatted, **kwargs), prompt)
+
+    # Async variants run the synchronous routing in a worker thread
+    async def achat(self, messages, **kwargs):
+        return await asyncio.to_thread(self.chat, messages, **kwargs)
+
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        return await asyncio.to_thread(self.complete, prompt, formatted=formatted, **kwargs)
+
+    async def astream_chat(self, messages, **kwargs):
+        return self._astream(await asyncio.to_thread(self.stream_chat, messages, **kwargs))
+
+    async def astream_complete(self, prompt, formatted=False, **kwargs):
+        return self._astream(await asyncio.to_thread(self.stream_complete, prompt, formatted=formatted, **kwargs))
+
+    async def _astream(self, gen):
+        done = object()
+        while True:
+            chunk = await asyncio.to_thread(next, gen, done)
+            if chunk is done:
+                return
+            yield chunk
@@ -0,0 +1,257 @@
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import METRICS_LOG_PATH, METRICS_PORT
+
+# Histogram buckets (seconds) for per-stage latencies
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# llama-index is imported on first use, so the app can import this module in service
+# mode without it
+def count_tokens(text):
+    from llama_index.core.utils import get_tokenizer
+
+    return len(get_tokenizer()(text))
+
+
+# Timings and token counts of one answered question. Stages that run more than once in
+# a turn (e.g. two LLM calls) accumulate.
+class Trace:
+    def __init__(self, mode=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.mode = mode
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.provider = None
+        self.cached = False
+        # System prompt variant and version, tokens of its stable (cacheable) prefix and
+        # prompt tokens saved compared with the full prompt
+        self.prompt_variant = None
+        self.prompt_version = None
+        self.prefix_tokens = 0
+        self.prompt_tokens_saved = 0
+        # Retrieved context tokens sent to the LLM and removed by context compression
+        self.context_tokens = 0
+        self.context_tokens_removed = 0
+        self.status = None
+        self.total = None
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_tokens(self, prompt=0, completion=0):
+        self.prompt_tokens += prompt
+        self.completion_tokens += completion
+
+    def set_prompt(self, variant, version, prefix_tokens, saved):
+        self.prompt_variant = variant
+        self.prompt_version = version
+        self.prefix_tokens = prefix_tokens
+        self.prompt_tokens_saved = saved
+
+    def add_context_tokens(self, sent, removed):
+        self.context_tokens += sent
+        self.context_tokens_removed += removed
+
+    # Record the trace in the process metrics; status is "ok", "error" or "interrupted"
+    def finish(self, status):
+        if self.status is not None:
+            return
+        self.status = status
+        self.total = time.perf_counter() - self.start
+        get_metrics().observe(self)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "timestamp": self.started_at,
+            "mode": self.mode,
+            "provider": self.provider,
+            "cached": self.cached,
+            "status": self.status,
+            "total_ms": round(self.total * 1000, 2) if self.total is not None else None,
+            "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()},
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "prompt_variant": self.prompt_variant,
+            "prompt_version": self.prompt_version,
+            "prefix_tokens": self.prefix_tokens,
+            "prompt_tokens_saved": self.prompt_tokens_saved,
+            "context_tokens": self.context_tokens,
+            "context_tokens_removed": self.context_tokens_removed,
+        }
+
+
+# The active trace is a context variable rather than a thread-local because llama-index
+# runs streaming synthesis in a helper thread started with a copy of the caller's context
+_current = contextvars.ContextVar("connectsense_trace", default=None)
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def activate(trace):
+    previous = _current.get()
+    _current.set(trace)
+    try:
+        yield trace
+    finally:
+        # Not reset(token): a generator may be closed from another context
+        _current.set(previous)
+
+
+# For instrumented code; does nothing outside a trace
+def record_stage(name, seconds):
+    trace = current_trace()
+    if trace is not None:
+        trace.add_stage(name, seconds)
+
+
+def _labels(**labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels.items())
+
+
+# Process-wide aggregates of finished traces: a latency histogram per stage and provider,
+# token and request counters. Each trace is also appended to the JSONL log if one is set.
+class Metrics:
+    def __init__(self, log_path=METRICS_LOG_PATH):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._tokens = {}
+        self._requests = {}
+        self._prompts = {}
+        self._log = None
+        if log_path:
+            os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+            self._log = open(log_path, "a", buffering=1)
+
+    def _observe_seconds(self, stage, provider, seconds):
+        key = (stage, provider)
+        if key not in self._histograms:
+            self._histograms[key] = [[0] * len(STAGE_BUCKETS), 0.0, 0]
+        buckets, _, _ = histogram = self._histograms[key]
+        for i, bound in enumerate(STAGE_BUCKETS):
+            if seconds <= bound:
+                buckets[i] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+    def observe(self, trace):
+        provider = trace.provider or ("cache" if trace.cached else "none")
+        with self._lock:
+            for stage, seconds in trace.stages.items():
+                self._observe_seconds(stage, provider, seconds)
+            self._observe_seconds("total", provider, trace.total)
+            for kind, count in (("prompt", trace.prompt_tokens), ("completion", trace.completion_tokens)):
+                key = (kind, provider)
+                self._tokens[key] = self._tokens.get(key, 0) + count
+            key = (trace.mode or "", provider, trace.status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            if trace.prompt_variant is not None:
+                counts = self._prompts.setdefault(trace.prompt_variant, [0, 0])
+                counts[0] += trace.prefix_tokens
+                counts[1] += trace.prompt_tokens_saved
+            if self._log is not None:
+                self._log.write(json.dumps(trace.to_dict()) + "\n")
+
+    # Prometheus text exposition format
+    def render_prometheus(self):
+        lines = [
+            "# HELP connectsense_stage_seconds Latency of each RAG stage per answered question",
+            "# TYPE connectsense_stage_seconds histogram",
+        ]
+        with self._lock:
+            for (stage, provider), (buckets, total, count) in sorted(self._histograms.items()):
+                labels = _labels(stage=stage, provider=provider)
+                for bound, bucket_count in zip(STAGE_BUCKETS, buckets):
+                    lines.append(f'connectsense_stage_seconds_bucket{{{labels},le="{bound:g}"}} {bucket_count}')
+                lines.append(f'connectsense_stage_seconds_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"connectsense_stage_seconds_sum{{{labels}}} {total:.6f}")
+                lines.append(f"connectsense_stage_seconds_count{{{labels}}} {count}")
+            lines += [
+                "# HELP connectsense_tokens_total LLM tokens per kind and provider",
+                "# TYPE connectsense_tokens_total counter",
+            ]
+            for (kind, provider), count in sorted(self._tokens.items()):
+                lines.append(f"connectsense_tokens_total{{{_labels(kind=kind, provider=provider)}}} {count}")
+            lines += [
+                "# HELP connectsense_requests_total Answered questions per mode, provider and status",
+                "# TYPE connectsense_requests_total counter",
+            ]
+            for (mode, provider, status), count in sorted(self._requests.items()):
+                lines.append(f"connectsense_requests_total{{{_labels(mode=mode, provider=provider, status=status)}}} {count}")
+            lines += [
+                "# HELP connectsense_prompt_prefix_tokens_total Prompt tokens sent as a stable system prefix per prompt variant",
+                "# TYPE connectsense_prompt_prefix_tokens_total counter",
+            ]
+            for variant, (prefix, _) in sorted(self._prompts.items()):
+                lines.append(f"connectsense_prompt_prefix_tokens_total{{{_labels(variant=variant)}}} {prefix}")
+            lines += [
+                "# HELP connectsense_prompt_tokens_saved_total Prompt tokens saved by compact prompt variants",
+                "# TYPE connectsense_prompt_tokens_saved_total counter",
+            ]
+            for variant, (_, saved) in sorted(self._prompts.items()):
+                lines.append(f"connectsense_prompt_tokens_saved_total{{{_labels(variant=variant)}}} {saved}")
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = get_metrics().render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Serve /metrics on localhost in a background thread
+def serve_metrics(port=METRICS_PORT):
+    server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+_lock = threading.Lock()
+_metrics = None
+
+
+# Process-wide metrics; the /metrics endpoint is started with it on `port` (by default
+# CONNECTSENSE_METRICS_PORT, 0 = off) by the first call
+def get_metrics(port=METRICS_PORT):
+    global _metrics
+    with _lock:
+        if _metrics is None:
+            _metrics = Metrics()
+            if port:
+                try:
+                    serve_metrics(port)
+                except OSError as e:
+                    print(f"Metrics endpoint not started on port {port}: {e}")
+        return _metrics
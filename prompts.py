@@ -0,0 +1,67 @@
+import hashlib
+import re
+import unicodedata
+from functools import lru_cache
+
+from config import SYSTEM_PROMPT, COMPACT_SYSTEM_PROMPT, COMPACT_PROMPT_ENABLED
+from metrics import count_tokens
+
+# System prompt variants and their selection per request. Every request in chat mode
+# starts with the system prefix of its variant, byte for byte the same across turns and
+# sessions, and everything that changes (retrieved context, conversation memory, the
+# question) comes after it, so providers that cache prompt prefixes can reuse it.
+# PROMPT_VERSION identifies the prefix texts; it is part of the answer cache key, so
+# answers written under an edited prompt are not served.
+
+SYSTEM_PREFIXES = {
+    "full": SYSTEM_PROMPT.strip() + "\n",
+    "compact": COMPACT_SYSTEM_PROMPT.strip() + "\n",
+}
+
+PREFIX_VERSIONS = {variant: hashlib.sha256(text.encode()).hexdigest()[:8] for variant, text in SYSTEM_PREFIXES.items()}
+PROMPT_VERSION = hashlib.sha256("".join(PREFIX_VERSIONS[v] for v in sorted(PREFIX_VERSIONS)).encode()).hexdigest()[:8]
+
+# Whole messages answered with the compact prompt: greetings, thanks, farewells and
+# questions about the assistant itself, optionally addressed to it by name
+SMALL_TALK = (
+    "hi", "hii", "hello", "hey", "hiya", "greetings", "howdy", "yo", "namaste", "namaskar", "salaam",
+    "salam", "assalamu alaikum", "assalam o alaikum", "as salamu alaykum", "ayubowan", "vanakkam",
+    "kuzu zangpo", "good morning", "good afternoon", "good evening", "good day",
+    "नमस्ते", "नमस्कार", "السلام علیکم", "السلام عليكم", "আসসালামু আলাইকুম", "নমস্কার", "ආයුබෝවන්", "வணக்கம்",
+    "how are you", "how are you doing", "how is it going", "whats up", "what s up",
+    "thanks", "thank you", "thank you so much", "thanks a lot", "thx", "ty", "shukriya", "dhanyavaad",
+    "ok", "okay", "great", "cool", "nice", "awesome", "perfect", "got it",
+    "bye", "goodbye", "see you", "good night",
+    "who are you", "what are you", "what can you do", "what do you do", "help", "there", "connectsense",
+)
+
+_PHRASE = "(?:" + "|".join(re.escape(p) for p in sorted(SMALL_TALK, key=len, reverse=True)) + ")"
+_SMALL_TALK = re.compile(rf"{_PHRASE}(?: {_PHRASE})*")
+
+
+# "greeting" for small talk that needs neither retrieval nor the planning instructions,
+# "planning" for everything else
+def classify_request(text):
+    # Punctuation and symbols (emoji included) separate words like whitespace does
+    words = " ".join("".join(" " if unicodedata.category(c)[0] in "PSZC" else c for c in text.casefold()).split())
+    if words and len(words.split()) <= 8 and _SMALL_TALK.fullmatch(words):
+        return "greeting"
+    return "planning"
+
+
+def select_variant(text, compact=COMPACT_PROMPT_ENABLED):
+    return "compact" if compact and classify_request(text) == "greeting" else "full"
+
+
+def system_prefix(variant="full"):
+    return SYSTEM_PREFIXES[variant]
+
+
+@lru_cache(maxsize=None)
+def prefix_tokens(variant):
+    return count_tokens(SYSTEM_PREFIXES[variant])
+
+
+# Prompt tokens a turn avoids by using `variant` instead of the full prefix
+def tokens_saved(variant):
+    return prefix_tokens("full") - prefix_tokens(variant)
@@ -0,0 +1,210 @@
+import asyncio
+import contextlib
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    QUERY_MAX_CONCURRENCY,
+    QUERY_MAX_QUEUE,
+    PROVIDER_CONCURRENCY,
+    RATE_LIMIT_RETRIES,
+    RATE_LIMIT_BACKOFF,
+)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+# Provider SDKs raise different exception types for HTTP 429; match on what they share
+def is_rate_limit(error):
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "rate_limit" in message or "resource exhausted" in message
+
+
+# User-facing message for a failed query
+def friendly_error(error):
+    if isinstance(error, QueueFullError):
+        return "ConnectSense is handling a lot of requests right now. Please try again in a moment."
+    if is_rate_limit(error):
+        return "The language model provider is rate-limiting requests. Please try again in a minute."
+    return f"Error: {str(error)}"
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+_DONE = object()
+
+
+# Process-wide query service. Blocking llama-index calls are scheduled from an asyncio
+# loop running in a background thread onto a bounded worker pool:
+#   - at most QUERY_MAX_CONCURRENCY queries run at once, and each provider has its own
+#     concurrency limit on top of that
+#   - at most QUERY_MAX_QUEUE queries may wait; further submissions are rejected with
+#     QueueFullError instead of piling up script threads
+#   - rate-limit errors are retried with exponential backoff; the backoff sleeps on the
+#     event loop, so a waiting retry does not hold a worker
+class QueryService:
+    def __init__(self, max_concurrency=QUERY_MAX_CONCURRENCY, max_queue=QUERY_MAX_QUEUE,
+                 provider_limits=PROVIDER_CONCURRENCY, max_retries=RATE_LIMIT_RETRIES,
+                 backoff=RATE_LIMIT_BACKOFF):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._provider_limits = dict(provider_limits)
+        self._provider_slots = {}
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._retries = 0
+        self._rejected = 0
+        self._waits = deque(maxlen=100)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="query")
+        self._loop = asyncio.new_event_loop()
+        self._slots = None
+        threading.Thread(target=self._loop.run_forever, name="query-service", daemon=True).start()
+
+    # Blocking per-provider limiter, usable from any worker thread
+    @contextlib.contextmanager
+    def provider_slot(self, provider):
+        with self._lock:
+            if provider not in self._provider_slots:
+                limit = self._provider_limits.get(provider, self.max_concurrency)
+                self._provider_slots[provider] = threading.BoundedSemaphore(limit)
+            slot = self._provider_slots[provider]
+        with slot:
+            yield
+
+    def _call(self, provider, fn):
+        if provider is None:
+            return fn()
+        with self.provider_slot(provider):
+            return fn()
+
+    async def _run(self, provider, fn, enqueued_at, trace):
+        loop = asyncio.get_running_loop()
+        if self._slots is None:
+            # Created on the loop thread so it binds to the service loop
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        dequeued = False
+        status = "interrupted"
+        try:
+            for attempt in range(self.max_retries + 1):
+                async with self._slots:
+                    if not dequeued:
+                        dequeued = True
+                        with self._lock:
+                            self._queued -= 1
+                            self._in_flight += 1
+                            self._waits.append(time.monotonic() - enqueued_at)
+                        if trace is not None:
+                            # The trace was started when the query was submitted
+                            trace.add_stage("queue_wait", time.perf_counter() - trace.start)
+                    try:
+                        result = await loop.run_in_executor(self._executor, self._call, provider, fn)
+                        status = "ok"
+                        return result
+                    except Exception as e:
+                        if not is_rate_limit(e) or attempt == self.max_retries:
+                            status = "error"
+                            raise
+                with self._lock:
+                    self._retries += 1
+                await asyncio.sleep(self.backoff * 2 ** attempt * (1 + random.random() / 2))
+        finally:
+            with self._lock:
+                if dequeued:
+                    self._in_flight -= 1
+                else:
+                    self._queued -= 1
+            # Before the future completes, so its trace is final when the result is read
+            if trace is not None:
+                trace.finish(status)
+
+    # Run fn on the worker pool and return a concurrent.futures.Future for its result.
+    # Pass provider=None when fn applies per-provider limits itself (e.g. via the LLM router).
+    # A trace records the queue wait once and is finished after the last attempt, so a
+    # rate-limited attempt that is retried doesn't end it.
+    def submit(self, provider, fn, trace=None):
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                raise QueueFullError(f"{self._queued} queries already waiting")
+            self._queued += 1
+        return asyncio.run_coroutine_threadsafe(self._run(provider, fn, time.monotonic(), trace), self._loop)
+
+    # Run a token generator on the worker pool and yield its tokens in the calling thread.
+    # Rate limits are only retried before the first token; later errors are re-raised
+    # after the tokens already received. The trace is handled as in submit.
+    def stream(self, provider, stream_fn, trace=None):
+        tokens = queue.Queue()
+        cancelled = threading.Event()
+
+        def produce():
+            started = False
+            try:
+                for token in stream_fn():
+                    started = True
+                    tokens.put(token)
+                    if cancelled.is_set():
+                        if trace is not None:
+                            trace.finish("interrupted")
+                        break
+            except Exception as e:
+                if not started:
+                    raise
+                if trace is not None:
+                    trace.finish("error")
+                tokens.put(_Failure(e))
+
+        def finish(future):
+            if not future.cancelled() and future.exception() is not None:
+                tokens.put(_Failure(future.exception()))
+            tokens.put(_DONE)
+
+        self.submit(provider, produce, trace).add_done_callback(finish)
+        try:
+            while True:
+                item = tokens.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            cancelled.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": self._queued,
+                "in_flight": self._in_flight,
+                "avg_wait": sum(self._waits) / len(self._waits) if self._waits else 0.0,
+                "retries": self._retries,
+                "rejected": self._rejected,
+            }
+
+
+_lock = threading.Lock()
+_service = None
+
+
+# Process-wide service shared by all sessions
+def get_query_service():
+    global _service
+    with _lock:
+        if _service is None:
+            _service = QueryService()
+        return _service
@@ -0,0 +1,216 @@
+import time
+
+from llama_index.core import Settings
+from llama_index.core.base.llms.generic_utils import messages_to_history_str
+from llama_index.core.chat_engine import CondensePlusContextChatEngine
+from llama_index.core.chat_engine.condense_plus_context import DEFAULT_CONDENSE_PROMPT_TEMPLATE
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.prompts import PromptTemplate
+
+from answer_cache import get_answer_cache
+from config import SYSTEM_PROMPT, SIMILARITY_TOP_K, QUERY_MODE, ANSWER_CACHE_ENABLED, CONTEXT_COMPRESSION
+from context_compressor import ContextCompressor
+from conversation_memory import ConversationMemory
+from hybrid_retriever import build_retriever
+from metrics import Trace, activate, count_tokens
+from prompts import PREFIX_VERSIONS, PROMPT_VERSION, prefix_tokens, select_variant, system_prefix, tokens_saved
+
+# The full system prefix goes first in the system message and the retrieved context
+# after it, so the prefix can be cached by the provider and only the condensed question
+# is ever embedded for retrieval
+CONTEXT_PROMPT = system_prefix("full") + """
+## Retrieved Context
+
+Use the following excerpts from the ConnectSense knowledge base where they are relevant:
+
+{context_str}
+"""
+
+CONTEXT_REFINE_PROMPT = system_prefix("full") + """
+## Retrieved Context
+
+{context_msg}
+
+## Existing Answer
+
+{existing_answer}
+
+Refine the existing answer using the additional context above. If the context isn't helpful, repeat the existing answer unchanged.
+"""
+
+CONDENSE_PROMPT = PromptTemplate(DEFAULT_CONDENSE_PROMPT_TEMPLATE)
+
+
+# Memory of the session chat history (list of role/content dicts). Sessions keep one
+# ConversationMemory across turns; without one, a budgeted window is built for this call.
+def _memory(chat_history, memory=None):
+    if memory is None:
+        memory = ConversationMemory(summarize=False)
+    return memory.sync(chat_history)
+
+
+# Convert the session chat history into token-budgeted chat messages
+def to_chat_messages(chat_history, memory=None):
+    return _memory(chat_history, memory).messages()
+
+
+# Messages for an answer without retrieval: the system prefix of the variant, the
+# conversation memory and the new question
+def build_direct_messages(user_input, chat_history, variant, memory=None):
+    return [
+        ChatMessage(role=MessageRole.SYSTEM, content=system_prefix(variant)),
+        *to_chat_messages(chat_history, memory),
+        ChatMessage(role=MessageRole.USER, content=user_input),
+    ]
+
+
+# Legacy retrieval query: system prompt, recent interactions and the new question glued
+# into one string that is both embedded and sent to the LLM
+def build_legacy_query(user_input, chat_history, memory=None):
+    summary, turns = _memory(chat_history, memory).window()
+    context_str = f"### Earlier Conversation:\n{summary}\n\n" if summary else ""
+    for question, response in turns:
+        if response is not None:
+            context_str += f"### Previous Interaction:\n**User**: {question}\n**Assistant**: {response}\n\n"
+    return f"{SYSTEM_PROMPT}\n\n{context_str}\n### New Question:\n{user_input}"
+
+
+# Chat engines keep per-conversation memory, so one is built per request on top of the
+# shared index; construction only wires existing objects together. When a compressor is
+# given, the retrieved chunks are deduplicated and trimmed to the context token budget
+# before synthesis.
+def build_chat_engine(index, llm=None, compressor=None):
+    return CondensePlusContextChatEngine.from_defaults(
+        retriever=build_retriever(index),
+        llm=llm,
+        context_prompt=CONTEXT_PROMPT,
+        context_refine_prompt=CONTEXT_REFINE_PROMPT,
+        condense_prompt=CONDENSE_PROMPT,
+        node_postprocessors=[compressor] if compressor else [],
+    )
+
+
+# Rewrite a follow-up into a standalone question, as the chat engine does before retrieval
+def condense_question(llm, chat_history, user_input):
+    messages = to_chat_messages(chat_history)
+    if not messages:
+        return user_input
+    return str(llm.complete(CONDENSE_PROMPT.format(chat_history=messages_to_history_str(messages), question=user_input)))
+
+
+# Answer cache key for a question: its embedding, the configured LLMs and the index and
+# prompt versions. The same scope is used to look answers up and to store them. Only
+# standalone questions are cached, since follow-ups depend on the conversation.
+def _cache_key(resources, user_input, chat_history, memory=None):
+    if not ANSWER_CACHE_ENABLED or to_chat_messages(chat_history, memory):
+        return None
+    try:
+        embedding = Settings.embed_model.get_query_embedding(user_input)
+    except Exception:
+        # Let the regular query path surface embedding errors
+        return None
+    return embedding, str(resources.llm_scope), f"{resources.signature}|prompt-{PROMPT_VERSION}"
+
+
+# Stages timed inside the chat engine / query engine call
+_NESTED_STAGES = ("llm", "embed", "vector", "bm25", "fuse", "rerank", "compress")
+
+
+# Stream the answer token by token. Retrieval happens before the first token is yielded.
+# memory is the session's ConversationMemory, if it keeps one. The turn is timed stage
+# by stage in trace; when none is given one is created here and recorded in the process
+# metrics when the stream ends.
+# The retrieved nodes are appended to `sources` when a list is given; answers served from
+# the answer cache come with the nodes stored alongside them.
+def stream_answer(resources, user_input, chat_history, mode=QUERY_MODE, memory=None, trace=None, sources=None):
+    if trace is not None:
+        # Owned by the caller (the query service), which records the queue wait and
+        # finishes it once no attempt is left
+        with activate(trace):
+            yield from _stream_traced(resources, user_input, chat_history, mode, memory, trace, sources)
+        return
+    trace = Trace(mode)
+    status = "interrupted"
+    try:
+        with activate(trace):
+            yield from _stream_traced(resources, user_input, chat_history, mode, memory, trace, sources)
+        status = "ok"
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        trace.finish(status)
+
+
+def _stream_traced(resources, user_input, chat_history, mode, memory, trace, sources):
+    with trace.stage("cache_lookup"):
+        cache_key = _cache_key(resources, user_input, chat_history, memory)
+        cached = get_answer_cache().lookup(*cache_key) if cache_key else None
+    if cached is not None:
+        trace.cached = True
+        answer, cached_sources = cached
+        if sources is not None:
+            sources.extend(cached_sources)
+        yield answer
+        return
+
+    # The engines return once the prompt is built and generation has been started in a
+    # helper thread; what the nested stages don't account for is prompt assembly and
+    # engine overhead (and, in legacy mode, dense retrieval)
+    start = time.perf_counter()
+    nested_before = sum(trace.stages.get(stage, 0.0) for stage in _NESTED_STAGES)
+    source_nodes = []
+    if mode == "legacy":
+        # The system prompt is part of the user query, after the retrieved context, so
+        # there is no stable prefix
+        trace.set_prompt("full", PREFIX_VERSIONS["full"], 0, 0)
+        query_engine = resources.index.as_query_engine(similarity_top_k=SIMILARITY_TOP_K, streaming=True)
+        response = query_engine.query(build_legacy_query(user_input, chat_history, memory))
+        tokens = response.response_gen
+        source_nodes = response.source_nodes
+    else:
+        variant = select_variant(user_input)
+        trace.set_prompt(variant, PREFIX_VERSIONS[variant], prefix_tokens(variant), tokens_saved(variant))
+        if variant == "compact":
+            # Small talk needs no knowledge base excerpts
+            stream = Settings.llm.stream_chat(build_direct_messages(user_input, chat_history, variant, memory))
+            tokens = (chunk.delta or "" for chunk in stream)
+        else:
+            compressor = ContextCompressor() if CONTEXT_COMPRESSION else None
+            chat_engine = build_chat_engine(resources.index, compressor=compressor)
+            response = chat_engine.stream_chat(user_input, chat_history=to_chat_messages(chat_history, memory))
+            tokens = response.response_gen
+            # The compressed text is only for the prompt; sources and the answer cache
+            # keep the chunks as retrieved
+            source_nodes = compressor.originals(response.source_nodes) if compressor else response.source_nodes
+    if sources is not None:
+        sources.extend(source_nodes)
+    nested = sum(trace.stages.get(stage, 0.0) for stage in _NESTED_STAGES) - nested_before
+    trace.add_stage("prompt_assembly", max(0.0, time.perf_counter() - start - nested))
+
+    response_text = ""
+    start = time.perf_counter()
+    try:
+        for token in tokens:
+            response_text += token
+            yield token
+    finally:
+        # From the engine returning to the last token; "ttft" is timed by the router
+        trace.add_stage("generation", time.perf_counter() - start)
+        trace.add_tokens(completion=count_tokens(response_text))
+
+    # Only complete answers are cached; a stopped stream never reaches this point
+    if cache_key and response_text:
+        get_answer_cache().store(user_input, cache_key[0], response_text, cache_key[1], cache_key[2], source_nodes)
+
+
+# Answer a question given the prior turns of the conversation (not including it)
+def answer(resources, user_input, chat_history, mode=QUERY_MODE, memory=None):
+    return "".join(stream_answer(resources, user_input, chat_history, mode=mode, memory=memory))
+
+
+# Answer a standalone question; returns the answer and the source nodes it was based on
+def answer_with_sources(resources, user_input, mode=QUERY_MODE, trace=None):
+    sources = []
+    text = "".join(stream_answer(resources, user_input, [], mode=mode, trace=trace, sources=sources))
+    return text, sources
@@ -0,0 +1,112 @@
+import http.client
+import json
+import threading
+from urllib.parse import urlsplit
+
+from config import QUERY_MODE, RAG_SERVICE_URL, RAG_SERVICE_TIMEOUT
+from query_service import QueueFullError
+
+# Client of the local RAG service (rag_server.py), used by the app in place of the
+# in-process index and LLM clients when CONNECTSENSE_RAG_SERVICE is set. Only the
+# standard library is used, so a UI process never loads the index, the embedding model
+# or the provider SDKs. llama-index itself is imported on first use by the token counts
+# of the conversation memory (metrics.count_tokens) and by the persistent chat store.
+
+
+# Error reported by the service. status_code lets query_service.friendly_error
+# recognize rate limits; a full service queue is raised as QueueFullError.
+class RagServiceError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _raise_for(payload, status=None):
+    kind = payload.get("kind")
+    if kind == "queue_full":
+        raise QueueFullError(payload.get("error"))
+    raise RagServiceError(payload.get("error") or f"HTTP {status}", 429 if kind == "rate_limit" else status)
+
+
+class RagClient:
+    def __init__(self, url=RAG_SERVICE_URL, timeout=RAG_SERVICE_TIMEOUT):
+        parts = urlsplit(url)
+        self.url = url
+        self._host = parts.hostname or "127.0.0.1"
+        self._port = parts.port or 80
+        self._timeout = timeout
+
+    # One connection per request: the service streams answers until it closes it
+    def _request(self, method, path, payload=None):
+        conn = http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+        try:
+            body = json.dumps(payload).encode() if payload is not None else None
+            headers = {"Content-Type": "application/json"} if body is not None else {}
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+        except OSError as e:
+            conn.close()
+            raise RagServiceError(f"RAG service unavailable at {self.url}: {e}") from e
+        if response.status != 200:
+            try:
+                payload = json.loads(response.read() or b"{}")
+            except ValueError:
+                payload = {}
+            finally:
+                conn.close()
+            _raise_for(payload, response.status)
+        return conn, response
+
+    def _json(self, method, path, payload=None):
+        conn, response = self._request(method, path, payload)
+        try:
+            return json.loads(response.read())
+        finally:
+            conn.close()
+
+    def status(self):
+        return self._json("GET", "/v1/status")
+
+    # Used as the LLM of the app's conversation memory summaries
+    def complete(self, prompt, **kwargs):
+        return self._json("POST", "/v1/complete", {"prompt": prompt})["text"]
+
+    # Stream the answer to `question` token by token. history holds the recent turns
+    # (role/content dicts) and summary the running summary of older ones. When given,
+    # `result` receives the service's trace of the turn and the sources it was based on.
+    def stream_answer(self, question, history=(), summary="", mode=QUERY_MODE, result=None):
+        request = {
+            "question": question,
+            "history": [{"role": m["role"], "content": m["content"], "error": m.get("error", False)} for m in history],
+            "summary": summary,
+            "mode": mode,
+        }
+        conn, response = self._request("POST", "/v1/answer", request)
+        try:
+            for line in response:
+                payload = json.loads(line)
+                if "token" in payload:
+                    yield payload["token"]
+                elif payload.get("done"):
+                    if result is not None:
+                        result.update(trace=payload["trace"], sources=payload["sources"])
+                    return
+                else:
+                    _raise_for(payload)
+            raise RagServiceError("The RAG service closed the connection before the answer was complete")
+        finally:
+            # Closing early (e.g. the user stopped the app) makes the service stop generating
+            conn.close()
+
+
+_lock = threading.Lock()
+_client = None
+
+
+# Process-wide client of the configured service
+def get_rag_client():
+    global _client
+    with _lock:
+        if _client is None:
+            _client = RagClient()
+        return _client
@@ -0,0 +1,317 @@
+import argparse
+import json
+import os
+import signal
+import socket
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+from config import (
+    QUERY_MODE,
+    METRICS_PORT,
+    STORE_DIR,
+    INDEX_PATH,
+    ANSWER_CACHE_ENABLED,
+    RETRIEVAL_MODE,
+    RAG_SERVER_PORT,
+    RAG_SERVER_WORKERS,
+)
+
+# Local RAG service: retrieval and generation (rag.stream_answer) served over HTTP by a
+# pool of pre-forked worker processes, so the Streamlit UI processes and the query
+# workers scale independently on one host. The parent opens the listening socket and
+# forks the workers before anything heavy is imported; each worker then loads the index
+# and provider clients itself. The FAISS vectors, the BM25 postings and the SQLite
+# docstore of the store are memory-mapped and shared through the page cache, so N
+# workers don't hold N copies of the index (the legacy pickle, or a store written before
+# BM25 postings were persisted, is loaded into every worker; rebuild it with
+# index_store.py). Each worker reports its private and shared resident memory when it
+# is ready and in /v1/status. Crashed workers are restarted.
+#
+#   POST /v1/answer    {"question", "history": [{role, content}], "summary", "mode"}
+#                      streams newline-delimited JSON: {"token"} lines, then
+#                      {"done", "trace", "sources"} or {"error", "kind"}
+#   POST /v1/complete  {"prompt"} -> {"text"}, used for the app's memory summaries
+#   GET  /v1/status    provider, cache and queue state of the worker that answers
+#   GET  /health
+#
+# Worker i serves its own /metrics on CONNECTSENSE_METRICS_PORT + i when that is set.
+# Usage: python rag_server.py --workers 4 --port 8765
+# (CONNECTSENSE_PROVIDERS=stub for the local stand-in providers)
+
+# Resident memory of this process in MB: "private" (anonymous pages, e.g. Python objects)
+# and "shared" (file-backed pages such as the memory-mapped store). Empty off Linux.
+def _memory():
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return {}
+    kilobytes = lambda name: int(fields[name].split()[0]) if name in fields else 0
+    return {"private_mb": round(kilobytes("RssAnon") / 1024, 1), "shared_mb": round(kilobytes("RssFile") / 1024, 1)}
+
+
+# HTTP status and error kind per failure, matched by the client
+_QUEUE_FULL = (503, "queue_full")
+_RATE_LIMIT = (429, "rate_limit")
+_ERROR = (500, "error")
+
+
+def _error_kind(error):
+    from query_service import QueueFullError, is_rate_limit
+
+    if isinstance(error, QueueFullError):
+        return _QUEUE_FULL
+    if is_rate_limit(error):
+        return _RATE_LIMIT
+    return _ERROR
+
+
+def _source(node):
+    return {"source": node.metadata.get("source_path") or node.metadata.get("file_name"), "score": node.score}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Answers are streamed until the connection closes
+    protocol_version = "HTTP/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error_json(self, error):
+        status, kind = _error_kind(error)
+        self._send_json(status, {"error": str(error), "kind": kind})
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/health":
+            self._send_json(200, {"ok": True, "pid": os.getpid()})
+        elif path == "/v1/status":
+            self._send_json(200, worker_status())
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        try:
+            request = self._read_json()
+        except ValueError:
+            self.send_error(400, "Invalid JSON")
+            return
+        if path == "/v1/answer":
+            self._answer(request)
+        elif path == "/v1/complete":
+            self._complete(request)
+        else:
+            self.send_error(404)
+
+    def _complete(self, request):
+        from query_service import get_query_service
+        from resources import get_resources
+
+        try:
+            router = get_resources().router
+            if router is None:
+                raise RuntimeError("No LLM available")
+            text = str(get_query_service().submit(None, lambda: router.complete(request["prompt"])).result())
+        except Exception as e:
+            self._send_error_json(e)
+            return
+        self._send_json(200, {"text": text})
+
+    def _answer(self, request):
+        from conversation_memory import ConversationMemory
+        from metrics import Trace
+        from query_service import get_query_service
+        from rag import stream_answer
+        from resources import get_resources
+
+        mode = request.get("mode") or QUERY_MODE
+        # Queue wait is timed from here
+        trace = Trace(mode)
+        sources = []
+        try:
+            resources = get_resources()
+            if resources.router is None:
+                raise RuntimeError("No LLM available")
+            # The app sends its memory window: the running summary and the recent turns
+            history = request.get("history") or []
+            memory = ConversationMemory(summarize=False).sync(history).set_summary(request.get("summary"))
+            # The LLM router applies the per-provider limits itself
+            tokens = get_query_service().stream(
+                None,
+                lambda: stream_answer(
+                    resources, request["question"], history, mode=mode, memory=memory, trace=trace, sources=sources
+                ),
+                trace=trace,
+            )
+            first = next(tokens, None)
+        except Exception as e:
+            self._send_error_json(e)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            try:
+                if first is not None:
+                    self._write_line({"token": first})
+                for token in tokens:
+                    self._write_line({"token": token})
+            except (BrokenPipeError, ConnectionResetError):
+                # The client went away; closing the stream stops generation
+                tokens.close()
+                return
+            except Exception as e:
+                self._write_line({"error": str(e), "kind": _error_kind(e)[1]})
+                return
+            self._write_line({"done": True, "trace": trace.to_dict(), "sources": [_source(node) for node in sources]})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _write_line(self, payload):
+        self.wfile.write(json.dumps(payload).encode() + b"\n")
+        self.wfile.flush()
+
+
+# Provider, answer cache and query queue state of this worker
+def worker_status():
+    from query_service import get_query_service
+    from resources import get_resources
+
+    try:
+        resources = get_resources()
+    except Exception as e:
+        return {"pid": os.getpid(), "ready": False, "error": str(e)}
+    status = {
+        "pid": os.getpid(),
+        "ready": True,
+        "primary_llm": resources.primary_llm,
+        "providers": resources.router.stats() if resources.router else {},
+        "query_service": get_query_service().stats(),
+        "index": resources.path,
+        "memory": _memory(),
+        "warnings": list(resources.warnings),
+        "answer_cache": None,
+    }
+    if ANSWER_CACHE_ENABLED:
+        from answer_cache import get_answer_cache
+
+        status["answer_cache"] = get_answer_cache().stats()
+    return status
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # Serve on a listening socket inherited from the parent instead of binding one
+    def __init__(self, sock):
+        super().__init__(sock.getsockname()[:2], _Handler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+
+
+# Worker process body: load the shared resources, then accept connections. The socket is
+# non-blocking, since every worker is woken for each connection and only one accepts it.
+def _run_worker(sock, number):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from index_store import BM25_DIR, get_store_dir
+    from metrics import get_metrics
+    from resources import get_resources
+
+    start = time.perf_counter()
+    get_metrics(port=METRICS_PORT + number if METRICS_PORT else 0)
+    try:
+        resources = get_resources()
+        memory = _memory()
+        print(f"Worker {number} (pid {os.getpid()}) ready in {time.perf_counter() - start:.1f}s"
+              + (f", {memory['private_mb']:g} MB private, {memory['shared_mb']:g} MB shared" if memory else ""),
+              flush=True)
+        if number == 0 and resources.path == INDEX_PATH:
+            print(f"No memory-mapped store in {STORE_DIR}: every worker holds its own copy of {INDEX_PATH}. "
+                  f"Run `python index_store.py` to convert it.", flush=True)
+        elif number == 0 and RETRIEVAL_MODE == "hybrid" and not os.path.exists(
+            os.path.join(get_store_dir(resources.index) or "", BM25_DIR)
+        ):
+            print(f"The store in {STORE_DIR} has no BM25 postings: every worker builds its own. "
+                  f"Run `python index_store.py --reindex` to write them.", flush=True)
+    except Exception as e:
+        # Requests report the error; loading is retried on the next one
+        print(f"Worker {number} (pid {os.getpid()}) failed to load resources: {e}", flush=True)
+    _Server(sock).serve_forever()
+
+
+def _fork_worker(sock, number):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(sock, number)
+        except BaseException:
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def serve(host, port, workers):
+    sock = socket.create_server((host, port), backlog=128)
+    sock.setblocking(False)
+    print(f"Serving on http://{host}:{port} with {workers} workers", flush=True)
+
+    children = {_fork_worker(sock, number): number for number in range(workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        number = children.pop(pid, None)
+        if number is not None and not stopping:
+            print(f"Worker {number} (pid {pid}) exited, restarting", flush=True)
+            time.sleep(1)
+            children[_fork_worker(sock, number)] = number
+    sock.close()
+
+
+def main():
+    if not hasattr(os, "fork"):
+        raise SystemExit("rag_server.py needs a platform with os.fork (Linux or macOS)")
+    parser = argparse.ArgumentParser(description="Serve retrieval and generation to the app from a pool of workers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=RAG_SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=RAG_SERVER_WORKERS)
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import re
+
+# Country and terrain tagging of document chunks and questions, following the way
+# SYSTEM_PROMPT organizes the domain. Chunks are tagged at ingestion (metadata
+# "countries" and "terrains", comma-separated, kept out of the embedded and LLM text)
+# and stored in one vector partition per tag; questions are classified with the same
+# keyword lists so retrieval only searches the partitions they concern.
+
+COUNTRY_TERMS = {
+    "afghanistan": ("afghanistan", "afghan", "kabul", "kandahar", "herat", "atra"),
+    "bangladesh": ("bangladesh", "bangladeshi", "btrc", "dhaka", "chittagong", "chattogram", "sylhet",
+                   "khulna", "rajshahi", "barisal", "rangpur"),
+    "bhutan": ("bhutan", "bhutanese", "thimphu", "paro", "bicma"),
+    "india": ("india", "indian", "trai", "bharatnet", "kerala", "assam", "rajasthan", "odisha",
+              "uttarakhand", "ladakh", "sikkim", "meghalaya", "lakshadweep", "andaman", "nicobar"),
+    "maldives": ("maldives", "maldivian", "malé"),
+    "nepal": ("nepal", "nepali", "nepalese", "nta", "kathmandu", "pokhara", "karnali", "terai"),
+    "pakistan": ("pakistan", "pakistani", "pta", "sindh", "balochistan", "baluchistan", "khyber pakhtunkhwa",
+                 "gilgit", "baltistan", "karachi", "lahore", "islamabad", "peshawar", "quetta"),
+    "sri lanka": ("sri lanka", "sri lankan", "lanka", "trcsl", "colombo", "jaffna", "kandy", "batticaloa"),
+}
+
+TERRAIN_TERMS = {
+    "mountain": ("mountain", "mountains", "mountainous", "himalaya", "himalayas", "himalayan", "hill", "hills",
+                 "hilly", "highland", "highlands", "alpine", "high altitude", "karakoram", "hindu kush"),
+    "delta": ("delta", "deltas", "deltaic", "floodplain", "floodplains", "riverine", "char lands", "sundarbans",
+              "estuary", "estuarine", "wetland", "wetlands"),
+    "arid": ("arid", "semi-arid", "desert", "deserts", "thar", "dust storm", "dust storms", "sandstorm",
+             "sandstorms", "drought"),
+    "coastal": ("coastal", "coast", "coastline", "coastlines", "shore", "shoreline", "seaside", "seafront"),
+    "island": ("island", "islands", "atoll", "atolls", "archipelago", "lakshadweep", "andaman", "nicobar"),
+}
+
+# Metadata keys holding the tags, excluded from the text that is embedded or sent to the LLM
+REGION_METADATA_KEYS = ("countries", "terrains")
+
+
+def _pattern(terms):
+    alternatives = sorted((re.escape(term) for term in terms), key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b")
+
+
+_COUNTRY_PATTERNS = {country: _pattern(terms) for country, terms in COUNTRY_TERMS.items()}
+_TERRAIN_PATTERNS = {terrain: _pattern(terms) for terrain, terms in TERRAIN_TERMS.items()}
+
+
+# Tags mentioned at least min_count times in the text, in a stable order
+def _detect(patterns, text, min_count):
+    text = text.lower()
+    return [tag for tag, pattern in patterns.items() if len(pattern.findall(text)) >= min_count]
+
+
+def detect_countries(text, min_count=1):
+    return _detect(_COUNTRY_PATTERNS, text, min_count)
+
+
+def detect_terrains(text, min_count=1):
+    return _detect(_TERRAIN_PATTERNS, text, min_count)
+
+
+# Document-level tags: only countries and terrains the document returns to, not ones
+# it mentions in passing
+def document_tags(text):
+    return {"countries": detect_countries(text, min_count=2), "terrains": detect_terrains(text, min_count=2)}
+
+
+def _split(value):
+    return [tag for tag in (value or "").split(",") if tag]
+
+
+# Tag a chunk with what it mentions itself plus the tags of its document, unless it
+# is already tagged
+def tag_node(node, doc_tags=None):
+    if all(key in node.metadata for key in REGION_METADATA_KEYS):
+        return node
+    text = node.get_content()
+    doc_tags = doc_tags or {}
+    for key, detect in (("countries", detect_countries), ("terrains", detect_terrains)):
+        tags = set(detect(text)) | set(doc_tags.get(key, ()))
+        node.metadata[key] = ",".join(sorted(tags))
+        for excluded in (node.excluded_embed_metadata_keys, node.excluded_llm_metadata_keys):
+            if key not in excluded:
+                excluded.append(key)
+    return node
+
+
+def _partition(dimension, tag):
+    return f"{dimension}-{(tag or 'none').replace(' ', '_')}"
+
+
+# Names of the partitions a chunk is stored in: one per country and per terrain tag,
+# or the "none" partition of a dimension it has no tag in
+def node_partitions(metadata):
+    names = []
+    for dimension, key in (("country", "countries"), ("terrain", "terrains")):
+        tags = _split(metadata.get(key)) or [None]
+        names.extend(_partition(dimension, tag) for tag in tags)
+    return names
+
+
+# Partitions to search for a question: those of the countries it names, or else of the
+# terrains it names, together with the untagged chunks of that dimension (general
+# material that applies everywhere). None when the question names neither.
+def query_partitions(question):
+    countries = detect_countries(question)
+    if countries:
+        return [_partition("country", country) for country in countries] + [_partition("country", None)]
+    terrains = detect_terrains(question)
+    if terrains:
+        return [_partition("terrain", terrain) for terrain in terrains] + [_partition("terrain", None)]
+    return None
@@ -0,0 +1,236 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+from llama_index.core import Settings
+
+from config import (
+    GROQ_MODEL,
+    GEMINI_MODEL,
+    EMBEDDING_MODEL,
+    LLM_TEMPERATURE,
+    SIMILARITY_TOP_K,
+    INDEX_PATH,
+    STORE_DIR,
+    INDEX_CHECK_INTERVAL,
+    INDEX_SIGNATURE_HASH,
+    EMBEDDING_CACHE_ENABLED,
+    PROVIDER_BACKEND,
+    RETRIEVAL_MODE,
+)
+from embedding_cache import CachedEmbedding
+from hybrid_retriever import get_bm25_index
+from llm_router import LLMRouter
+from query_service import get_query_service
+from index_store import load_store, store_exists, vectors_path
+
+# Streamlit re-executes app.py for every session and rerun, but imported modules are
+# loaded once per process. Everything held here is therefore shared read-only by all
+# sessions: the index is loaded once and the provider clients are built once.
+_lock = threading.Lock()
+_resources = None
+_reloading = False
+
+
+class SharedResources:
+    def __init__(self, index, query_engine, router, embed_model, path, signature, warnings):
+        self.index = index
+        self.query_engine = query_engine
+        self.router = router
+        self.embed_model = embed_model
+        self.path = path
+        self.signature = signature
+        self.warnings = warnings
+        self.loaded_at = time.time()
+        self.checked_at = self.loaded_at
+
+    # Provider the router currently prefers, or None when no LLM could be initialized
+    @property
+    def primary_llm(self):
+        return self.router.preferred_provider() if self.router else None
+
+    # LLMs that answers are cached for: the configured models together, as the router may
+    # answer with any of them and its preference changes with their latency
+    @property
+    def llm_scope(self):
+        return self.router.metadata.model_name if self.router else None
+
+
+class IndexSignature:
+    def __init__(self, mtime_ns, size, digest=None):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+
+    def __repr__(self):
+        return self.digest or f"{self.mtime_ns}-{self.size}"
+
+
+# Cheap stat-based signature, optionally confirmed by a sha256 of the file contents
+def index_signature(path=INDEX_PATH, use_hash=INDEX_SIGNATURE_HASH):
+    stat = os.stat(path)
+    digest = _file_digest(path) if use_hash else None
+    return IndexSignature(stat.st_mtime_ns, stat.st_size, digest)
+
+
+def _file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+# The memory-mapped FAISS store is used when it exists; the legacy pickle otherwise
+def index_path():
+    if store_exists(STORE_DIR):
+        return vectors_path(STORE_DIR)
+    return INDEX_PATH
+
+
+def _index_changed(resources):
+    now = time.time()
+    if now - resources.checked_at < INDEX_CHECK_INTERVAL:
+        return False
+    resources.checked_at = now
+
+    path = index_path()
+    if path != resources.path:
+        return True
+
+    stat = os.stat(path)
+    loaded = resources.signature
+    if stat.st_mtime_ns == loaded.mtime_ns and stat.st_size == loaded.size:
+        return False
+    if loaded.digest is None:
+        return True
+
+    # The file was touched; only reload if the contents actually differ
+    digest = _file_digest(path)
+    if digest == loaded.digest:
+        resources.signature = IndexSignature(stat.st_mtime_ns, stat.st_size, digest)
+        return False
+    return True
+
+
+# Gemini embedding model (or its local stand-in), serving repeated texts from the
+# embedding cache
+def build_embed_model():
+    if PROVIDER_BACKEND == "stub":
+        from stub_providers import StubEmbedding
+        embed_model = StubEmbedding()
+    else:
+        # Provider SDKs are imported only when their clients are built
+        from llama_index.embeddings.gemini import GeminiEmbedding
+        embed_model = GeminiEmbedding(model_name=EMBEDDING_MODEL, api_key=os.getenv("GOOGLE_API_KEY"))
+    if EMBEDDING_CACHE_ENABLED:
+        embed_model = CachedEmbedding(embed_model)
+    return embed_model
+
+
+def _load_resources():
+    warnings = []
+    path = index_path()
+    signature = index_signature(path)
+
+    # Initialize embedding model
+    embed_model = build_embed_model()
+
+    # Load the vector database
+    if path == INDEX_PATH:
+        with open(path, "rb") as f:
+            index = pickle.load(f)
+        # The pickled index carries its own embedding model; retrieve with ours instead
+        index._embed_model = embed_model
+    else:
+        index = load_store(STORE_DIR, embed_model=embed_model)
+
+    # Initialize every provider that is configured; the router picks one per request
+    # and fails over to the others
+    providers = {}
+    if PROVIDER_BACKEND == "stub":
+        from stub_providers import StubLLM
+        providers = {"Groq": StubLLM(name="Groq"), "Gemini": StubLLM(name="Gemini")}
+    else:
+        from llama_index.llms.groq import Groq
+        from llama_index.llms.gemini import Gemini
+        try:
+            providers["Groq"] = Groq(api_key=os.getenv("GROQ_API_KEY"), model=GROQ_MODEL, temperature=LLM_TEMPERATURE)
+        except Exception as e:
+            warnings.append(f"Groq initialization failed: {str(e)}. Falling back to Gemini.")
+        try:
+            providers["Gemini"] = Gemini(model=GEMINI_MODEL, api_key=os.getenv("GOOGLE_API_KEY"), temperature=LLM_TEMPERATURE)
+        except Exception as e:
+            warnings.append(f"Gemini initialization failed: {str(e)}")
+
+    router = None
+    if providers:
+        router = LLMRouter(providers, limiter=get_query_service().provider_slot)
+
+    # Load the BM25 postings with the index (memory-mapped from the store, or built for
+    # the legacy pickle) rather than on the first hybrid query
+    if RETRIEVAL_MODE == "hybrid":
+        get_bm25_index(index)
+
+    # Query engines are stateless per query, so one instance serves every session
+    query_engine = index.as_query_engine(similarity_top_k=SIMILARITY_TOP_K) if router else None
+    return SharedResources(index, query_engine, router, embed_model, path, signature, warnings)
+
+
+# Make loaded resources the process-wide ones, including the llama-index Settings
+# defaults used by rag.py. Called under _lock, only once loading has succeeded, so a
+# failed reload leaves the globals of the resources still being served.
+def _activate(resources):
+    global _resources
+    _resources = resources
+    Settings.embed_model = resources.embed_model
+    if resources.router is not None:
+        Settings.llm = resources.router
+
+
+# Return the process-wide resources, loading them on first use and reloading them
+# when the index file has changed on disk. A reload runs outside the lock: other
+# sessions keep using the current resources until the new ones are swapped in. The
+# replaced resources are not closed; sessions may still hold their router (chat engines,
+# memory summaries), and it is garbage-collected with its threads once they let go.
+def get_resources():
+    global _reloading
+    with _lock:
+        if _resources is None:
+            _activate(_load_resources())
+            return _resources
+        current = _resources
+        if _reloading:
+            return current
+        try:
+            if not _index_changed(current):
+                return current
+        except Exception as e:
+            current.warnings.append(f"Index check failed: {str(e)}")
+            return current
+        _reloading = True
+
+    try:
+        fresh = _load_resources()
+    except Exception as e:
+        # Keep serving the previous index, e.g. while the new file is still being written
+        current.warnings.append(f"Index reload failed: {str(e)}")
+        fresh = None
+    with _lock:
+        _reloading = False
+        if fresh is not None:
+            _activate(fresh)
+        return _resources
+
+
+# Reload hook: load the resources again from disk and swap them in even if the index
+# file looks unchanged (e.g. after it was replaced with the same mtime and size, or the
+# API keys changed). Loading runs outside the lock like a regular reload; if it fails,
+# the error is raised and the current resources keep being served.
+def reload_resources():
+    fresh = _load_resources()
+    with _lock:
+        _activate(fresh)
+        return _resources
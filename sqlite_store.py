@@ -0,0 +1,99 @@
+import json
+import os
+import sqlite3
+import threading
+
+from llama_index.core.storage.kvstore.types import BaseKVStore, DEFAULT_COLLECTION
+
+
+# Open a SQLite database that can be shared across threads and processes
+def connect(path, read_only=False):
+    if read_only:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+# Key-value store backed by a single SQLite file. Values are only read when a key is
+# requested, so a docstore built on it costs nothing at startup and its memory use
+# follows the nodes actually retrieved rather than the corpus size.
+# A read-only store keeps any writes (llama-index re-registers the index struct on
+# load) in a process-local overlay instead of touching the file.
+class SQLiteKVStore(BaseKVStore):
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self._overlay = {}
+        self._lock = threading.Lock()
+        self._conn = connect(path, read_only=read_only)
+        if not read_only:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS kv ("
+                    "collection TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                    "PRIMARY KEY (collection, key))"
+                )
+
+    def put(self, key, val, collection=DEFAULT_COLLECTION):
+        self.put_all([(key, val)], collection=collection)
+
+    async def aput(self, key, val, collection=DEFAULT_COLLECTION):
+        self.put(key, val, collection=collection)
+
+    def put_all(self, kv_pairs, collection=DEFAULT_COLLECTION, batch_size=1):
+        if self.read_only:
+            for key, val in kv_pairs:
+                self._overlay[(collection, key)] = val
+            return
+        rows = [(collection, key, json.dumps(val)) for key, val in kv_pairs]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", rows)
+
+    async def aput_all(self, kv_pairs, collection=DEFAULT_COLLECTION, batch_size=1):
+        self.put_all(kv_pairs, collection=collection, batch_size=batch_size)
+
+    def get(self, key, collection=DEFAULT_COLLECTION):
+        if (collection, key) in self._overlay:
+            return self._overlay[(collection, key)]
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE collection = ? AND key = ?", (collection, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def aget(self, key, collection=DEFAULT_COLLECTION):
+        return self.get(key, collection=collection)
+
+    def get_all(self, collection=DEFAULT_COLLECTION):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM kv WHERE collection = ?", (collection,)
+            ).fetchall()
+        values = {key: json.loads(value) for key, value in rows}
+        values.update({key: val for (coll, key), val in self._overlay.items() if coll == collection})
+        return values
+
+    async def aget_all(self, collection=DEFAULT_COLLECTION):
+        return self.get_all(collection=collection)
+
+    def delete(self, key, collection=DEFAULT_COLLECTION):
+        if self.read_only:
+            return self._overlay.pop((collection, key), None) is not None
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM kv WHERE collection = ? AND key = ?", (collection, key)
+            )
+        return cursor.rowcount > 0
+
+    async def adelete(self, key, collection=DEFAULT_COLLECTION):
+        return self.delete(key, collection=collection)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,138 @@
+import argparse
+import base64
+import functools
+import io
+import mimetypes
+import os
+import re
+import threading
+
+from config import LOGO_PATH, LOGO_WIDTHS, CSS_PATH, STATIC_DIR, STATIC_SERVING
+
+# Static assets are prepared once per process instead of on every script run: the logo
+# is resized to each width it is displayed at and written to static/, which Streamlit
+# serves as cacheable files at app/static/ (enableStaticServing in .streamlit/config.toml),
+# and the stylesheet is minified once and kept in memory. When static/ can't be written
+# (e.g. a read-only container filesystem) the logo is inlined as a data URI instead.
+_build_lock = threading.Lock()
+_built = False
+
+
+def logo_file(width):
+    return os.path.join(STATIC_DIR, f"logo-{width}.jpg")
+
+
+# Resize the logo to every displayed width at 1x and 2x, skipping files that are
+# newer than the source
+def build_static_assets(force=False):
+    if not os.path.exists(LOGO_PATH):
+        return []
+    os.makedirs(STATIC_DIR, exist_ok=True)
+    source_mtime = os.path.getmtime(LOGO_PATH)
+    targets = {w * scale for w in LOGO_WIDTHS for scale in (1, 2)}
+    stale = [w for w in sorted(targets) if force or not os.path.exists(logo_file(w))
+             or os.path.getmtime(logo_file(w)) < source_mtime]
+    if not stale:
+        return []
+
+    from PIL import Image
+
+    with Image.open(LOGO_PATH) as img:
+        img = img.convert("RGB")
+        for width in stale:
+            # Never upscale; a 2x variant wider than the source is the source size
+            size = (min(width, img.width), round(img.height * min(width, img.width) / img.width))
+            tmp = f"{logo_file(width)}.tmp"
+            try:
+                img.resize(size, Image.LANCZOS).save(tmp, format="JPEG", quality=85, optimize=True, progressive=True)
+                os.replace(tmp, logo_file(width))
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+    return stale
+
+
+def _ensure_built():
+    global _built
+    with _build_lock:
+        if not _built:
+            try:
+                build_static_assets()
+            except OSError as e:
+                # Files left from an earlier build are still used; missing widths are inlined
+                print(f"Logo files not written to {STATIC_DIR}/: {e}")
+            _built = True
+
+
+def _encode(data, mime):
+    return f"data:{mime};base64," + base64.b64encode(data).decode()
+
+
+# The logo at a width without going through static/: resized in memory, or the source
+# file as is if it can't be resized. None when the source can't be read.
+def _source_data_uri(width):
+    try:
+        from PIL import Image
+
+        with Image.open(LOGO_PATH) as img:
+            img = img.convert("RGB")
+            size = (min(width, img.width), round(img.height * min(width, img.width) / img.width))
+            buffer = io.BytesIO()
+            img.resize(size, Image.LANCZOS).save(buffer, format="JPEG", quality=85, optimize=True)
+            return _encode(buffer.getvalue(), "image/jpeg")
+    except (ImportError, OSError):
+        pass
+    try:
+        with open(LOGO_PATH, "rb") as f:
+            return _encode(f.read(), mimetypes.guess_type(LOGO_PATH)[0] or "image/jpeg")
+    except OSError:
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def _data_uri(width):
+    try:
+        with open(logo_file(width), "rb") as f:
+            return _encode(f.read(), "image/jpeg")
+    except OSError:
+        return _source_data_uri(width)
+
+
+# <img> attributes for the logo at a displayed width: static URLs (with a 2x variant
+# for high-density screens) when static serving is on and both files were built,
+# otherwise a data URI encoded once per process. None when there is no logo.
+def logo_img_attrs(width):
+    _ensure_built()
+    if STATIC_SERVING and os.path.exists(logo_file(width)) and os.path.exists(logo_file(width * 2)):
+        return f'src="app/static/logo-{width}.jpg" srcset="app/static/logo-{width * 2}.jpg 2x" width="{width}"'
+    uri = _data_uri(width)
+    if uri is None:
+        return None
+    return f'src="{uri}" width="{width}"'
+
+
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};:,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+# The page stylesheet as a <style> block, read and minified once per process
+@functools.lru_cache(maxsize=None)
+def page_style():
+    with open(CSS_PATH) as f:
+        return f"<style>{minify_css(f.read())}</style>"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-build the resized logo files served from static/")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the files are up to date")
+    args = parser.parse_args()
+
+    built = build_static_assets(force=args.force)
+    print(f"Built {', '.join(logo_file(w) for w in built)}" if built else "Static assets are up to date")
+
+
+if __name__ == "__main__":
+    main()
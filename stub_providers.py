@@ -0,0 +1,104 @@
+import hashlib
+import re
+import time
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+
+from config import (
+    STUB_EMBED_DIM,
+    STUB_EMBED_LATENCY,
+    STUB_LLM_LATENCY,
+    STUB_TOKEN_LATENCY,
+    STUB_ANSWER_TOKENS,
+)
+
+# Deterministic local stand-ins for GeminiEmbedding, Groq and Gemini, selected with
+# CONNECTSENSE_PROVIDERS=stub. They make no network calls and sleep for configurable
+# artificial latencies, so the query path can be benchmarked and exercised without keys.
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _stable_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+
+# Feature-hashed bag of words: identical texts get identical vectors and texts that
+# share words are close, so retrieval over a stub-embedded store behaves plausibly
+class StubEmbedding(BaseEmbedding):
+    _dim = PrivateAttr()
+    _latency = PrivateAttr()
+
+    def __init__(self, dim=STUB_EMBED_DIM, latency=STUB_EMBED_LATENCY, **kwargs):
+        super().__init__(model_name="stub-embedding", **kwargs)
+        self._dim = dim
+        self._latency = latency
+
+    @classmethod
+    def class_name(cls):
+        return "StubEmbedding"
+
+    def _vector(self, text):
+        vector = np.zeros(self._dim, dtype="float32")
+        for word in _WORD_RE.findall(text.lower()):
+            h = _stable_hash(word)
+            vector[h % self._dim] += 1.0 if h & (1 << 32) else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_query_embedding(self, query):
+        time.sleep(self._latency)
+        return self._vector(query)
+
+    async def _aget_query_embedding(self, query):
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    # One simulated request per batch, as with the real batch endpoint
+    def _get_text_embeddings(self, texts):
+        time.sleep(self._latency)
+        return [self._vector(text) for text in texts]
+
+
+# Completion model that answers every prompt with the same words for the same prompt,
+# after `latency` seconds to the first token and `token_latency` seconds per further token
+class StubLLM(CustomLLM):
+    name: str = "stub"
+    latency: float = STUB_LLM_LATENCY
+    token_latency: float = STUB_TOKEN_LATENCY
+    answer_tokens: int = STUB_ANSWER_TOKENS
+
+    @classmethod
+    def class_name(cls):
+        return "StubLLM"
+
+    @property
+    def metadata(self):
+        return LLMMetadata(context_window=32768, num_output=512, model_name=f"stub-{self.name}")
+
+    def _words(self, prompt):
+        rng = np.random.default_rng(_stable_hash(prompt))
+        vocabulary = _WORD_RE.findall(prompt.lower())[-200:] or ["connectivity"]
+        return [vocabulary[i] for i in rng.integers(0, len(vocabulary), self.answer_tokens)]
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        words = self._words(prompt)
+        time.sleep(self.latency + self.token_latency * (len(words) - 1))
+        return CompletionResponse(text=" ".join(words))
+
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        words = self._words(prompt)
+
+        def gen():
+            text = ""
+            for i, word in enumerate(words):
+                time.sleep(self.latency if i == 0 else self.token_latency)
+                delta = word if i == 0 else " " + word
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+        return gen()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Tests import the top-level modules of the repository and never call the live providers
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("CONNECTSENSE_PROVIDERS", "stub")
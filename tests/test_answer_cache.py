@@ -0,0 +1,90 @@
+import sqlite3
+import time
+
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from answer_cache import AnswerCache
+
+SCOPE = ("Groq", "index-1")
+
+
+def _cache(tmp_path, **kwargs):
+    kwargs.setdefault("threshold", 0.9)
+    return AnswerCache(path=str(tmp_path / "answers.sqlite"), **kwargs)
+
+
+def test_similar_question_hits_and_different_one_misses(tmp_path):
+    cache = _cache(tmp_path)
+    cache.store("Which enclosure?", [1.0, 0.0], "IP67.", *SCOPE)
+
+    assert cache.lookup([0.99, 0.05], *SCOPE) == ("IP67.", [])
+    assert cache.lookup([0.0, 1.0], *SCOPE) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_entries_are_scoped_to_llm_and_index_version(tmp_path):
+    cache = _cache(tmp_path)
+    cache.store("Which enclosure?", [1.0, 0.0], "IP67.", *SCOPE)
+
+    assert cache.lookup([1.0, 0.0], "Gemini", "index-1") is None
+    assert cache.lookup([1.0, 0.0], "Groq", "index-2") is None
+
+
+def test_entries_written_by_another_process_are_seen(tmp_path):
+    reader = _cache(tmp_path)
+    assert reader.lookup([1.0, 0.0], *SCOPE) is None
+    _cache(tmp_path).store("Which enclosure?", [1.0, 0.0], "IP67.", *SCOPE)
+
+    assert reader.lookup([1.0, 0.0], *SCOPE) == ("IP67.", [])
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    cache = _cache(tmp_path, ttl=0.05)
+    cache.store("Which enclosure?", [1.0, 0.0], "IP67.", *SCOPE)
+    time.sleep(0.1)
+
+    assert cache.lookup([1.0, 0.0], *SCOPE) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = _cache(tmp_path, max_entries=2)
+    cache.store("first", [1.0, 0.0, 0.0], "one", *SCOPE)
+    cache.store("second", [0.0, 1.0, 0.0], "two", *SCOPE)
+    time.sleep(0.01)
+    assert cache.lookup([1.0, 0.0, 0.0], *SCOPE) == ("one", [])
+    time.sleep(0.01)
+    cache.store("third", [0.0, 0.0, 1.0], "three", *SCOPE)
+
+    assert cache.lookup([0.0, 1.0, 0.0], *SCOPE) is None
+    assert cache.lookup([1.0, 0.0, 0.0], *SCOPE) == ("one", [])
+
+
+def test_hit_returns_answer_with_its_sources(tmp_path):
+    cache = _cache(tmp_path)
+    source = NodeWithScore(node=TextNode(text="Use IP67 enclosures.", metadata={"source_path": "nepal.md"}), score=0.8)
+    cache.store("Which enclosure?", [1.0, 0.0], "IP67.", *SCOPE, sources=[source])
+
+    answer, sources = cache.lookup([0.99, 0.05], *SCOPE)
+    assert answer == "IP67."
+    assert [(s.node.get_content(), s.node.metadata, s.score) for s in sources] == [
+        ("Use IP67 enclosures.", {"source_path": "nepal.md"}, 0.8)
+    ]
+    assert cache.lookup([0.0, 1.0], *SCOPE) is None
+
+
+def test_cache_from_before_sources_were_kept(tmp_path):
+    path = str(tmp_path / "answers.sqlite")
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE answers (id INTEGER PRIMARY KEY AUTOINCREMENT, llm TEXT NOT NULL, "
+            "index_version TEXT NOT NULL, question TEXT NOT NULL, embedding BLOB NOT NULL, answer TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        conn.execute(
+            "INSERT INTO answers (llm, index_version, question, embedding, answer, created_at, last_used) "
+            "VALUES (?, ?, 'q', ?, 'old answer', 9e99, 9e99)",
+            (*SCOPE, AnswerCache._normalize([1.0, 0.0]).tobytes()),
+        )
+
+    assert AnswerCache(path=path).lookup([1.0, 0.0], *SCOPE) == ("old answer", [])
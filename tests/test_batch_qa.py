@@ -0,0 +1,101 @@
+import json
+from concurrent.futures import Future
+
+from llama_index.core.schema import NodeWithScore, TextNode
+
+import batch_qa
+from query_service import QueueFullError
+
+
+# Runs submitted queries inline and finishes their traces, as the query service does
+class InlineService:
+    max_concurrency = 4
+    max_queue = 4
+
+    def submit(self, provider, fn, trace=None):
+        future = Future()
+        try:
+            future.set_result(fn())
+            trace.finish("ok")
+        except Exception as e:
+            future.set_exception(e)
+            trace.finish("error")
+        return future
+
+
+# Runs submitted queries inline and turns away every other submission
+class BusyService:
+    max_concurrency = 1
+    max_queue = 1
+
+    def __init__(self):
+        self.calls = 0
+
+    def submit(self, provider, fn, trace=None):
+        self.calls += 1
+        if self.calls % 2:
+            raise QueueFullError("busy")
+        future = Future()
+        future.set_result(fn())
+        trace.finish("ok")
+        return future
+
+
+def _answer(resources, question, mode, trace):
+    if "fail" in question:
+        raise RuntimeError("provider down")
+    node = NodeWithScore(node=TextNode(text="Microwave links " * 50, metadata={"file_name": "nepal.md"}), score=0.8)
+    return question.upper(), [node]
+
+
+def test_questions_are_deduplicated_after_normalizing():
+    items = batch_qa.deduplicate([
+        {"id": "1", "question": "Which backhaul for Jumla?"},
+        {"id": "2", "question": "  which BACKHAUL for jumla "},
+        {"id": "3", "question": "Which satellite for Humla?"},
+    ])
+
+    assert [item["ids"] for item in items] == [["1", "2"], ["3"]]
+
+
+def test_questions_are_read_from_csv_and_jsonl(tmp_path):
+    csv_path = tmp_path / "questions.csv"
+    csv_path.write_text("id,question\nA,First?\nB,\n,Third?\n")
+    jsonl_path = tmp_path / "questions.jsonl"
+    jsonl_path.write_text(json.dumps({"question": "First?"}) + "\n\n" + json.dumps({"id": 7, "question": "Second?"}) + "\n")
+
+    assert batch_qa.read_questions(str(csv_path)) == [{"id": "A", "question": "First?"}, {"id": "3", "question": "Third?"}]
+    assert batch_qa.read_questions(str(jsonl_path)) == [{"id": "1", "question": "First?"}, {"id": "7", "question": "Second?"}]
+
+
+def test_failed_questions_are_asked_again_on_resume(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_qa, "get_query_service", InlineService)
+    monkeypatch.setattr(batch_qa, "answer_with_sources", _answer)
+    out_path = str(tmp_path / "answers.jsonl")
+    items = batch_qa.deduplicate([{"id": "1", "question": "ok question"}, {"id": "2", "question": "fail question"}])
+
+    report = batch_qa.run_batch(None, items, out_path, concurrency=2, progress=False)
+    assert (report["answered"], report["failed"]) == (1, 1)
+
+    answered = batch_qa.load_answered(out_path)
+    assert list(answered) == [items[0]["key"]]
+    record = answered[items[0]["key"]]
+    assert record["answer"] == "OK QUESTION"
+    assert record["sources"][0]["source"] == "nepal.md"
+    assert len(record["sources"][0]["excerpt"]) == batch_qa.BATCH_SOURCE_EXCERPT_CHARS
+    # The failed record was dropped from the file
+    with open(out_path) as f:
+        assert len(f.readlines()) == 1
+
+
+def test_questions_turned_away_are_submitted_again(tmp_path, monkeypatch):
+    service = BusyService()
+    monkeypatch.setattr(batch_qa, "get_query_service", lambda: service)
+    monkeypatch.setattr(batch_qa, "answer_with_sources", lambda resources, question, mode, trace: (question.upper(), []))
+    monkeypatch.setattr(batch_qa.time, "sleep", lambda seconds: None)
+    items = batch_qa.deduplicate([{"id": str(i), "question": f"question {i}"} for i in range(3)])
+
+    report = batch_qa.run_batch(None, items, str(tmp_path / "out.jsonl"), concurrency=10, progress=False)
+
+    assert report["answered"] == 3 and report["failed"] == 0
+    assert sorted(batch_qa.load_answered(str(tmp_path / "out.jsonl"))) == sorted(item["key"] for item in items)
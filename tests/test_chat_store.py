@@ -0,0 +1,52 @@
+from chat_store import ChatHistory, ChatStore
+
+
+def _fill(history, count):
+    for number in range(count):
+        history.append("user" if number % 2 == 0 else "assistant", f"message {number}")
+
+
+def test_memory_holds_newest_messages_and_pages_older_from_store(tmp_path):
+    store = ChatStore(path=str(tmp_path / "chat.sqlite"))
+    history = ChatHistory(store=store, max_messages=4)
+    _fill(history, 10)
+
+    assert [m.content for m in history] == [f"message {n}" for n in range(6, 10)]
+    assert history.total == 10
+    assert [m.content for m in history.latest(7)] == [f"message {n}" for n in range(3, 10)]
+    assert history.available_before(7) == 3
+    # Paged-in messages are not kept in memory
+    assert len(history) == 4
+
+
+def test_session_resumes_from_its_id(tmp_path):
+    store = ChatStore(path=str(tmp_path / "chat.sqlite"))
+    history = ChatHistory(store=store, max_messages=4)
+    _fill(history, 5)
+    history.append("assistant", "long answer " * 100, error=True)
+
+    resumed = ChatHistory(session_id=history.session_id, store=store, max_messages=4)
+    assert [m.seq for m in resumed] == [2, 3, 4, 5]
+    assert resumed[-1]["content"] == "long answer " * 100
+    assert resumed[-1].error
+    resumed.append("user", "next")
+    assert resumed[-1].seq == 6
+
+
+def test_without_store_messages_beyond_cap_are_gone():
+    history = ChatHistory(max_messages=3)
+    _fill(history, 5)
+
+    assert [m.content for m in history.latest(5)] == ["message 2", "message 3", "message 4"]
+    assert history.available_before(2) == 1
+    assert not history.persistent
+
+
+def test_clear_deletes_the_session(tmp_path):
+    store = ChatStore(path=str(tmp_path / "chat.sqlite"))
+    history = ChatHistory(store=store, max_messages=4)
+    _fill(history, 3)
+    history.clear()
+
+    assert len(history) == 0 and history.total == 0
+    assert store.before(history.session_id, None, 10) == []
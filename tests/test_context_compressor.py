@@ -0,0 +1,59 @@
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from context_compressor import ContextCompressor, split_sentences
+from metrics import count_tokens
+
+NEPAL = (
+    "Nepal hill districts need IP67 enclosures for the monsoon. "
+    "Solar power with two days of battery keeps towers running. "
+    "Microwave backhaul suits ridgelines with line of sight."
+)
+FIBER = (
+    "GPON fiber serves the valley towns. "
+    "Splitters are placed in roadside cabinets.\n"
+    "Fiber cuts during landslides are common."
+)
+
+
+def _nodes(*texts):
+    return [NodeWithScore(node=TextNode(text=text), score=1.0 - i / 10) for i, text in enumerate(texts)]
+
+
+def _compress(nodes, question, **kwargs):
+    return ContextCompressor(**kwargs).postprocess_nodes(nodes, query_bundle=QueryBundle(question))
+
+
+def test_split_sentences_marks_line_starts():
+    assert split_sentences("One. Two?\nThree") == [("One.", True), ("Two?", False), ("Three", True)]
+
+
+def test_near_duplicate_chunk_is_dropped():
+    results = _compress(_nodes(NEPAL, NEPAL + " Thanks."), "enclosures for the monsoon", duplicate_threshold=0.8)
+    assert len(results) == 1
+
+
+def test_sentences_repeated_across_chunks_are_kept_once():
+    overlap = "Solar power with two days of battery keeps towers running."
+    results = _compress(_nodes(NEPAL, overlap + " Diesel backup is costly."), "solar battery diesel")
+    text = "\n".join(result.node.get_content() for result in results)
+    assert text.count(overlap) == 1
+    assert "Diesel backup is costly." in text
+
+
+def test_budget_keeps_most_relevant_sentences_and_leaves_nodes_unchanged():
+    nodes = _nodes(NEPAL, FIBER)
+    budget = count_tokens("Nepal hill districts need IP67 enclosures for the monsoon.") + 2
+    results = _compress(nodes, "Which enclosures for the monsoon?", token_budget=budget, neighbors=0)
+
+    assert [result.node.get_content() for result in results] == [
+        "Nepal hill districts need IP67 enclosures for the monsoon."
+    ]
+    assert nodes[0].node.get_content() == NEPAL
+
+
+def test_chunks_without_question_terms_keep_their_opening_sentences():
+    results = _compress(_nodes(NEPAL, FIBER), "monsoon enclosures", neighbors=0, fallback_sentences=1)
+    assert [result.node.get_content() for result in results] == [
+        "Nepal hill districts need IP67 enclosures for the monsoon.",
+        "GPON fiber serves the valley towns.",
+    ]
@@ -0,0 +1,98 @@
+import threading
+import time
+
+from chat_store import ChatHistory
+from conversation_memory import ConversationMemory
+
+
+class SummaryLLM:
+    def __init__(self, text="Summary: the user plans fiber in Nepal."):
+        self.text = text
+        self.prompts = []
+
+    def complete(self, prompt):
+        self.prompts.append(prompt)
+        return self.text
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def _history(*messages):
+    history = ChatHistory(max_messages=100)
+    for role, content, *error in messages:
+        history.append(role, content, error=bool(error))
+    return history
+
+
+def test_turns_are_paired_by_role_and_error_replies_skipped():
+    history = _history(
+        ("user", "Which backhaul?"),
+        ("assistant", "Service unavailable", True),
+        ("user", "Which backhaul, again?"),
+        ("assistant", "Microwave."),
+    )
+    summary, turns = ConversationMemory(summarize=False).sync(history).window()
+
+    assert summary == ""
+    assert turns == [("Which backhaul?", None), ("Which backhaul, again?", "Microwave.")]
+
+
+def test_window_keeps_newest_turns_within_budget_and_caps_answers():
+    history = _history(
+        ("user", "first question"), ("assistant", "word " * 50),
+        ("user", "second question"), ("assistant", "word " * 500),
+    )
+    memory = ConversationMemory(token_budget=350, answer_max_tokens=300, summarize=False).sync(history)
+    _, turns = memory.window()
+
+    assert [question for question, _ in turns] == ["second question"]
+    assert turns[0][1].endswith(" …")
+    assert memory.stats()["tokens"] <= 350
+
+
+def test_sync_only_takes_new_messages_and_restarts_after_clear():
+    history = _history(("user", "one"), ("assistant", "1"))
+    memory = ConversationMemory(summarize=False).sync(history)
+    history.append("user", "two")
+    assert memory.sync(history).stats()["turns"] == 2
+
+    history.clear()
+    history.append("user", "fresh start")
+    assert memory.sync(history).window() == ("", [("fresh start", None)])
+
+
+def test_turns_leaving_the_window_are_summarized_in_the_background():
+    history = _history(*[
+        message for n in range(4) for message in (("user", f"question {n}"), ("assistant", f"answer {n}"))
+    ])
+    llm = SummaryLLM()
+    memory = ConversationMemory(max_turns=2).sync(history, llm=llm)
+    _wait_for(lambda: not memory.stats()["summarizing"])
+
+    summary, turns = memory.window()
+    assert summary == llm.text
+    assert [question for question, _ in turns] == ["question 2", "question 3"]
+    assert memory.stats()["summarized_turns"] == 2
+    assert "question 0" in llm.prompts[0] and "question 2" not in llm.prompts[0]
+
+
+def test_summary_started_before_a_reset_is_discarded():
+    release = threading.Event()
+
+    class SlowLLM(SummaryLLM):
+        def complete(self, prompt):
+            release.wait(2)
+            return super().complete(prompt)
+
+    history = _history(*[message for n in range(3) for message in (("user", f"q{n}"), ("assistant", f"a{n}"))])
+    memory = ConversationMemory(max_turns=1).sync(history, llm=SlowLLM())
+    memory.reset()
+    release.set()
+    time.sleep(0.1)
+
+    assert memory.window() == ("", [])
@@ -0,0 +1,52 @@
+from llama_index.core.embeddings import MockEmbedding
+
+from embedding_cache import CachedEmbedding, EmbeddingStore
+
+
+class CountingEmbedding(MockEmbedding):
+    def _get_query_embedding(self, query):
+        CALLS.append(("query", query))
+        return [float(len(query))] * self.embed_dim
+
+    def _get_text_embedding(self, text):
+        CALLS.append(("text", text))
+        return [float(len(text)) + 0.5] * self.embed_dim
+
+
+CALLS = []
+
+
+def _cached(tmp_path):
+    return CachedEmbedding(CountingEmbedding(embed_dim=3), store=EmbeddingStore(path=str(tmp_path / "emb.sqlite")))
+
+
+def test_repeated_texts_are_embedded_once(tmp_path):
+    CALLS.clear()
+    model = _cached(tmp_path)
+
+    first = model.get_text_embedding_batch(["gpon", "ip67", "gpon"])
+    assert model.get_text_embedding_batch(["ip67", "gpon"]) == first[1:]
+    assert sorted(CALLS) == [("text", "gpon"), ("text", "ip67")]
+
+
+def test_queries_and_documents_are_cached_separately(tmp_path):
+    CALLS.clear()
+    model = _cached(tmp_path)
+
+    assert model.get_query_embedding("gpon") == [4.0] * 3
+    assert model.get_text_embedding("gpon") == [4.5] * 3
+    assert CALLS == [("query", "gpon"), ("text", "gpon")]
+
+
+def test_store_is_shared_between_instances(tmp_path):
+    CALLS.clear()
+    _cached(tmp_path).get_query_embedding("which backhaul?")
+    assert _cached(tmp_path).get_query_embedding("which backhaul?") == [15.0] * 3
+    assert len(CALLS) == 1
+
+
+def test_store_evicts_least_recently_used_rows(tmp_path):
+    store = EmbeddingStore(path=str(tmp_path / "emb.sqlite"), max_entries=10)
+    store.put_many([(f"key-{n}", [float(n)]) for n in range(300)])
+
+    assert len(store.get_many([f"key-{n}" for n in range(300)])) == 10
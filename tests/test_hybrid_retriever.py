@@ -0,0 +1,72 @@
+import pytest
+from llama_index.core import VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import TextNode
+
+from hybrid_retriever import BM25Index, HybridRetriever, reciprocal_rank_fusion, tokenize
+
+TEXTS = [
+    "GPON fiber backhaul for district offices in the Nepal hills",
+    "Solar power and IP67 enclosures for towers during the monsoon",
+    "TRCSL licensing for satellite terminals in Sri Lanka",
+    "Fiber or microwave: choosing backhaul for plains districts",
+]
+NODE_IDS = ["gpon", "ip67", "trcsl", "plains"]
+
+
+@pytest.fixture(params=["memory", "saved"])
+def bm25(request, tmp_path):
+    arrays = BM25Index.build_arrays(TEXTS)
+    if request.param == "memory":
+        return BM25Index(arrays, NODE_IDS)
+    BM25Index.save_arrays(arrays, str(tmp_path / "bm25"))
+    return BM25Index.load(str(tmp_path / "bm25"), NODE_IDS)
+
+
+def test_tokenize_keeps_codes_whole():
+    assert tokenize("IP67-rated GPON, per TRCSL!") == ["ip67", "rated", "gpon", "per", "trcsl"]
+
+
+def test_exact_terms_rank_first(bm25):
+    assert bm25.search("IP67 enclosure", 2)[0][0] == "ip67"
+    assert bm25.search("trcsl", 5) == [("trcsl", pytest.approx(bm25.search("trcsl", 1)[0][1]))]
+
+
+def test_rarer_terms_weigh_more(bm25):
+    # "backhaul" is in two documents, "gpon" in one
+    ranking = [node_id for node_id, _ in bm25.search("gpon backhaul", 4)]
+    assert ranking == ["gpon", "plains"]
+
+
+def test_unknown_terms_match_nothing(bm25):
+    assert bm25.search("bharatnet", 3) == []
+    assert bm25.search("", 3) == []
+
+
+def test_allowed_restricts_results(bm25):
+    assert [node_id for node_id, _ in bm25.search("fiber backhaul", 3, allowed={"plains"})] == ["plains"]
+
+
+def test_saved_index_scores_like_memory_index(tmp_path):
+    arrays = BM25Index.build_arrays(TEXTS)
+    BM25Index.save_arrays(arrays, str(tmp_path / "bm25"))
+    memory = BM25Index(arrays, NODE_IDS)
+    loaded = BM25Index.load(str(tmp_path / "bm25"), NODE_IDS)
+    for query in ("fiber backhaul", "monsoon towers", "satellite licensing sri lanka"):
+        assert loaded.search(query, 4) == memory.search(query, 4)
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    assert [node_id for node_id, _ in fused] == ["b", "a", "d", "c"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+
+
+def test_hybrid_retrieval_finds_exact_codes_dense_retrieval_misses():
+    # Every text embeds to the same vector, so only BM25 can tell them apart
+    nodes = [TextNode(text=text, id_=node_id) for node_id, text in zip(NODE_IDS, TEXTS)]
+    index = VectorStoreIndex(nodes, embed_model=MockEmbedding(embed_dim=8))
+    retriever = HybridRetriever(index, top_k=1, candidate_k=4)
+
+    assert [result.node.node_id for result in retriever.retrieve("TRCSL licensing")] == ["trcsl"]
+    assert {"embed", "vector", "bm25", "fuse"} <= set(retriever.last_timings())
@@ -0,0 +1,130 @@
+import gc
+import os
+
+import numpy as np
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from index_store import (
+    EXACT_VECTORS_FILE,
+    VERSIONS_DIR,
+    current_dir,
+    get_partitions,
+    QuantizedIndex,
+    index_description,
+    iter_store_nodes,
+    load_store,
+    store_exists,
+    write_store,
+)
+from sqlite_store import SQLiteKVStore
+
+TEXTS = ["GPON fiber backhaul", "IP67 enclosures for the monsoon", "TRCSL satellite licensing"]
+
+
+def _nodes():
+    nodes = []
+    for number, text in enumerate(TEXTS):
+        vector = np.zeros(4, dtype="float32")
+        vector[number] = 1.0
+        nodes.append(TextNode(text=text, id_=f"node-{number}", embedding=vector.tolist()))
+    return nodes
+
+
+def test_written_store_is_searched_from_disk(tmp_path):
+    persist_dir = str(tmp_path / "store")
+    write_store(_nodes(), persist_dir)
+    assert store_exists(persist_dir)
+
+    index = load_store(persist_dir, embed_model=MockEmbedding(embed_dim=4))
+    result = index.vector_store.query(VectorStoreQuery(query_embedding=[0.1, 0.0, 0.9, 0.0], similarity_top_k=1))
+    node_id = index.index_struct.nodes_dict[result.ids[0]]
+    assert index.docstore.get_node(node_id).get_content() == "TRCSL satellite licensing"
+
+
+def test_rewrite_replaces_the_store(tmp_path):
+    persist_dir = str(tmp_path / "store")
+    write_store(_nodes(), persist_dir)
+    write_store(_nodes()[:1], persist_dir)
+
+    index = load_store(persist_dir, embed_model=MockEmbedding(embed_dim=4))
+    assert index.vector_store.client.ntotal == 1
+
+
+def test_write_switches_versions_and_keeps_the_previous_one(tmp_path):
+    persist_dir = str(tmp_path / "store")
+    write_store(_nodes(), persist_dir)
+    first = current_dir(persist_dir)
+    write_store(_nodes()[:2], persist_dir)
+    previous = current_dir(persist_dir)
+    # A process still on the previous version can keep loading it
+    assert load_store(previous, embed_model=MockEmbedding(embed_dim=4)).vector_store.client.ntotal == 2
+
+    write_store(_nodes()[:1], persist_dir)
+    versions = sorted(os.listdir(os.path.join(persist_dir, VERSIONS_DIR)))
+    assert [os.path.join(persist_dir, VERSIONS_DIR, name) for name in versions] == [previous, current_dir(persist_dir)]
+    assert not os.path.exists(first)
+
+
+def test_versions_still_read_by_a_process_are_not_deleted(tmp_path):
+    persist_dir = str(tmp_path / "store")
+    write_store(_nodes(), persist_dir)
+    first = current_dir(persist_dir)
+    index = load_store(persist_dir, embed_model=MockEmbedding(embed_dim=4))
+
+    # Two writes within one index check interval
+    write_store(_nodes()[:2], persist_dir)
+    write_store(_nodes()[:1], persist_dir)
+    # Partitions are opened on first use, after the writes
+    partitions = get_partitions(index)
+    names, _ = partitions.select(list(partitions.sizes))
+    assert partitions.search(names, [1.0, 0.0, 0.0, 0.0], 1)
+
+    del index, partitions
+    gc.collect()
+    write_store(_nodes(), persist_dir)
+    assert not os.path.exists(first)
+
+
+def test_index_description():
+    assert index_description("flat", 1000, 64) == "Flat"
+    assert index_description("ivf-sq8", 10000, 256) == "IVF256,SQ8"
+    # Too few vectors to train 256 PQ centroids
+    assert index_description("ivfpq", 100, 16) == "IVF2,PQ2x6"
+    assert index_description("HNSW32", 100, 16) == "HNSW32"
+
+
+def test_quantized_store_is_rescored_with_exact_vectors(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((300, 32)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    nodes = [TextNode(text=f"chunk {i}", id_=f"node-{i}", embedding=v.tolist()) for i, v in enumerate(vectors)]
+    persist_dir = str(tmp_path / "store")
+    write_store(nodes, persist_dir, index_type="ivf-sq8")
+    assert os.path.exists(os.path.join(current_dir(persist_dir), EXACT_VECTORS_FILE))
+
+    index = load_store(persist_dir, embed_model=MockEmbedding(embed_dim=32))
+    assert isinstance(index.vector_store.client, QuantizedIndex)
+    result = index.vector_store.query(VectorStoreQuery(query_embedding=vectors[17].tolist(), similarity_top_k=3))
+    assert index.index_struct.nodes_dict[result.ids[0]] == "node-17"
+    assert np.isclose(result.similarities[0], 1.0)
+
+    stored = {node.node_id: node.embedding for node in iter_store_nodes(persist_dir, {"node-5"})}
+    assert list(stored) == ["node-5"]
+    assert np.allclose(stored["node-5"], vectors[5])
+
+
+def test_sqlite_kvstore_round_trip(tmp_path):
+    path = str(tmp_path / "kv.sqlite")
+    store = SQLiteKVStore(path)
+    store.put("a", {"text": "one"})
+    store.put_all([("b", {"text": "two"}), ("c", {"text": "three"})], collection="other")
+
+    assert store.get("a") == {"text": "one"}
+    assert store.get("b") is None
+    assert store.get_all("other") == {"b": {"text": "two"}, "c": {"text": "three"}}
+    assert store.delete("a") and store.get("a") is None
+
+    reader = SQLiteKVStore(path, read_only=True)
+    assert reader.get("c", collection="other") == {"text": "three"}
@@ -0,0 +1,93 @@
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import TextNode
+
+from index_store import iter_store_nodes, write_store
+from ingest import ingest
+
+
+class CountingEmbedding(MockEmbedding):
+    def _get_text_embeddings(self, texts):
+        EMBEDDED.extend(texts)
+        return super()._get_text_embeddings(texts)
+
+
+EMBEDDED = []
+
+DOCS = {
+    "nepal.md": "Nepal hill districts need IP67 enclosures for the monsoon.",
+    "lanka.md": "TRCSL licenses satellite terminals in Sri Lanka.",
+    "india.md": "BharatNet brings fiber to gram panchayats in India.",
+}
+
+
+def _run(tmp_path, **kwargs):
+    EMBEDDED.clear()
+    return ingest(
+        source_dir=str(tmp_path / "docs"), persist_dir=str(tmp_path / "store"),
+        manifest_path=str(tmp_path / "manifest.sqlite"), workers=2, batch_size=2,
+        embed_model=CountingEmbedding(embed_dim=8), **kwargs,
+    )
+
+
+def _stored_texts(tmp_path):
+    return sorted(node.get_content() for node in iter_store_nodes(str(tmp_path / "store")))
+
+
+def _write_docs(tmp_path, docs):
+    (tmp_path / "docs").mkdir(exist_ok=True)
+    for name, text in docs.items():
+        (tmp_path / "docs" / name).write_text(text)
+
+
+def test_first_run_embeds_every_document(tmp_path):
+    _write_docs(tmp_path, DOCS)
+    report = _run(tmp_path)
+
+    assert (report["new"], report["nodes_embedded"], report["batches"]) == (3, 3, 2)
+    assert _stored_texts(tmp_path) == sorted(DOCS.values())
+
+
+def test_rerun_only_embeds_changed_documents_and_drops_deleted_ones(tmp_path):
+    _write_docs(tmp_path, DOCS)
+    _run(tmp_path)
+    assert _run(tmp_path)["nodes_embedded"] == 0
+
+    _write_docs(tmp_path, {"nepal.md": "Nepal hill districts use microwave backhaul."})
+    (tmp_path / "docs" / "india.md").unlink()
+    report = _run(tmp_path)
+
+    assert (report["changed"], report["unchanged"], report["deleted"]) == (1, 1, 1)
+    assert len(EMBEDDED) == 1 and EMBEDDED[0].endswith("Nepal hill districts use microwave backhaul.")
+    assert _stored_texts(tmp_path) == sorted([DOCS["lanka.md"], "Nepal hill districts use microwave backhaul."])
+
+
+def test_documents_missing_from_a_rewritten_store_are_embedded_again(tmp_path):
+    _write_docs(tmp_path, DOCS)
+    _run(tmp_path)
+    # e.g. the store was rebuilt from an older copy
+    store = str(tmp_path / "store")
+    write_store([node for node in iter_store_nodes(store) if node.metadata["source_path"] != "india.md"], store)
+
+    report = _run(tmp_path)
+    assert (report["missing"], report["nodes_embedded"], report["store_rewritten"]) == (1, 1, True)
+    assert EMBEDDED[0].endswith(DOCS["india.md"])
+    assert _stored_texts(tmp_path) == sorted(DOCS.values())
+    assert not _run(tmp_path)["store_rewritten"]
+
+
+def test_chunks_not_from_the_source_directory_are_kept(tmp_path):
+    # A store converted from the pickle: one chunk of a document that is now ingested
+    # from the source directory, one of a document that isn't
+    write_store([
+        TextNode(text="Old Nepal notes.", metadata={"file_name": "nepal.md"}, embedding=[1.0] + [0.0] * 7),
+        TextNode(text="Legacy tender summary.", metadata={"file_name": "tender.pdf"}, embedding=[0.0, 1.0] + [0.0] * 6),
+    ], str(tmp_path / "store"))
+    _write_docs(tmp_path, DOCS)
+
+    report = _run(tmp_path)
+    assert (report["new"], report["carried"]) == (3, 1)
+    assert _stored_texts(tmp_path) == sorted([*DOCS.values(), "Legacy tender summary."])
+
+    _write_docs(tmp_path, {"nepal.md": "Nepal hill districts use microwave backhaul."})
+    assert _run(tmp_path)["carried"] == 1
+    assert "Legacy tender summary." in _stored_texts(tmp_path)
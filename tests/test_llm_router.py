@@ -0,0 +1,150 @@
+import gc
+import threading
+import time
+import weakref
+
+import pytest
+
+from llm_router import LLMRouter
+from stub_providers import StubLLM
+
+
+class FailingLLM(StubLLM):
+    def complete(self, prompt, formatted=False, **kwargs):
+        raise RuntimeError(f"{self.name} is down")
+
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        raise RuntimeError(f"{self.name} is down")
+
+
+def _router(groq, gemini, limits=None, **kwargs):
+    slots = {name: threading.BoundedSemaphore(limit) for name, limit in (limits or {}).items()}
+    limiter = (lambda name: slots[name]) if slots else None
+    kwargs.setdefault("hedge_after", 0)
+    return LLMRouter({"Groq": groq, "Gemini": gemini}, limiter=limiter, **kwargs), slots
+
+
+def _stub(name, latency=0.0):
+    return StubLLM(name=name, latency=latency, token_latency=0.0, answer_tokens=3)
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def test_error_fails_over_and_demotes_provider():
+    router, _ = _router(FailingLLM(name="Groq"), _stub("Gemini"))
+
+    assert router.complete("hello").text
+    assert router.last_provider() == "Gemini"
+    stats = router.stats()
+    assert stats["Groq"]["failures"] == 1
+    assert stats["Groq"]["cooling_down"]
+    assert stats["Gemini"]["requests"] == 1
+    assert router.ranking() == ["Gemini", "Groq"]
+
+
+def test_all_providers_failing_raises_last_error():
+    router, _ = _router(FailingLLM(name="Groq"), FailingLLM(name="Gemini"))
+
+    with pytest.raises(RuntimeError, match="Gemini is down"):
+        router.complete("hello")
+
+
+def test_late_answer_after_timeout_is_not_counted_as_success():
+    router, _ = _router(_stub("Groq", latency=0.3), _stub("Gemini"), timeout=0.1)
+
+    assert router.complete("hello").text
+    assert router.last_provider() == "Gemini"
+    # Let the timed-out Groq call finish in the background
+    time.sleep(0.4)
+    stats = router.stats()["Groq"]
+    assert stats == {**stats, "requests": 1, "failures": 1, "cooling_down": True, "p50": None}
+
+
+def test_waiting_for_the_provider_slot_is_not_a_timeout():
+    router, slots = _router(_stub("Groq", latency=0.01), _stub("Gemini"), limits={"Groq": 1, "Gemini": 1},
+                            timeout=0.1)
+    slots["Groq"].acquire()
+    threading.Timer(0.25, slots["Groq"].release).start()
+
+    assert router.complete("hello").text
+    assert router.last_provider() == "Groq"
+    assert router.stats()["Groq"]["failures"] == 0
+
+
+def test_hedged_request_takes_the_first_answer():
+    router, _ = _router(_stub("Groq", latency=0.5), _stub("Gemini"), hedge_after=0.05)
+
+    start = time.monotonic()
+    assert router.complete("hello").text
+    assert time.monotonic() - start < 0.4
+    assert router.last_provider() == "Gemini"
+    # The slower provider still answers within the timeout and keeps a clean record
+    _wait_for(lambda: router.stats()["Groq"]["requests"] == 1)
+    assert router.stats()["Groq"]["failures"] == 0
+
+
+def test_faster_provider_is_preferred_once_it_has_enough_samples():
+    router, _ = _router(_stub("Groq"), _stub("Gemini"))
+    router._stats["Groq"].latencies.extend([0.8] * 5)
+    router._stats["Gemini"].latencies.extend([0.2] * 4)
+    assert router.ranking() == ["Groq", "Gemini"]
+
+    router._stats["Gemini"].latencies.append(0.2)
+    assert router.ranking() == ["Gemini", "Groq"]
+
+
+def test_stream_is_routed_to_a_working_provider():
+    router, _ = _router(FailingLLM(name="Groq"), _stub("Gemini"))
+
+    assert "".join(chunk.delta for chunk in router.stream_complete("hello"))
+    assert router.last_provider() == "Gemini"
+
+
+def test_stream_holds_provider_slot_until_exhausted():
+    router, slots = _router(_stub("Groq"), _stub("Gemini"), limits={"Groq": 1, "Gemini": 1})
+
+    stream = router.stream_complete("hello")
+    first = next(stream)
+    assert first.delta
+    assert not slots["Groq"].acquire(blocking=False)
+
+    assert len(list(stream)) == 2
+    assert slots["Groq"].acquire(blocking=False)
+
+
+def test_closed_stream_releases_provider_slot():
+    router, slots = _router(_stub("Groq"), _stub("Gemini"), limits={"Groq": 1, "Gemini": 1})
+
+    stream = router.stream_complete("hello")
+    next(stream)
+    stream.close()
+    assert slots["Groq"].acquire(blocking=False)
+
+
+def test_hedged_stream_loser_releases_its_slot():
+    router, slots = _router(_stub("Groq", latency=0.3), _stub("Gemini"), limits={"Groq": 1, "Gemini": 1},
+                            hedge_after=0.05)
+
+    stream = router.stream_complete("hello")
+    assert router.last_provider() == "Gemini"
+    list(stream)
+    _wait_for(lambda: slots["Groq"].acquire(blocking=False))
+    assert slots["Gemini"].acquire(blocking=False)
+
+
+
+def test_dropped_router_is_collected_with_its_threads():
+    router, _ = _router(_stub("Groq"), _stub("Gemini"))
+    assert router.complete("hello").text
+    threads = set(router._pool._threads)
+    ref = weakref.ref(router)
+
+    del router
+    gc.collect()
+    assert ref() is None
+    _wait_for(lambda: not any(thread.is_alive() for thread in threads))
@@ -0,0 +1,75 @@
+import json
+
+import metrics
+from metrics import Metrics, Trace, activate, current_trace, record_stage
+
+
+def _trace(provider="Groq", **stages):
+    trace = Trace("chat")
+    trace.provider = provider
+    for name, seconds in stages.items():
+        trace.add_stage(name, seconds)
+    return trace
+
+
+def test_repeated_stages_accumulate():
+    trace = _trace(generation=0.5)
+    trace.add_stage("generation", 0.25)
+    trace.add_tokens(prompt=10, completion=3)
+    trace.add_tokens(prompt=5)
+
+    assert trace.stages == {"generation": 0.75}
+    assert (trace.prompt_tokens, trace.completion_tokens) == (15, 3)
+
+
+def test_trace_is_finished_once(monkeypatch):
+    collected = Metrics(log_path=None)
+    monkeypatch.setattr(metrics, "_metrics", collected)
+    trace = _trace()
+
+    trace.finish("ok")
+    trace.finish("error")
+
+    assert trace.status == "ok"
+    assert 'connectsense_requests_total{mode="chat",provider="Groq",status="ok"} 1' in collected.render_prometheus()
+
+
+def test_record_stage_goes_to_the_active_trace_only():
+    trace = Trace("chat")
+    record_stage("vector", 0.1)
+    with activate(trace):
+        assert current_trace() is trace
+        record_stage("vector", 0.1)
+    record_stage("vector", 0.1)
+
+    assert current_trace() is None
+    assert trace.stages == {"vector": 0.1}
+
+
+def test_histograms_are_rendered_per_stage_and_provider():
+    collected = Metrics(log_path=None)
+    for seconds in (0.003, 0.2):
+        trace = _trace(vector=seconds)
+        trace.total = 1.0
+        trace.status = "ok"
+        collected.observe(trace)
+
+    text = collected.render_prometheus()
+    assert 'connectsense_stage_seconds_bucket{stage="vector",provider="Groq",le="0.005"} 1' in text
+    assert 'connectsense_stage_seconds_bucket{stage="vector",provider="Groq",le="0.25"} 2' in text
+    assert 'connectsense_stage_seconds_count{stage="total",provider="Groq"} 2' in text
+
+
+def test_traces_are_appended_to_the_log(tmp_path):
+    path = tmp_path / "logs" / "traces.jsonl"
+    collected = Metrics(log_path=str(path))
+    trace = _trace(provider=None, cache_lookup=0.002)
+    trace.cached = True
+    trace.total = 0.01
+    trace.status = "ok"
+    collected.observe(trace)
+
+    record = json.loads(path.read_text().splitlines()[0])
+    assert record["provider"] is None and record["cached"] is True
+    assert record["stages_ms"] == {"cache_lookup": 2.0}
+    assert 'provider="cache"' in collected.render_prometheus()
@@ -0,0 +1,30 @@
+import pytest
+
+from prompts import PREFIX_VERSIONS, classify_request, select_variant, system_prefix, tokens_saved
+
+
+@pytest.mark.parametrize("text", ["hi", "Hello!", "thanks a lot 🙏", "Namaste, ConnectSense", "who are you?", "नमस्ते"])
+def test_small_talk_is_a_greeting(text):
+    assert classify_request(text) == "greeting"
+
+
+@pytest.mark.parametrize("text", [
+    "hi, which backhaul suits the Nepal hills?",
+    "thanks, and what about solar power?",
+    "help me plan fiber for 40 schools",
+    "",
+])
+def test_questions_are_planning(text):
+    assert classify_request(text) == "planning"
+
+
+def test_variant_follows_classification_unless_compact_is_off():
+    assert select_variant("hello") == "compact"
+    assert select_variant("hello", compact=False) == "full"
+    assert select_variant("GPON or microwave?") == "full"
+
+
+def test_prefixes_are_stable_and_compact_is_smaller():
+    assert system_prefix("full").endswith("\n") and system_prefix("full") == system_prefix()
+    assert PREFIX_VERSIONS["full"] != PREFIX_VERSIONS["compact"]
+    assert tokens_saved("compact") > 0 and tokens_saved("full") == 0
@@ -0,0 +1,177 @@
+import threading
+import time
+
+import pytest
+
+from metrics import Trace
+from query_service import QueryService, QueueFullError, friendly_error, is_rate_limit
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def _service(**kwargs):
+    kwargs.setdefault("max_concurrency", 2)
+    kwargs.setdefault("max_queue", 4)
+    kwargs.setdefault("backoff", 0.001)
+    return QueryService(provider_limits={}, **kwargs)
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+# A token stream that is rate-limited before its first token `limited` times
+def _flaky_stream(limited, tokens=("a", "b", "c")):
+    calls = []
+
+    def stream_fn():
+        calls.append(1)
+        if len(calls) <= limited:
+            raise RateLimitError("429 Too Many Requests")
+        yield from tokens
+
+    return stream_fn, calls
+
+
+def test_rate_limit_errors_are_recognized():
+    assert is_rate_limit(RateLimitError())
+    assert is_rate_limit(RuntimeError("429 RESOURCE_EXHAUSTED"))
+    assert not is_rate_limit(RuntimeError("invalid api key"))
+    assert friendly_error(RuntimeError("boom")) == "Error: boom"
+    assert "try again" in friendly_error(QueueFullError())
+
+
+def test_retried_stream_finishes_trace_once_after_last_attempt():
+    service = _service()
+    trace = Trace("chat")
+    stream_fn, calls = _flaky_stream(limited=2)
+
+    assert list(service.stream(None, stream_fn, trace=trace)) == ["a", "b", "c"]
+    assert len(calls) == 3
+    assert trace.status == "ok"
+    assert list(trace.stages) == ["queue_wait"]
+    # Measured once, at the first dequeue, so it can't include the retries' backoff
+    assert trace.stages["queue_wait"] < trace.total
+
+
+def test_stream_failing_every_attempt_finishes_trace_as_error():
+    service = _service(max_retries=1)
+    trace = Trace("chat")
+    stream_fn, calls = _flaky_stream(limited=5)
+
+    with pytest.raises(RateLimitError):
+        list(service.stream(None, stream_fn, trace=trace))
+    assert len(calls) == 2
+    assert trace.status == "error"
+
+
+def test_error_after_first_token_finishes_trace_as_error():
+    service = _service()
+    trace = Trace("chat")
+
+    def stream_fn():
+        yield "a"
+        raise RuntimeError("connection reset")
+
+    tokens = service.stream(None, stream_fn, trace=trace)
+    assert next(tokens) == "a"
+    with pytest.raises(RuntimeError):
+        next(tokens)
+    assert trace.status == "error"
+
+
+def test_closed_stream_finishes_trace_as_interrupted():
+    service = _service()
+    trace = Trace("chat")
+    release = threading.Event()
+
+    def stream_fn():
+        yield "a"
+        release.wait(2)
+        yield "b"
+
+    tokens = service.stream(None, stream_fn, trace=trace)
+    assert next(tokens) == "a"
+    tokens.close()
+    release.set()
+    _wait_for(lambda: trace.status is not None)
+    assert trace.status == "interrupted"
+
+
+def test_submitted_trace_is_final_when_result_is_read():
+    service = _service()
+    trace = Trace("chat")
+
+    assert service.submit(None, lambda: 42, trace=trace).result(timeout=2) == 42
+    assert trace.status == "ok"
+    assert trace.total is not None
+
+
+def test_full_queue_rejects_new_queries():
+    service = _service(max_concurrency=1, max_queue=1)
+    release = threading.Event()
+
+    running = service.submit(None, lambda: release.wait(2))
+    _wait_for(lambda: service.stats()["in_flight"] == 1)
+    queued = service.submit(None, lambda: "queued")
+    with pytest.raises(QueueFullError):
+        service.submit(None, lambda: "rejected")
+    assert service.stats()["rejected"] == 1
+
+    release.set()
+    assert running.result(timeout=2) is True
+    assert queued.result(timeout=2) == "queued"
+    assert service.stats()["queued"] == service.stats()["in_flight"] == 0
+
+
+def test_rate_limited_query_is_retried():
+    service = _service()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) < 3:
+            raise RateLimitError("429 Too Many Requests")
+        return "answer"
+
+    assert service.submit(None, fn).result(timeout=2) == "answer"
+    assert len(calls) == 3
+    assert service.stats()["retries"] == 2
+
+
+def test_other_errors_are_not_retried():
+    service = _service()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        service.submit(None, fn).result(timeout=2)
+    assert len(calls) == 1
+
+
+def test_provider_limit_applies_below_query_concurrency():
+    service = QueryService(max_concurrency=4, max_queue=4, provider_limits={"Groq": 1})
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def fn():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+
+    futures = [service.submit("Groq", fn) for _ in range(3)]
+    for future in futures:
+        future.result(timeout=2)
+    assert max(peak) == 1
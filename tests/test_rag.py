@@ -0,0 +1,121 @@
+import types
+
+from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.schema import TextNode
+
+import rag
+from answer_cache import AnswerCache
+from config import HISTORY_MESSAGES, SYSTEM_PROMPT
+from rag import build_chat_engine, build_legacy_query, stream_answer, to_chat_messages
+
+STANDALONE = "Which backhaul suits hill districts in Nepal?"
+
+
+class RecordingEmbedding(MockEmbedding):
+    def _get_query_embedding(self, query):
+        EMBEDDED.append(query)
+        return super()._get_query_embedding(query)
+
+
+EMBEDDED = []
+
+
+# Condenses every follow-up to STANDALONE and answers with a fixed text
+class CondensingLLM(CustomLLM):
+    @property
+    def metadata(self):
+        return LLMMetadata()
+
+    @llm_completion_callback()
+    def complete(self, prompt, formatted=False, **kwargs):
+        return CompletionResponse(text=STANDALONE if "Follow Up" in prompt else "Microwave.")
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        def gen():
+            text = ""
+            for delta in ("Micro", "wave", "."):
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+        return gen()
+
+
+def _index():
+    nodes = [TextNode(text="Microwave backhaul suits ridgelines."), TextNode(text="GPON suits valley towns.")]
+    return VectorStoreIndex(nodes, embed_model=RecordingEmbedding(embed_dim=8))
+
+
+HISTORY = [
+    {"role": "user", "content": "We are planning connectivity for Nepal."},
+    {"role": "assistant", "content": "Which districts?"},
+]
+
+
+def test_chat_mode_embeds_only_the_condensed_question():
+    EMBEDDED.clear()
+    engine = build_chat_engine(_index(), llm=CondensingLLM())
+    response = engine.chat("And for the hills?", chat_history=to_chat_messages(HISTORY))
+
+    assert str(response) == "Microwave."
+    assert EMBEDDED == [STANDALONE]
+
+
+def test_history_is_capped_and_keeps_roles():
+    history = [{"role": "user" if n % 2 == 0 else "assistant", "content": str(n)} for n in range(HISTORY_MESSAGES + 4)]
+    messages = to_chat_messages(history)
+    assert len(messages) == HISTORY_MESSAGES
+    assert messages[-1].content == str(HISTORY_MESSAGES + 3)
+
+
+def test_legacy_query_puts_system_prompt_history_and_question_together():
+    query = build_legacy_query("And for the hills?", HISTORY)
+    assert query.startswith(SYSTEM_PROMPT)
+    assert "**User**: We are planning connectivity for Nepal." in query
+    assert query.endswith("### New Question:\nAnd for the hills?")
+
+
+def test_answer_is_streamed_token_by_token(monkeypatch):
+    monkeypatch.setattr(Settings, "_llm", CondensingLLM())
+    resources = types.SimpleNamespace(index=_index())
+
+    tokens = list(stream_answer(resources, "And for the hills?", HISTORY, mode="chat"))
+    assert tokens == ["Micro", "wave", "."]
+
+
+def test_repeated_standalone_question_is_served_from_the_cache(tmp_path, monkeypatch):
+    cache = AnswerCache(path=str(tmp_path / "answers.sqlite"))
+    monkeypatch.setattr(rag, "get_answer_cache", lambda: cache)
+    monkeypatch.setattr(Settings, "_llm", CondensingLLM())
+    monkeypatch.setattr(Settings, "_embed_model", MockEmbedding(embed_dim=8))
+    resources = types.SimpleNamespace(index=_index(), llm_scope="groq-model+gemini-model", signature="index-1")
+
+    assert "".join(stream_answer(resources, "Which backhaul?", [], mode="chat")) == "Microwave."
+    assert list(stream_answer(resources, "Which backhaul?", [], mode="chat")) == ["Microwave."]
+    assert cache.stats()["hits"] == 1
+
+
+class PromptRecordingLLM(CondensingLLM):
+    prompts: list = []
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        self.prompts.append(prompt)
+        return super().stream_complete(prompt, formatted, **kwargs)
+
+
+def test_sources_are_the_chunks_as_retrieved_not_the_compressed_copies(monkeypatch):
+    llm = PromptRecordingLLM()
+    monkeypatch.setattr(Settings, "_llm", llm)
+    monkeypatch.setattr(rag, "CONTEXT_COMPRESSION", True)
+    chunk = ("Microwave backhaul suits ridgelines. Towers need solar power. Batteries last two days. "
+             "Fences keep goats away from the cabinets.")
+    index = VectorStoreIndex([TextNode(text=chunk)], embed_model=MockEmbedding(embed_dim=8))
+    resources = types.SimpleNamespace(index=index)
+
+    answer, sources = rag.answer_with_sources(resources, "Which backhaul suits ridgelines?", mode="chat")
+    assert answer == "Microwave."
+    assert "Fences keep goats" not in llm.prompts[-1]
+    assert [source.node.get_content() for source in sources] == [chunk]
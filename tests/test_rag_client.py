@@ -0,0 +1,100 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import rag_server
+from query_service import QueueFullError, is_rate_limit
+from rag_client import RagClient, RagServiceError
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+# Answers /v1/answer with the lines of the question's script
+SCRIPTS = {
+    "ok": [{"token": "Micro"}, {"token": "wave."}, {"done": True, "trace": {"id": "t1"}, "sources": [{"source": "nepal.md"}]}],
+    "cut": [{"token": "Micro"}],
+    "failed": [{"token": "Micro"}, {"error": "provider down", "kind": "error"}],
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        question = request["question"]
+        if question in ("busy", "limited"):
+            kind = "queue_full" if question == "busy" else "rate_limit"
+            body = json.dumps({"error": question, "kind": kind}).encode()
+            self.send_response(503 if question == "busy" else 429)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_response(200)
+        self.end_headers()
+        for line in SCRIPTS[question]:
+            self.wfile.write(json.dumps(line).encode() + b"\n")
+
+
+@pytest.fixture(scope="module")
+def client():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield RagClient(f"http://127.0.0.1:{server.server_address[1]}", timeout=5)
+    server.shutdown()
+
+
+def test_answer_is_streamed_with_trace_and_sources(client):
+    result = {}
+    tokens = list(client.stream_answer("ok", history=[{"role": "user", "content": "hi"}], result=result))
+
+    assert tokens == ["Micro", "wave."]
+    assert result == {"trace": {"id": "t1"}, "sources": [{"source": "nepal.md"}]}
+
+
+def test_service_errors_are_raised_by_kind(client):
+    with pytest.raises(QueueFullError):
+        list(client.stream_answer("busy"))
+    with pytest.raises(RagServiceError) as limited:
+        list(client.stream_answer("limited"))
+    assert is_rate_limit(limited.value)
+    with pytest.raises(RagServiceError, match="provider down"):
+        list(client.stream_answer("failed"))
+
+
+def test_answer_cut_short_is_an_error(client):
+    tokens = client.stream_answer("cut")
+    assert next(tokens) == "Micro"
+    with pytest.raises(RagServiceError, match="closed the connection"):
+        next(tokens)
+
+
+def test_unreachable_service_is_an_error():
+    with pytest.raises(RagServiceError, match="unavailable"):
+        list(RagClient("http://127.0.0.1:1", timeout=1).stream_answer("ok"))
+
+
+def test_server_error_kinds():
+    assert rag_server._error_kind(QueueFullError("full")) == (503, "queue_full")
+    assert rag_server._error_kind(RateLimitError("429 Too Many Requests")) == (429, "rate_limit")
+    assert rag_server._error_kind(ValueError("bad")) == (500, "error")
+
+
+def test_service_mode_modules_import_without_llama_index():
+    code = (
+        "import sys, chat_store, conversation_memory, metrics, query_service, rag_client, warmup; "
+        "sys.exit('llama_index' in sys.modules)"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert subprocess.run([sys.executable, "-c", code], cwd=root).returncode == 0
@@ -0,0 +1,33 @@
+from llama_index.core.schema import TextNode
+
+from regions import document_tags, node_partitions, query_partitions, tag_node
+
+
+def test_question_naming_countries_searches_their_partitions():
+    assert query_partitions("Fiber in the Nepal hills or in Jaffna?") == [
+        "country-nepal", "country-sri_lanka", "country-none"
+    ]
+
+
+def test_question_naming_only_a_terrain_searches_terrain_partitions():
+    assert query_partitions("Solar power for atolls") == ["terrain-island", "terrain-none"]
+
+
+def test_general_question_searches_everything():
+    assert query_partitions("What is GPON?") is None
+
+
+def test_node_is_tagged_with_its_own_and_its_document_tags():
+    doc_tags = document_tags("Bhutan plans. Bhutan again. One mention of Nepal. Mountain sites, mountain passes.")
+    assert doc_tags == {"countries": ["bhutan"], "terrains": ["mountain"]}
+
+    node = tag_node(TextNode(text="Microwave links across the Thar desert."), doc_tags)
+    assert node.metadata["countries"] == "bhutan"
+    assert node.metadata["terrains"] == "arid,mountain"
+    assert "countries" in node.excluded_embed_metadata_keys and "terrains" in node.excluded_llm_metadata_keys
+    assert node_partitions(node.metadata) == ["country-bhutan", "terrain-arid", "terrain-mountain"]
+
+
+def test_untagged_node_goes_to_the_none_partitions():
+    node = tag_node(TextNode(text="GPON splitters and OLT sizing."))
+    assert node_partitions(node.metadata) == ["country-none", "terrain-none"]
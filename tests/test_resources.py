@@ -0,0 +1,148 @@
+import os
+import threading
+import types
+
+import pytest
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+
+import resources
+from llm_router import LLMRouter
+from stub_providers import StubLLM
+
+
+@pytest.fixture
+def loader(monkeypatch):
+    state = types.SimpleNamespace(loads=0, changed=False, error=None, hook=None)
+
+    def load():
+        if state.hook:
+            state.hook()
+        if state.error:
+            raise state.error
+        state.loads += 1
+        return types.SimpleNamespace(
+            warnings=[], number=state.loads, router=None, embed_model=MockEmbedding(embed_dim=state.loads)
+        )
+
+    monkeypatch.setattr(resources, "_resources", None)
+    monkeypatch.setattr(Settings, "_embed_model", None)
+    monkeypatch.setattr(resources, "_load_resources", load)
+    monkeypatch.setattr(resources, "_index_changed", lambda loaded: state.changed)
+    return state
+
+
+def _touch(path, content):
+    path.write_bytes(content)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_resources_are_loaded_once_and_shared(loader):
+    first = resources.get_resources()
+    assert resources.get_resources() is first
+    assert loader.loads == 1
+
+
+def test_changed_index_is_reloaded(loader):
+    first = resources.get_resources()
+    loader.changed = True
+
+    assert resources.get_resources() is not first
+    assert loader.loads == 2
+
+
+def test_sessions_are_served_while_the_index_reloads(loader):
+    first = resources.get_resources()
+    loader.changed = True
+    started = threading.Event()
+    release = threading.Event()
+    loader.hook = lambda: (started.set(), release.wait(2))
+
+    reload = threading.Thread(target=resources.get_resources)
+    reload.start()
+    assert started.wait(2)
+    # Served right away from the current resources, without starting a second reload
+    assert resources.get_resources() is first
+    release.set()
+    reload.join(2)
+    assert loader.loads == 2 and resources.get_resources() is not first
+
+
+def test_failed_reload_keeps_serving_previous_index(loader):
+    first = resources.get_resources()
+    loader.changed = True
+    loader.error = OSError("file is still being written")
+
+    assert resources.get_resources() is first
+    assert "Index reload failed" in first.warnings[-1]
+    assert Settings.embed_model is first.embed_model
+
+
+def test_settings_follow_the_resources_in_use(loader):
+    first = resources.get_resources()
+    assert Settings.embed_model is first.embed_model
+    loader.changed = True
+    started = threading.Event()
+    release = threading.Event()
+    loader.hook = lambda: (started.set(), release.wait(2))
+
+    reload = threading.Thread(target=resources.get_resources)
+    reload.start()
+    assert started.wait(2)
+    # Not switched while the new resources are still loading
+    assert Settings.embed_model is first.embed_model
+    release.set()
+    reload.join(2)
+    loader.changed = False
+    second = resources.get_resources()
+    assert second is not first and Settings.embed_model is second.embed_model
+
+
+def test_touched_file_with_same_contents_is_not_reloaded(tmp_path, monkeypatch):
+    monkeypatch.setattr(resources, "INDEX_CHECK_INTERVAL", 0)
+    path = tmp_path / "vectors.faiss"
+    path.write_bytes(b"v1")
+    monkeypatch.setattr(resources, "index_path", lambda: str(path))
+    loaded = types.SimpleNamespace(
+        path=str(path), signature=resources.index_signature(str(path), use_hash=True), checked_at=0
+    )
+    _touch(path, b"v1")
+
+    assert not resources._index_changed(loaded)
+    _touch(path, b"v2")
+    assert resources._index_changed(loaded)
+
+
+def test_switch_from_pickle_to_store_is_a_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(resources, "INDEX_CHECK_INTERVAL", 0)
+    pickle_path = tmp_path / "full_index.pkl"
+    pickle_path.write_bytes(b"pickle")
+    loaded = types.SimpleNamespace(
+        path=str(pickle_path), signature=resources.index_signature(str(pickle_path)), checked_at=0
+    )
+    monkeypatch.setattr(resources, "index_path", lambda: str(tmp_path / "store" / "vectors.faiss"))
+
+    assert resources._index_changed(loaded)
+
+
+def test_forced_reload_swaps_in_new_resources(loader):
+    first = resources.get_resources()
+
+    second = resources.reload_resources()
+    assert second is not first and resources.get_resources() is second
+    assert Settings.embed_model is second.embed_model
+
+    loader.error = OSError("index missing")
+    with pytest.raises(OSError):
+        resources.reload_resources()
+    assert resources.get_resources() is second
+
+
+def test_answer_cache_scope_does_not_follow_the_preferred_provider():
+    router = LLMRouter({"Groq": StubLLM(name="Groq"), "Gemini": StubLLM(name="Gemini")})
+    loaded = resources.SharedResources(None, None, router, None, "index", None, [])
+    assert (loaded.primary_llm, loaded.llm_scope) == ("Groq", "stub-Groq+stub-Gemini")
+
+    router._stats["Groq"].record_failure()
+    assert (loaded.primary_llm, loaded.llm_scope) == ("Gemini", "stub-Groq+stub-Gemini")
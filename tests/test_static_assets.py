@@ -0,0 +1,71 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+import static_assets
+
+
+@pytest.fixture
+def logo(tmp_path, monkeypatch):
+    path = tmp_path / "logo.jpg"
+    Image.new("RGB", (400, 200), "navy").save(path, format="JPEG")
+    monkeypatch.setattr(static_assets, "LOGO_PATH", str(path))
+    monkeypatch.setattr(static_assets, "STATIC_DIR", str(tmp_path / "static"))
+    monkeypatch.setattr(static_assets, "_built", False)
+    static_assets._data_uri.cache_clear()
+    yield path
+    static_assets._data_uri.cache_clear()
+
+
+def _inline_width(attrs):
+    uri = attrs.split('src="', 1)[1].split('"', 1)[0]
+    assert uri.startswith("data:image/jpeg;base64,")
+    with Image.open(io.BytesIO(base64.b64decode(uri.split(",", 1)[1]))) as img:
+        return img.width
+
+
+def test_logo_is_resized_once_per_width_without_upscaling(logo, tmp_path, monkeypatch):
+    monkeypatch.setattr(static_assets, "LOGO_WIDTHS", (100, 300))
+
+    assert static_assets.build_static_assets() == [100, 200, 300, 600]
+    with Image.open(tmp_path / "static" / "logo-600.jpg") as img:
+        assert img.size == (400, 200)
+    assert static_assets.build_static_assets() == []
+
+
+def test_static_urls_when_static_serving_is_on(logo, tmp_path, monkeypatch):
+    monkeypatch.setattr(static_assets, "STATIC_SERVING", True)
+
+    assert static_assets.logo_img_attrs(100) == (
+        'src="app/static/logo-100.jpg" srcset="app/static/logo-200.jpg 2x" width="100"'
+    )
+    assert (tmp_path / "static" / "logo-200.jpg").exists()
+
+
+def test_data_uri_when_static_serving_is_off(logo, monkeypatch):
+    monkeypatch.setattr(static_assets, "STATIC_SERVING", False)
+
+    assert _inline_width(static_assets.logo_img_attrs(180)) == 180
+
+
+def test_unwritable_static_dir_falls_back_to_data_uri(logo, tmp_path, monkeypatch):
+    # A directory can't be created below a regular file
+    (tmp_path / "file").write_text("")
+    monkeypatch.setattr(static_assets, "STATIC_DIR", str(tmp_path / "file" / "static"))
+    monkeypatch.setattr(static_assets, "STATIC_SERVING", True)
+
+    assert _inline_width(static_assets.logo_img_attrs(180)) == 180
+
+
+def test_missing_logo_gives_no_attrs(logo, tmp_path, monkeypatch):
+    monkeypatch.setattr(static_assets, "LOGO_PATH", str(tmp_path / "missing.jpg"))
+
+    assert static_assets.logo_img_attrs(100) is None
+
+
+def test_minify_css_drops_comments_and_whitespace():
+    css = "/* header */\n.title {\n  color : red;\n  margin: 0 auto;\n}\n\ndiv > p { font-size: 12px; }\n"
+
+    assert static_assets.minify_css(css) == ".title{color:red;margin:0 auto}div>p{font-size:12px}"
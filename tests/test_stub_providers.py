@@ -0,0 +1,29 @@
+import numpy as np
+
+from stub_providers import StubEmbedding, StubLLM
+
+
+def test_embedding_is_deterministic_and_normalized():
+    embedding = StubEmbedding(dim=64, latency=0)
+    first = embedding.get_text_embedding("Microwave backhaul in the hills")
+
+    assert first == StubEmbedding(dim=64, latency=0).get_text_embedding("Microwave backhaul in the hills")
+    assert np.isclose(np.linalg.norm(first), 1.0)
+
+
+def test_texts_sharing_words_are_closer():
+    embedding = StubEmbedding(dim=256, latency=0)
+    query = np.array(embedding.get_query_embedding("microwave backhaul cost"))
+    near = np.array(embedding.get_text_embedding("the cost of microwave backhaul links"))
+    far = np.array(embedding.get_text_embedding("satellite terminals for schools"))
+
+    assert query @ near > query @ far
+
+
+def test_stream_adds_up_to_the_completion():
+    llm = StubLLM(latency=0, token_latency=0, answer_tokens=6)
+    prompt = "Which backhaul suits mountain villages?"
+    deltas = [response.delta for response in llm.stream_complete(prompt)]
+
+    assert len(deltas) == 6
+    assert "".join(deltas) == llm.complete(prompt).text
@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+import resources
+import warmup
+
+
+@pytest.fixture(autouse=True)
+def fresh_warmup(monkeypatch):
+    monkeypatch.setattr(warmup, "_thread", None)
+    monkeypatch.setattr(warmup, "_done", threading.Event())
+    monkeypatch.setattr(warmup, "_state", {"import_seconds": None, "load_seconds": None, "error": None})
+
+
+def test_wait_returns_the_shared_resources_loaded_in_the_background(monkeypatch):
+    loaded = object()
+    calls = []
+    monkeypatch.setattr(resources, "get_resources", lambda: calls.append(1) or loaded)
+
+    assert warmup.wait() is loaded
+    status = warmup.status()
+    assert status["ready"] and status["error"] is None
+    assert status["import_seconds"] is not None and status["load_seconds"] is not None
+
+
+def test_warm_up_is_started_once(monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+
+    def get_resources():
+        started.set()
+        release.wait(2)
+
+    monkeypatch.setattr(resources, "get_resources", get_resources)
+    warmup.start()
+    thread = warmup._thread
+    warmup.start()
+    assert warmup._thread is thread
+    assert started.wait(2) and not warmup.ready()
+
+    release.set()
+    thread.join(2)
+    assert warmup.ready()
+
+
+def test_failed_warm_up_surfaces_in_the_waiting_thread(monkeypatch):
+    def get_resources():
+        raise RuntimeError("index missing")
+
+    monkeypatch.setattr(resources, "get_resources", get_resources)
+
+    with pytest.raises(RuntimeError, match="index missing"):
+        warmup.wait()
+    assert warmup.status()["error"] == "index missing"
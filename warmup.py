@@ -0,0 +1,62 @@
+import threading
+import time
+
+# Background warm-up of the heavy parts of the app: llama-index, FAISS and the provider
+# SDKs are imported, and the index and provider clients loaded, on a daemon thread, so
+# the first page (the README) renders without waiting for them. Only the standard
+# library is imported here; the timings of both phases are kept for reporting.
+_lock = threading.Lock()
+_thread = None
+_done = threading.Event()
+_state = {"import_seconds": None, "load_seconds": None, "error": None}
+
+
+def _warm_up():
+    try:
+        start = time.perf_counter()
+        import rag  # noqa: F401
+        import resources
+        from metrics import get_metrics
+        imported = time.perf_counter()
+        _state["import_seconds"] = imported - start
+
+        get_metrics()
+        resources.get_resources()
+        _state["load_seconds"] = time.perf_counter() - imported
+        print(f"Warm-up: imports {_state['import_seconds']:.2f}s, index and clients {_state['load_seconds']:.2f}s")
+    except Exception as e:
+        _state["error"] = e
+    finally:
+        _done.set()
+
+
+# Start the warm-up once per process; later calls do nothing
+def start():
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_warm_up, name="warm-up", daemon=True)
+            _thread.start()
+
+
+def ready():
+    return _done.is_set()
+
+
+# Block until the warm-up has finished (starting it if needed) and return the shared
+# resources. A failed warm-up is retried in the calling thread so the error surfaces.
+def wait():
+    start()
+    _done.wait()
+    import resources
+
+    return resources.get_resources()
+
+
+def status():
+    return {
+        "ready": ready(),
+        "import_seconds": _state["import_seconds"],
+        "load_seconds": _state["load_seconds"],
+        "error": str(_state["error"]) if _state["error"] else None,
+    }